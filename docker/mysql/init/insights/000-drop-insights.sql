@@ -1,4 +1,7 @@
 -- Drop all insightsdb tables safely
 SET FOREIGN_KEY_CHECKS = 0;
 DROP TABLE IF EXISTS insightsdb.chat_logs;
+DROP TABLE IF EXISTS insightsdb.chat_log_snapshots;
+DROP TABLE IF EXISTS insightsdb.chat_summaries;
+DROP TABLE IF EXISTS insightsdb.job_state;
 SET FOREIGN_KEY_CHECKS = 1;
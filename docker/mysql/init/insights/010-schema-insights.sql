@@ -7,5 +7,27 @@ CREATE TABLE IF NOT EXISTS insightsdb.chat_logs (
   user_query TEXT,
   ai_response TEXT,
   context_snapshot JSON,
-  timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+  timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  INDEX idx_chat_logs_user_id (user_id, id)
+);
+
+-- Archived context snapshots (COMPRESS()ed JSON), moved out of chat_logs once old
+CREATE TABLE IF NOT EXISTS insightsdb.chat_log_snapshots (
+  log_id BIGINT PRIMARY KEY,
+  snapshot MEDIUMBLOB
+);
+
+-- Rolling summary of chat turns that no longer fit the prompt verbatim
+CREATE TABLE IF NOT EXISTS insightsdb.chat_summaries (
+  user_id BIGINT PRIMARY KEY,
+  summary TEXT,
+  last_log_id BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- Watermarks for background jobs (dashboard precompute, ...)
+CREATE TABLE IF NOT EXISTS insightsdb.job_state (
+  name VARCHAR(64) PRIMARY KEY,
+  value VARCHAR(255),
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
 );
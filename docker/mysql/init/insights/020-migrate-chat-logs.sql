@@ -0,0 +1,36 @@
+-- Upgrades an existing insightsdb in place (no-op on a fresh one):
+--   mysql -h mysql-insights -uroot -p < docker/mysql/init/insights/020-migrate-chat-logs.sql
+USE insightsdb;
+
+-- (user_id, id) index for fetch_chat_history / keyset pagination on /history
+SET @has_index = (
+  SELECT COUNT(*) FROM information_schema.statistics
+  WHERE table_schema = 'insightsdb' AND table_name = 'chat_logs' AND index_name = 'idx_chat_logs_user_id'
+);
+SET @ddl = IF(@has_index = 0,
+  'ALTER TABLE chat_logs ADD INDEX idx_chat_logs_user_id (user_id, id), ALGORITHM=INPLACE, LOCK=NONE',
+  'DO 0'
+);
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+CREATE TABLE IF NOT EXISTS chat_log_snapshots (
+  log_id BIGINT PRIMARY KEY,
+  snapshot MEDIUMBLOB
+);
+
+-- Rolling summary of chat turns that no longer fit the prompt verbatim
+CREATE TABLE IF NOT EXISTS chat_summaries (
+  user_id BIGINT PRIMARY KEY,
+  summary TEXT,
+  last_log_id BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- Watermarks for background jobs (dashboard precompute, recurring detection)
+CREATE TABLE IF NOT EXISTS job_state (
+  name VARCHAR(64) PRIMARY KEY,
+  value VARCHAR(255),
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
@@ -0,0 +1,311 @@
+import json
+import asyncio
+import logging
+import hashlib
+import redis.asyncio as redis
+from redis.exceptions import WatchError
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Any, Optional, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def to_cents(amount) -> int:
+    """DECIMAL(14,2) -> exact integer cents"""
+    try:
+        return int((Decimal(str(amount)) * 100).to_integral_value())
+    except Exception:
+        return 0
+
+
+def to_day(occurred_at) -> str:
+    if isinstance(occurred_at, datetime):
+        return occurred_at.date().isoformat()
+    if isinstance(occurred_at, date):
+        return occurred_at.isoformat()
+    return str(occurred_at)[:10]
+
+
+def tx_record(row: Dict) -> Dict[str, Any]:
+    """Compact per-transaction contribution, kept so updates/deletes can be undone exactly"""
+    return {
+        "type": row.get("type"),
+        "cents": abs(to_cents(row.get("amount"))),
+        "category_id": row.get("category_id"),
+        "category": row.get("category_name") or "Uncategorized",
+        "merchant": row.get("merchant_name") or "Unknown Merchant",
+        "day": to_day(row.get("occurred_at")),
+    }
+
+
+def counter_fields(record: Dict) -> List[str]:
+    day = record["day"]
+    fields = [f"{day}|type|{record['type']}"]
+    if record["type"] != "TRANSFER":
+        fields.append(f"{day}|cat|{record['type']}:{record['category']}")
+        fields.append(f"{day}|merchant|{record['type']}:{record['merchant']}")
+    return fields
+
+
+def summarize_counters(fields: Dict[str, Any], days: int, cutoff: str) -> Dict[str, Any]:
+    """Folds "{day}|{dim}|{value}|sum/count" counters from `cutoff` (a day) on into the summary shape"""
+    totals = {"INCOME": [0, 0], "EXPENSE": [0, 0], "TRANSFER": [0, 0]}
+    categories: Dict[str, Dict[str, Dict[str, int]]] = {}
+    merchants: Dict[str, Dict[str, Dict[str, int]]] = {}
+    daily: Dict[str, Dict[str, int]] = {}
+
+    for field, value in fields.items():
+        head, kind = field.rsplit("|", 1)
+        day, dim, name = head.split("|", 2)
+        if day < cutoff:
+            continue
+        value = int(value)
+        idx = 0 if kind == "sum" else 1
+        if dim == "type":
+            totals.setdefault(name, [0, 0])[idx] += value
+            daily.setdefault(day, {}).setdefault(name, 0)
+            if kind == "sum":
+                daily[day][name] += value
+        else:
+            tx_type, label = name.split(":", 1)
+            bucket = categories if dim == "cat" else merchants
+            entry = bucket.setdefault(tx_type, {}).setdefault(label, {"cents": 0, "count": 0})
+            entry["cents" if kind == "sum" else "count"] += value
+
+    def money(cents: int) -> float:
+        return cents / 100
+
+    def ranked(bucket: Dict[str, Dict[str, int]]) -> List[Dict[str, Any]]:
+        rows = [{"name": k, "total": money(v["cents"]), "count": v["count"]} for k, v in bucket.items() if v["count"]]
+        return sorted(rows, key=lambda r: r["total"], reverse=True)
+
+    income, expenses = totals["INCOME"][0], totals["EXPENSE"][0]
+    return {
+        "days": days,
+        "income": money(income),
+        "expenses": money(expenses),
+        "net": money(income - expenses),
+        "count": sum(t[1] for t in totals.values()),
+        "income_count": totals["INCOME"][1],
+        "expense_count": totals["EXPENSE"][1],
+        "expense_categories": ranked(categories.get("EXPENSE", {})),
+        "income_categories": ranked(categories.get("INCOME", {})),
+        "expense_merchants": ranked(merchants.get("EXPENSE", {})),
+        "daily": {d: {t: money(c) for t, c in v.items()} for d, v in sorted(daily.items())},
+    }
+
+
+def summary_from_rows(rows: List[Dict], days: int = 30) -> Dict[str, Any]:
+    """
+    The AggregateStore.summary() of a user computed straight from their transaction rows,
+    for bulk paths that already hold the rows and should not make a Redis round trip per user.
+    """
+    counters: Dict[str, int] = {}
+    for row in rows:
+        record = tx_record(row)
+        for field in counter_fields(record):
+            counters[f"{field}|sum"] = counters.get(f"{field}|sum", 0) + record["cents"]
+            counters[f"{field}|count"] = counters.get(f"{field}|count", 0) + 1
+    return summarize_counters(counters, days, (date.today() - timedelta(days=days - 1)).isoformat())
+
+
+class AggregateStore:
+    """
+    Incrementally maintained per-user financial aggregates in Redis.
+
+    agg:{uid}      hash of "{day}|{dim}|{value}|sum" / "|count" counters,
+                   dim is one of type, cat, merchant (sums are integer cents)
+    agg:{uid}:tx   hash of transaction id -> contribution record
+    agg:{uid}:ready marker set once the user has been built from SQL
+
+    Counters are updated from transaction_events deltas (apply_change) and can be
+    rebuilt from financedb.transactions in one bulk pass.
+    """
+
+    def __init__(self, redis_url: str, db_manager, window_days: int = 30, retention_days: int = 90,
+                 max_retries: int = 20):
+        self.redis = redis.from_url(redis_url, decode_responses=True)
+        self.db = db_manager
+        self.window_days = window_days
+        self.retention_days = retention_days
+        self.max_retries = max_retries
+
+        self.events_applied = 0
+        self.conflicts = 0
+        self.rebuilds = 0
+        logger.info(f"Aggregate store initialized (window={window_days}d, retention={retention_days}d)")
+
+    def _key(self, user_id: int) -> str:
+        return f"agg:{user_id}"
+
+    def _apply(self, pipe, user_id: int, record: Dict, sign: int):
+        key = self._key(user_id)
+        for field in counter_fields(record):
+            pipe.hincrby(key, f"{field}|sum", sign * record["cents"])
+            pipe.hincrby(key, f"{field}|count", sign)
+
+    def _cutoff(self, days: int) -> str:
+        return (date.today() - timedelta(days=days - 1)).isoformat()
+
+    # ---------- Event path ----------
+
+    async def apply_change(self, user_id: int, transaction_id: int, new_row: Optional[Dict]) -> Tuple[Optional[Dict], Optional[Dict]]:
+        """
+        Replaces the contribution of one transaction: subtracts the stored record
+        (if any) and adds the new row (None for deletes). Returns (old, new) records.
+
+        The stored record is read under WATCH and the swap runs in MULTI, so concurrent
+        events for the same transaction (other consumers, other workers) are applied one
+        after the other: a conflicting write aborts the transaction and it is retried
+        against the record that write left.
+        """
+        tx_key = f"{self._key(user_id)}:tx"
+        new = tx_record(new_row) if new_row else None
+        if new and new["day"] < self._cutoff(self.retention_days):
+            new = None
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for _ in range(self.max_retries):
+                try:
+                    await pipe.watch(tx_key)
+                    raw_old = await pipe.hget(tx_key, str(transaction_id))
+                    old = json.loads(raw_old) if raw_old else None
+                    if old == new:
+                        await pipe.unwatch()
+                        return old, new
+
+                    pipe.multi()
+                    if old:
+                        self._apply(pipe, user_id, old, -1)
+                        pipe.hdel(tx_key, str(transaction_id))
+                    if new:
+                        self._apply(pipe, user_id, new, +1)
+                        pipe.hset(tx_key, str(transaction_id), json.dumps(new))
+                    await pipe.execute()
+                except WatchError:
+                    self.conflicts += 1
+                    continue
+
+                self.events_applied += 1
+                return old, new
+
+        raise RuntimeError(f"Aggregates for user {user_id} kept changing; transaction {transaction_id} not applied")
+
+    # ---------- Rebuild path ----------
+
+    async def _write_user(self, user_id: int, records: Dict[int, Dict]):
+        key = self._key(user_id)
+        counters: Dict[str, int] = {}
+        for record in records.values():
+            for field in counter_fields(record):
+                counters[f"{field}|sum"] = counters.get(f"{field}|sum", 0) + record["cents"]
+                counters[f"{field}|count"] = counters.get(f"{field}|count", 0) + 1
+
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.delete(key, f"{key}:tx")
+        if counters:
+            pipe.hset(key, mapping=counters)
+        if records:
+            pipe.hset(f"{key}:tx", mapping={str(tx_id): json.dumps(r) for tx_id, r in records.items()})
+        pipe.set(f"{key}:ready", datetime.now().isoformat())
+        await pipe.execute()
+
+    def _stream_rebuild(self, loop, user_id: Optional[int]) -> int:
+        """Runs in a DB worker thread; hands each completed user back to the event loop"""
+        users = 0
+        current_user, records = None, {}
+        for row in self.db.iter_transactions(self.retention_days, user_id=user_id):
+            if row["user_id"] != current_user:
+                if current_user is not None:
+                    asyncio.run_coroutine_threadsafe(self._write_user(current_user, records), loop).result()
+                    users += 1
+                current_user, records = row["user_id"], {}
+            records[row["id"]] = tx_record(row)
+
+        if current_user is not None:
+            asyncio.run_coroutine_threadsafe(self._write_user(current_user, records), loop).result()
+            users += 1
+        elif user_id is not None:
+            # User without recent transactions: still authoritative (all zeros)
+            asyncio.run_coroutine_threadsafe(self._write_user(user_id, {}), loop).result()
+            users += 1
+        return users
+
+    async def rebuild(self, user_id: Optional[int] = None) -> int:
+        """
+        Rebuilds one user, or every user when user_id is None, in a single streamed query.
+        """
+        loop = asyncio.get_running_loop()
+        users = await self.db.run(self._stream_rebuild, loop, user_id)
+        self.rebuilds += 1
+        logger.info(f"Aggregates rebuilt for {users} user(s)")
+        return users
+
+    async def is_ready(self, user_id: int) -> bool:
+        return bool(await self.redis.exists(f"{self._key(user_id)}:ready"))
+
+    async def invalidate(self, user_id: int):
+        key = self._key(user_id)
+        await self.redis.delete(key, f"{key}:tx", f"{key}:ready")
+
+    # ---------- Read path ----------
+
+    async def summary(self, user_id: int, days: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Exact totals for the last `days` days, independent of transaction volume.
+        Builds the user from SQL on first access. Returns None if Redis is unavailable.
+        """
+        days = days or self.window_days
+        try:
+            if not await self.is_ready(user_id):
+                await self.rebuild(user_id)
+            fields = await self.redis.hgetall(self._key(user_id))
+        except Exception as e:
+            logger.warning(f"Aggregate read failed for user {user_id}: {e}")
+            return None
+
+        retention_cutoff = self._cutoff(self.retention_days)
+        expired = [field for field in fields if field.split("|", 1)[0] < retention_cutoff]
+        if expired:
+            await self.redis.hdel(self._key(user_id), *expired)
+            for field in expired:
+                del fields[field]
+        return summarize_counters(fields, days, self._cutoff(days))
+
+    @staticmethod
+    def fingerprint(summary: Optional[Dict]) -> str:
+        """Short stable hash of a user's aggregates; changes whenever their data does"""
+        payload = json.dumps(summary or {}, sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+    def stats(self) -> Dict:
+        return {"events_applied": self.events_applied, "conflicts": self.conflicts, "rebuilds": self.rebuilds}
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+if __name__ == "__main__":
+    # One bulk pass over financedb.transactions: python aggregates.py
+    import os
+    from dotenv import load_dotenv
+    from database import DatabaseManager
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    async def main():
+        db = DatabaseManager()
+        store = AggregateStore(
+            os.getenv("REDIS_URL", "redis://redis:6379/0"),
+            db,
+            retention_days=int(os.getenv("AGGREGATE_RETENTION_DAYS", 90))
+        )
+        try:
+            await store.rebuild()
+        finally:
+            await store.close()
+            db.close()
+
+    asyncio.run(main())
@@ -0,0 +1,176 @@
+import logging
+import numpy as np
+from datetime import date
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_DAY = 86400
+
+
+class TransactionFrame:
+    """
+    Columnar view of one user's transactions.
+
+    Rows are loaded once into NumPy arrays (int64 epoch seconds, float64 amounts,
+    integer category/merchant codes) so every metric below is a vectorized pass.
+    """
+
+    def __init__(self, rows: List[Dict], days: int = 30, today: Optional[date] = None):
+        self.days = days
+        self.today = np.datetime64(today or date.today(), 'D').astype(np.int64)
+        self.start_day = self.today - days + 1
+
+        n = len(rows)
+        self.ts = np.array([r['occurred_at'] for r in rows], dtype='datetime64[s]').astype(np.int64) if n else np.empty(0, np.int64)
+        self.amount = np.abs(np.array([float(r.get('amount') or 0) for r in rows], dtype=np.float64))
+        types = np.array([r.get('type') or '' for r in rows], dtype=object)
+        self.is_expense = types == 'EXPENSE'
+        self.is_income = types == 'INCOME'
+
+        self.categories, self.category_code = np.unique(
+            np.array([r.get('category_name') or 'Uncategorized' for r in rows], dtype=object), return_inverse=True
+        ) if n else (np.empty(0, object), np.empty(0, np.int64))
+        self.merchants, self.merchant_code = np.unique(
+            np.array([r.get('merchant_name') or 'Unknown Merchant' for r in rows], dtype=object), return_inverse=True
+        ) if n else (np.empty(0, object), np.empty(0, np.int64))
+        self.descriptions = [r.get('description') or '' for r in rows]
+
+        self.day = self.ts // SECONDS_PER_DAY
+        in_window = (self.day >= self.start_day) & (self.day <= self.today)
+        self.in_window = in_window
+
+    def __len__(self):
+        return len(self.amount)
+
+    def category_spend(self) -> List[Dict[str, Any]]:
+        mask = self.is_expense & self.in_window
+        totals = np.bincount(self.category_code[mask], weights=self.amount[mask], minlength=len(self.categories))
+        counts = np.bincount(self.category_code[mask], minlength=len(self.categories))
+        order = np.argsort(-totals)
+        return [
+            {"name": str(self.categories[i]), "total": float(totals[i]), "count": int(counts[i])}
+            for i in order if counts[i]
+        ]
+
+    def daily_spend(self, exclude: Optional[np.ndarray] = None) -> np.ndarray:
+        """Expense per calendar day of the window, oldest first (zeros for quiet days)"""
+        mask = self.is_expense & self.in_window
+        if exclude is not None:
+            mask &= ~exclude
+        idx = (self.day[mask] - self.start_day).astype(np.int64)
+        return np.bincount(idx, weights=self.amount[mask], minlength=self.days)[:self.days]
+
+    def moving_average(self, window: int = 7) -> np.ndarray:
+        daily = self.daily_spend()
+        if len(daily) < window:
+            return daily.copy()
+        kernel = np.ones(window) / window
+        return np.convolve(daily, kernel, mode='valid')
+
+    def anomaly_scores(self) -> np.ndarray:
+        """
+        Robust z-score of each expense against its category (median / MAD).
+        Non-expense rows score 0.
+        """
+        scores = np.zeros(len(self), dtype=np.float64)
+        mask = self.is_expense & self.in_window
+        if not mask.any():
+            return scores
+
+        codes = self.category_code[mask]
+        amounts = self.amount[mask]
+        order = np.lexsort((amounts, codes))
+        sorted_codes, sorted_amounts = codes[order], amounts[order]
+        bounds = np.flatnonzero(np.diff(sorted_codes)) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [len(sorted_codes)]))
+
+        medians = np.empty(len(self.categories))
+        mads = np.empty(len(self.categories))
+        for s, e in zip(starts, ends):
+            group = sorted_amounts[s:e]
+            med = np.median(group)
+            medians[sorted_codes[s]] = med
+            mads[sorted_codes[s]] = np.median(np.abs(group - med))
+
+        med = medians[codes]
+        # Fall back to a share of the median when the category has no spread
+        scale = 1.4826 * mads[codes]
+        scale = np.where(scale > 0, scale, np.maximum(med * 0.5, 1.0))
+        scores[mask] = (amounts - med) / scale
+        return scores
+
+    def anomalies(self, threshold: float = 3.5, limit: int = 3) -> List[Dict[str, Any]]:
+        scores = self.anomaly_scores()
+        idx = np.flatnonzero(scores >= threshold)
+        idx = idx[np.argsort(-scores[idx])][:limit]
+        return [
+            {
+                "description": self.descriptions[i],
+                "category": str(self.categories[self.category_code[i]]),
+                "merchant": str(self.merchants[self.merchant_code[i]]),
+                "amount": float(self.amount[i]),
+                "score": round(float(scores[i]), 2),
+            }
+            for i in idx
+        ]
+
+    def forecast_next_week(self, threshold: float = 3.5) -> Dict[str, Any]:
+        """
+        Next-7-day spend: exponentially weighted daily burn blended with the
+        linear trend of the window. Confidence shrinks as daily spend gets noisier.
+        One-off anomalies are left out so a single large purchase does not repeat.
+        """
+        daily = self.daily_spend(exclude=self.anomaly_scores() >= threshold)
+        if not daily.any():
+            return {"amount": 0, "confidence": 50, "label": "Expected spending next week"}
+
+        alpha = 2 / (7 + 1)
+        weights = (1 - alpha) ** np.arange(len(daily))[::-1]
+        ewma = float(np.dot(daily, weights) / weights.sum())
+
+        x = np.arange(len(daily), dtype=np.float64)
+        slope, intercept = np.polyfit(x, daily, 1)
+        future = np.arange(len(daily), len(daily) + 7, dtype=np.float64)
+        trend = float(np.clip(slope * future + intercept, 0, None).mean())
+
+        per_day = 0.7 * ewma + 0.3 * trend
+        cv = float(daily.std() / daily.mean()) if daily.mean() > 0 else 1.0
+        confidence = int(np.clip(95 - cv * 20, 40, 95))
+
+        return {
+            "amount": int(round(per_day * 7)),
+            "confidence": confidence,
+            "label": "Expected spending next week"
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        daily = self.daily_spend()
+        moving = self.moving_average(7)
+        return {
+            "days": self.days,
+            "total_expense": float(daily.sum()),
+            "total_income": float(self.amount[self.is_income & self.in_window].sum()),
+            "daily_burn": float(daily.mean()) if len(daily) else 0.0,
+            "burn_last_7": float(daily[-7:].mean()) if len(daily) else 0.0,
+            "moving_average_7": float(moving[-1]) if len(moving) else 0.0,
+            "active_days": int(np.count_nonzero(daily)),
+            "category_spend": self.category_spend(),
+            "anomalies": self.anomalies(),
+            "forecast": self.forecast_next_week(),
+        }
+
+
+def analyze(rows: List[Dict], days: int = 30) -> Dict[str, Any]:
+    return TransactionFrame(rows, days=days).summary()
+
+
+def dashboard_analytics(rows: List[Dict], upcoming_bills: Optional[List[Dict]] = None, days: int = 30) -> Dict[str, Any]:
+    """
+    What every dashboard path (request, precompute worker, batch) gives the model: analyze()
+    plus the recurring payments recurring.py found due soon, so it does not guess them.
+    """
+    analytics = analyze(rows, days=days)
+    analytics['upcoming_bills'] = list(upcoming_bills or [])
+    return analytics
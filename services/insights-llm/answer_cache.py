@@ -0,0 +1,168 @@
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict, Counter
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+# Words that can differ between two phrasings of the same question
+_FILLER = {
+    "a", "an", "the", "i", "me", "my", "we", "our", "you", "your", "is", "are", "was", "were", "be",
+    "do", "does", "did", "how", "what", "whats", "s", "can", "could", "please", "tell",
+    "show", "in", "on", "at", "for", "of", "to", "from", "so", "far", "about", "up",
+}
+
+
+def normalize_query(query: str) -> str:
+    """'How much did I spend this month??' -> 'how much did i spend this month'"""
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", query.lower())).strip()
+
+
+def content_tokens(normalized: str) -> frozenset:
+    """
+    Every word that carries meaning (categories, merchants, numbers, periods): these must
+    match exactly for a near-duplicate hit, however close the spelling
+    """
+    return frozenset(t for t in normalized.split() if t not in _FILLER)
+
+
+def char_ngrams(text: str, n: int = 3) -> Counter:
+    padded = f"  {text} "
+    return Counter(padded[i:i + n] for i in range(len(padded) - n + 1))
+
+
+def ngram_similarity(a: Counter, b: Counter) -> float:
+    """Cosine similarity of character n-gram count vectors"""
+    if not a or not b:
+        return 0.0
+    dot = sum(count * b[gram] for gram, count in a.items() if gram in b)
+    norm_a = sum(c * c for c in a.values()) ** 0.5
+    norm_b = sum(c * c for c in b.values()) ** 0.5
+    return dot / (norm_a * norm_b)
+
+
+class AnswerCache:
+    """
+    In-process LRU/TTL cache of chat answers.
+
+    Entries are keyed by (user, context fingerprint, normalized query). The fingerprint
+    is derived from the user's aggregates, so any new transaction changes it and old
+    answers stop matching; they are dropped the first time the new fingerprint is seen.
+    Near-duplicate questions match through character trigram cosine similarity,
+    provided they use the same content words: "bus" and "bar" score alike but are
+    different questions.
+    """
+
+    def __init__(self, max_entries: int = 5000, ttl: int = 600, similarity: float = 0.9, max_candidates: int = 50):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.max_candidates = max_candidates
+
+        self._entries: "OrderedDict[Tuple[int, str, str], Dict[str, Any]]" = OrderedDict()
+        # user -> (fingerprint, {normalized query: ngrams}) for near-duplicate scans
+        self._by_user: Dict[int, Tuple[str, Dict[str, Counter]]] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _drop(self, key: Tuple[int, str, str]):
+        self._entries.pop(key, None)
+        user_id, fingerprint, normalized = key
+        indexed = self._by_user.get(user_id)
+        if indexed and indexed[0] == fingerprint:
+            indexed[1].pop(normalized, None)
+            if not indexed[1]:
+                del self._by_user[user_id]
+
+    def _sync_fingerprint(self, user_id: int, fingerprint: str):
+        indexed = self._by_user.get(user_id)
+        if indexed and indexed[0] != fingerprint:
+            # The user's data changed: every cached answer for them is stale
+            for normalized in list(indexed[1]):
+                self._entries.pop((user_id, indexed[0], normalized), None)
+            del self._by_user[user_id]
+            self.invalidations += 1
+
+    def _live(self, key) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if not entry:
+            return None
+        if entry["expires_at"] < time.monotonic():
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, user_id: int, query: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        normalized = normalize_query(query)
+        with self._lock:
+            self._sync_fingerprint(user_id, fingerprint)
+
+            entry = self._live((user_id, fingerprint, normalized))
+            if entry:
+                self.hits += 1
+                return entry["result"]
+
+            indexed = self._by_user.get(user_id)
+            if indexed and self.similarity < 1.0:
+                grams = char_ngrams(normalized)
+                content = content_tokens(normalized)
+                best, best_score = None, self.similarity
+                for candidate, candidate_grams in list(indexed[1].items())[-self.max_candidates:]:
+                    if content_tokens(candidate) != content:
+                        continue
+                    score = ngram_similarity(grams, candidate_grams)
+                    if score >= best_score:
+                        best, best_score = candidate, score
+                if best is not None:
+                    entry = self._live((user_id, fingerprint, best))
+                    if entry:
+                        self.near_hits += 1
+                        return entry["result"]
+
+            self.misses += 1
+            return None
+
+    def put(self, user_id: int, query: str, fingerprint: str, result: Dict[str, Any]):
+        normalized = normalize_query(query)
+        key = (user_id, fingerprint, normalized)
+        with self._lock:
+            self._sync_fingerprint(user_id, fingerprint)
+            self._entries[key] = {"result": result, "expires_at": time.monotonic() + self.ttl}
+            self._entries.move_to_end(key)
+            self._by_user.setdefault(user_id, (fingerprint, {}))[1][normalized] = char_ngrams(normalized)
+
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            indexed = self._by_user.pop(user_id, None)
+            if indexed:
+                for normalized in indexed[1]:
+                    self._entries.pop((user_id, indexed[0], normalized), None)
+                self.invalidations += 1
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": round((self.hits + self.near_hits) / lookups, 4) if lookups else 0.0,
+        }
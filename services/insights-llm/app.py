@@ -1,20 +1,59 @@
 import os
+import json
+import time
+import asyncio
 import logging
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from starlette.routing import Match
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 from pydantic import BaseModel
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 from datetime import datetime
 from rag_pipeline import RAGPipeline
+from llm_client import CircuitOpen, LLMError, RETRYABLE_STATUS
 from database import DatabaseManager
+from dashboard_cache import DashboardCache
+from events import EventConsumer
+from aggregates import AggregateStore
+from analytics import dashboard_analytics
+from answer_cache import AnswerCache
+from retrieval import RetrievalIndex
+from budgets import BudgetTracker
+from chat_log_writer import ChatLogWriter
+from dashboard_batch import DashboardBatch
+from intents import IntentRouter
+from context_prefetch import ContextPrefetcher
+import metrics
+from metrics import stage
 
 # Setup
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Insights LLM Service (Gemini)", version="1.0.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Per worker: create resources, start background jobs and warm up (in the background,
+    /ready turns 200 when done). On shutdown: report not-ready, let running Gemini
+    calls finish, flush chat logs, close everything.
+    """
+    global warmup_task
+    init_services()
+    start_background_services()
+    warmup_task = asyncio.create_task(warm_up())
+    yield
+    service_state["ready"] = False
+    service_state["draining"] = True
+    warmup_task.cancel()
+    await shutdown_services()
+
+
+app = FastAPI(title="Insights LLM Service (Gemini)", version="1.0.0", lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -25,21 +64,239 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize RAG Pipeline
-try:
-    api_key = os.getenv("GEMINI_API_KEY")
-    rag_pipeline = RAGPipeline(api_key=api_key)
-    db_manager = DatabaseManager()
-    logger.info("Services initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize services: {e}")
-    rag_pipeline = None
-    db_manager = None
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Labels everything recorded during the request with its route and collects its timing breakdown"""
+    endpoint = request.url.path
+    for route in app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            endpoint = route.path
+            break
+    metrics.current_endpoint.set(endpoint)
+    metrics.current_timings.set({})
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint,
+                                        method=request.method, status=status)
+
+
+# Created per worker process in init_services(); None until then (or when an optional part is unavailable)
+rag_pipeline: Optional[RAGPipeline] = None
+db_manager: Optional[DatabaseManager] = None
+dashboard_cache: Optional[DashboardCache] = None
+aggregate_store: Optional[AggregateStore] = None
+retrieval_index: Optional[RetrievalIndex] = None
+budget_tracker: Optional[BudgetTracker] = None
+chat_log_writer: Optional[ChatLogWriter] = None
+dashboard_batch: Optional[DashboardBatch] = None
+intent_router: Optional[IntentRouter] = None
+context_prefetch: Optional[ContextPrefetcher] = None
+reconcile_task = None
+archive_task = None
+metrics_task = None
+shared_metrics: Optional[metrics.SharedMetrics] = None
+warmup_task = None
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 8))
+BUDGET_RECONCILE_INTERVAL = int(os.getenv("BUDGET_RECONCILE_INTERVAL", 3600))
+CHAT_ARCHIVE_INTERVAL = int(os.getenv("CHAT_ARCHIVE_INTERVAL", 3600))
+CHAT_ARCHIVE_AFTER_DAYS = int(os.getenv("CHAT_ARCHIVE_AFTER_DAYS", 7))
+# Connections opened per pool before the worker reports ready
+DB_WARM_CONNECTIONS = int(os.getenv("DB_WARM_CONNECTIONS", 2))
+WARMUP_RETRY_DELAY = float(os.getenv("WARMUP_RETRY_DELAY", 2))
+# How long shutdown waits for Gemini calls that are still running
+LLM_DRAIN_TIMEOUT = float(os.getenv("LLM_DRAIN_TIMEOUT", 20))
+
+# What /ready reports for this worker
+service_state = {"ready": False, "draining": False, "degraded": []}
+
+answer_cache = AnswerCache(
+    max_entries=int(os.getenv("ANSWER_CACHE_SIZE", 5000)),
+    ttl=int(os.getenv("ANSWER_CACHE_TTL", 600)),
+    similarity=float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.9))
+)
+
+event_consumer = EventConsumer(os.getenv("RABBITMQ_URL", "amqp://rabbitmq:5672"))
+REFRESH_DASHBOARD_ON_EVENT = os.getenv("DASHBOARD_REFRESH_ON_EVENT", "1") == "1"
+UPCOMING_BILLS_DAYS = int(os.getenv("UPCOMING_BILLS_DAYS", 14))
+# Exchanges loaded per chat; the prompt assembler keeps what fits and summarizes the rest
+CHAT_HISTORY_LIMIT = int(os.getenv("CHAT_HISTORY_LIMIT", 12))
+
+
+# Fanout exchange telling every worker to drop what it keeps in memory about a user
+INVALIDATIONS_EXCHANGE = os.getenv("INVALIDATIONS_EXCHANGE", "insights_invalidations")
+
+
+def invalidate_local(user_id: int):
+    """This worker's in-memory state derived from the user's transactions"""
+    answer_cache.invalidate_user(user_id)
+    if intent_router:
+        intent_router.invalidate_user(user_id)
+    if context_prefetch:
+        context_prefetch.detach(user_id)
+
+
+async def on_transaction_event(event: Dict):
+    """
+    TRANSACTION_CREATED / UPDATED / DELETED: the user's cached dashboard and answers are now wrong.
+    The event reaches one worker; the in-memory caches of all of them are dropped by broadcast.
+    """
+    user_id = (event.get("data") or {}).get("user_id")
+    if not user_id:
+        return
+    user_id = int(user_id)
+    broadcast = {"type": "USER_DATA_CHANGED", "data": {"user_id": user_id}}
+    if not await event_consumer.broadcast(INVALIDATIONS_EXCHANGE, broadcast):
+        invalidate_local(user_id)
+    # Shared by all workers: dropped once, here
+    if context_prefetch:
+        await context_prefetch.invalidate(user_id)
+    if not dashboard_cache:
+        return
+    await dashboard_cache.invalidate(user_id)
+    if REFRESH_DASHBOARD_ON_EVENT and rag_pipeline and db_manager:
+        dashboard_cache.schedule_refresh(user_id, lambda: compute_dashboard(user_id))
+
+
+async def on_invalidation(event: Dict):
+    user_id = (event.get("data") or {}).get("user_id")
+    if user_id:
+        invalidate_local(int(user_id))
+
+
+async def load_summary(user_id: int) -> Optional[Dict]:
+    """Exact 30-day aggregates, or None to fall back to summing the transaction sample"""
+    if not aggregate_store:
+        return None
+    return await aggregate_store.summary(user_id)
+
+
+def context_fingerprint(summary: Optional[Dict], transactions: List[Dict]) -> str:
+    """Changes whenever the data behind the user's context does"""
+    return AggregateStore.fingerprint(summary if summary is not None else {"transactions": transactions})
+
+
+async def on_transaction_change(event: Dict):
+    """
+    Patches the incremental stores with the changed row. The published payloads are
+    partial (no merchant, no category on deletes), so the row is looked up once by id.
+    """
+    data = event.get("data") or {}
+    user_id, transaction_id = data.get("user_id"), data.get("id")
+    if not user_id or not transaction_id or not db_manager:
+        return
+    user_id, transaction_id = int(user_id), int(transaction_id)
+
+    row = None
+    if event.get("type") != "TRANSACTION_DELETED":
+        row = await db_manager.run(db_manager.fetch_transaction, transaction_id)
+
+    # Users not built yet are built from SQL on their first read
+    if aggregate_store and await aggregate_store.is_ready(user_id):
+        old, new = await aggregate_store.apply_change(user_id, transaction_id, row)
+        if budget_tracker:
+            await budget_tracker.apply_delta(user_id, old, new)
+    elif budget_tracker:
+        # No previous contribution to subtract: recount the user's budgets instead
+        await budget_tracker.reload(user_id)
+    if retrieval_index:
+        await asyncio.to_thread(retrieval_index.apply, user_id, transaction_id, row)
+
+
+async def load_conversation(user_id: int):
+    """Recent chat turns plus the stored rolling summary of older ones"""
+    history = await db_manager.run(db_manager.fetch_chat_history, user_id, limit=CHAT_HISTORY_LIMIT)
+    conversation = await db_manager.run(db_manager.fetch_chat_summary, user_id)
+    return history, conversation
+
+
+async def prefetch_chat_context(user_id: int) -> Dict:
+    """What a chat turn reads before retrieval, loaded ahead of the first message"""
+    transactions = await db_manager.run(db_manager.fetch_transactions, user_id)
+    history, conversation = await load_conversation(user_id)
+    summary = await load_summary(user_id)
+    return {
+        "transactions": transactions,
+        "history": history,
+        "conversation": conversation,
+        "fingerprint": context_fingerprint(summary, transactions),
+    }
+
+
+def warm_chat_context(user_id: int):
+    if context_prefetch and rag_pipeline and db_manager:
+        context_prefetch.warm(user_id)
+
+
+async def load_chat_data(user_id: int):
+    """
+    (transactions, summary, prefetched): the prefetched context is used only while it was
+    built from the same aggregates as the live summary.
+    """
+    with stage("aggregates"):
+        summary = await load_summary(user_id)
+    prefetched = None
+    if context_prefetch:
+        with stage("prefetch"):
+            prefetched = await context_prefetch.take(
+                user_id, lambda c: c['fingerprint'] == context_fingerprint(summary, c['transactions'])
+            )
+    if prefetched:
+        return prefetched['transactions'], summary, prefetched
+    transactions = await db_manager.run(db_manager.fetch_transactions, user_id)
+    return transactions, summary, None
+
+
+async def load_chat_history(user_id: int, prefetched: Optional[Dict]):
+    if prefetched and prefetched['history'] is not None:
+        return prefetched['history'], prefetched['conversation']
+    return await load_conversation(user_id)
+
+
+async def save_conversation_summary(user_id: int, update: Optional[Dict]):
+    if not update:
+        return
+    try:
+        await db_manager.run(db_manager.save_chat_summary, user_id, update['summary'], update['last_log_id'])
+    except Exception as e:
+        logger.warning(f"Failed to save chat summary: {e}")
+
+
+async def retrieve(user_id: int, query: str) -> List[Dict]:
+    if not retrieval_index:
+        return []
+    try:
+        return await asyncio.to_thread(retrieval_index.search, user_id, query, RETRIEVAL_TOP_K)
+    except Exception as e:
+        logger.warning(f"Retrieval failed for user {user_id}: {e}")
+        return []
+
+
+async def on_budget_event(event: Dict):
+    if budget_tracker:
+        await budget_tracker.handle_budget_event(event)
+
+
+# Stores first, so dashboard refreshes triggered below see the new data
+event_consumer.subscribe("transaction_events", on_transaction_change)
+event_consumer.subscribe("transaction_events", on_transaction_event)
+event_consumer.subscribe("budget_events", on_budget_event)
+event_consumer.subscribe_broadcast(INVALIDATIONS_EXCHANGE, on_invalidation)
 
 
 class ChatRequest(BaseModel):
     user_id: int
     message: str
+    # Adds a per-stage timing breakdown (ms) and token counts to the response metadata
+    include_timings: bool = False
 
 
 class ChatResponse(BaseModel):
@@ -48,13 +305,217 @@ class ChatResponse(BaseModel):
     metadata: Optional[Dict] = None
 
 
+async def run_chat_archive():
+    """Moves old context snapshots out of chat_logs (one worker at a time, via GET_LOCK)"""
+    while True:
+        await asyncio.sleep(CHAT_ARCHIVE_INTERVAL)
+        try:
+            await db_manager.run(db_manager.archive_chat_snapshots, CHAT_ARCHIVE_AFTER_DAYS)
+        except Exception as e:
+            logger.error(f"Chat snapshot archive failed: {e}")
+
+
+def _optional(name: str, factory):
+    """Caches, stores and indexes are optional: the service works (slower) without them"""
+    try:
+        return factory()
+    except Exception as e:
+        logger.error(f"Failed to initialize {name}: {e}")
+        service_state["degraded"].append(name)
+        return None
+
+
+def init_services():
+    """
+    Creates this worker's resources. The pipeline and the database manager are required:
+    if they cannot be created, startup fails instead of serving 503s.
+    """
+    global rag_pipeline, db_manager, dashboard_cache, aggregate_store, retrieval_index, budget_tracker, chat_log_writer
+    global dashboard_batch, intent_router, context_prefetch, shared_metrics
+    rag_pipeline = RAGPipeline(api_key=os.getenv("GEMINI_API_KEY"))
+    db_manager = DatabaseManager()
+
+    dashboard_cache = _optional("dashboard_cache", lambda: DashboardCache(
+        redis_url=REDIS_URL,
+        ttl=int(os.getenv("DASHBOARD_CACHE_TTL", 900)),
+        stale_ttl=int(os.getenv("DASHBOARD_CACHE_STALE_TTL", 3600))
+    ))
+    aggregate_store = _optional("aggregates", lambda: AggregateStore(
+        redis_url=REDIS_URL,
+        db_manager=db_manager,
+        window_days=30,
+        retention_days=int(os.getenv("AGGREGATE_RETENTION_DAYS", 90))
+    ))
+    retrieval_index = _optional("retrieval", lambda: RetrievalIndex(
+        db_manager,
+        index_dir=os.getenv("RETRIEVAL_INDEX_DIR", "data/retrieval"),
+        history_days=int(os.getenv("RETRIEVAL_HISTORY_DAYS", 3650))
+    ))
+    budget_tracker = _optional("budgets", lambda: BudgetTracker(redis_url=REDIS_URL, db_manager=db_manager))
+
+    # Chat logs are written behind the response, in batches
+    chat_log_writer = ChatLogWriter(
+        db_manager,
+        batch_size=int(os.getenv("CHAT_LOG_BATCH_SIZE", 100)),
+        flush_interval=float(os.getenv("CHAT_LOG_FLUSH_INTERVAL", 1.0)),
+        max_pending=int(os.getenv("CHAT_LOG_MAX_PENDING", 5000)),
+        spill_dir=os.getenv("CHAT_LOG_SPILL_DIR", "data/chat_log_spill")
+    )
+    db_manager.chat_log_overlay = chat_log_writer
+
+    dashboard_batch = DashboardBatch(
+        rag_pipeline, db_manager, dashboard_cache,
+        concurrency=int(os.getenv("DASHBOARD_BATCH_CONCURRENCY", 8)),
+        max_users=int(os.getenv("DASHBOARD_BATCH_MAX_USERS", 10000)),
+        bills_days=UPCOMING_BILLS_DAYS
+    )
+    # Simple factual questions are answered with one SQL aggregate instead of Gemini
+    if os.getenv("INTENT_FAST_PATH", "1") == "1":
+        intent_router = IntentRouter(
+            db_manager,
+            labels_ttl=int(os.getenv("INTENT_LABELS_TTL", 300)),
+            max_users=int(os.getenv("INTENT_LABELS_MAX_USERS", 10000))
+        )
+    # /dashboard and /history warm the chat context the next /chat will need
+    if os.getenv("CONTEXT_PREFETCH", "1") == "1":
+        context_prefetch = _optional("prefetch", lambda: ContextPrefetcher(
+            redis_url=REDIS_URL,
+            loader=prefetch_chat_context,
+            ttl=int(os.getenv("CONTEXT_PREFETCH_TTL", 60)),
+            max_inflight=int(os.getenv("CONTEXT_PREFETCH_MAX_INFLIGHT", 32))
+        ))
+    # Every worker's metrics, whichever worker a scrape lands on
+    shared_metrics = metrics.SharedMetrics(
+        directory=os.getenv("METRICS_DIR", "data/metrics"),
+        interval=float(os.getenv("METRICS_SNAPSHOT_INTERVAL", 5))
+    )
+    logger.info(f"Services initialized (pid {os.getpid()})")
+
+
+async def warm_up():
+    """
+    Opens database connections, Redis connections and the Gemini session before the worker
+    reports ready. Retries until the databases answer; Redis and Gemini are best effort.
+    """
+    while True:
+        try:
+            opened = await db_manager.run(db_manager.warm_up, DB_WARM_CONNECTIONS)
+            break
+        except Exception as e:
+            logger.warning(f"Database warm-up failed ({e}); retrying in {WARMUP_RETRY_DELAY}s")
+            await asyncio.sleep(WARMUP_RETRY_DELAY)
+
+    for name, store in (("dashboard_cache", dashboard_cache), ("aggregates", aggregate_store), ("budgets", budget_tracker),
+                        ("prefetch", context_prefetch)):
+        if store:
+            try:
+                await store.redis.ping()
+            except Exception as e:
+                logger.warning(f"Redis unreachable for {name}: {e}")
+    await rag_pipeline.llm.warm_up()
+
+    service_state["ready"] = True
+    logger.info(f"Worker {os.getpid()} ready (db connections: {opened})")
+
+
+def start_background_services():
+    global reconcile_task, archive_task, metrics_task
+    event_consumer.start()
+    chat_log_writer.start()
+    if budget_tracker and BUDGET_RECONCILE_INTERVAL > 0:
+        reconcile_task = asyncio.create_task(budget_tracker.run_reconciliation(BUDGET_RECONCILE_INTERVAL))
+    if CHAT_ARCHIVE_INTERVAL > 0:
+        archive_task = asyncio.create_task(run_chat_archive())
+    metrics_task = asyncio.create_task(shared_metrics.run(worker_stats))
+
+
+async def shutdown_services():
+    # No new events; background jobs stop
+    await event_consumer.stop()
+    for task in (reconcile_task, archive_task, metrics_task):
+        if task:
+            task.cancel()
+    if shared_metrics:
+        shared_metrics.remove()
+    # Coalesced and background Gemini calls outlive their requests: let them finish first
+    if rag_pipeline:
+        await rag_pipeline.llm.drain(LLM_DRAIN_TIMEOUT)
+    if budget_tracker:
+        await budget_tracker.close()
+    if dashboard_cache:
+        await dashboard_cache.close()
+    if aggregate_store:
+        await aggregate_store.close()
+    if context_prefetch:
+        await context_prefetch.close()
+    if rag_pipeline:
+        await rag_pipeline.close()
+    if chat_log_writer:
+        await chat_log_writer.close()
+    if db_manager:
+        db_manager.close()
+
+
+@app.get("/health")
+async def health():
+    """Liveness: the worker's event loop is responding"""
+    return {"status": "ok", "pid": os.getpid()}
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness: warmed up and not shutting down. 503 tells the load balancer to skip this worker"""
+    body = {
+        "ready": service_state["ready"] and not service_state["draining"],
+        "draining": service_state["draining"],
+        "degraded": service_state["degraded"],
+        "llm_circuit": rag_pipeline.llm.breaker.state if rag_pipeline else None,
+        "pid": os.getpid(),
+    }
+    return body if body["ready"] else JSONResponse(body, status_code=503)
+
+
+async def answer_from_sql(request: ChatRequest) -> Optional[Dict]:
+    """The intent router's answer, or None when the question needs the model"""
+    if not intent_router:
+        return None
+    with stage("intent"):
+        return await intent_router.answer(request.user_id, request.message)
+
+
+def sql_answer_metadata(result: Dict, include_timings: bool) -> Dict:
+    metadata = {
+        "timestamp": datetime.now().isoformat(),
+        "model": "sql",
+        "provider": "local",
+        "cached": False,
+        "intent": result['intent'],
+        "prompt": None
+    }
+    if include_timings:
+        metadata["timings"] = metrics.current_timings.get()
+    return metadata
+
+
 @app.post("/chat", response_model=ChatResponse)
-def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(request: ChatRequest):
     try:
         logger.info(f"Chat Request Received | User ID: {request.user_id}")
         if not rag_pipeline or not db_manager:
             raise HTTPException(status_code=503, detail="Service not initialized")
-        transactions = db_manager.fetch_transactions(request.user_id)
+
+        # 1. Questions answerable with one aggregate query skip the context load and Gemini
+        fast = await answer_from_sql(request)
+        if fast is not None:
+            if context_prefetch:
+                await context_prefetch.history_used(request.user_id)
+            await chat_log_writer.submit(
+                db_manager.chat_log_row(request.user_id, request.message, fast['answer'], fast['context_preview'])
+            )
+            return ChatResponse(response=fast['answer'], context_used=fast['transactions_count'],
+                                metadata=sql_answer_metadata(fast, request.include_timings))
+
+        transactions, summary, prefetched = await load_chat_data(request.user_id)
         tx_count = len(transactions) if transactions else 0
         logger.info(f"Database Query Result: Found {tx_count} transactions for User {request.user_id}")
         
@@ -62,36 +523,45 @@ def chat_endpoint(request: ChatRequest):
             logger.warning(f"User {request.user_id} has NO transactions. AI will likely say 'No Data'. Check if this is the Finance ID (FID) or Auth ID!")
 
         # 2. Fetch History
-        chat_history = db_manager.fetch_chat_history(request.user_id, limit=6)
-
-        # 3. Process with AI
-        result = rag_pipeline.process_query(
-            user_id=request.user_id,
-            query=request.message,
-            transactions=transactions,
-            history=chat_history
-        )
-        
-        # 4. Save chat log
-        try:
-            db_manager.save_chat_log(
+        chat_history, conversation = await load_chat_history(request.user_id, prefetched)
+
+        # 3. Process with AI (unless this question was just answered on the same data)
+        fingerprint = context_fingerprint(summary, transactions)
+        with stage("answer_cache"):
+            result = answer_cache.get(request.user_id, request.message, fingerprint)
+        cached = result is not None
+        if not cached:
+            with stage("retrieval"):
+                retrieved = await retrieve(request.user_id, request.message)
+            result = await rag_pipeline.process_query(
                 user_id=request.user_id,
                 query=request.message,
-                response=result['answer'],
-                context=result['context_preview']
+                transactions=transactions,
+                history=chat_history,
+                summary=summary,
+                retrieved=retrieved,
+                conversation=conversation
             )
-        except Exception as e:
-            logger.warning(f"Failed to save chat log: {e}")
-
-        return ChatResponse(
-            response=result['answer'],
-            context_used=tx_count,
-            metadata={
-                "timestamp": datetime.now().isoformat(),
-                "model": "gemini-1.5-flash",
-                "provider": "Google"
-            }
-        )
+            if result['context_used']:
+                answer_cache.put(request.user_id, request.message, fingerprint, result)
+                await save_conversation_summary(request.user_id, result['summary_update'])
+        
+        # 4. Queue the chat log (written in the background)
+        with stage("chat_log_queue"):
+            await chat_log_writer.submit(
+                db_manager.chat_log_row(request.user_id, request.message, result['answer'], result['context_preview'])
+            )
+
+        metadata = {
+            "timestamp": datetime.now().isoformat(),
+            "model": "gemini-1.5-flash",
+            "provider": "Google",
+            "cached": cached,
+            "prompt": None if cached else result.get('prompt')
+        }
+        if request.include_timings:
+            metadata["timings"] = metrics.current_timings.get()
+        return ChatResponse(response=result['answer'], context_used=tx_count, metadata=metadata)
         
     except HTTPException:
         raise
@@ -99,38 +569,275 @@ def chat_endpoint(request: ChatRequest):
         logger.error(f"Unexpected error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+def sse_event(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Same as /chat but forwards Gemini tokens as server-sent events.
+    Events: 'token' ({"text": ...}), then 'done' or 'error'.
+    """
+    logger.info(f"Chat Stream Request Received | User ID: {request.user_id}")
+    if not rag_pipeline or not db_manager:
+        raise HTTPException(status_code=503, detail="Service not initialized")
+
+    fast = await answer_from_sql(request)
+    if fast is not None:
+        if context_prefetch:
+            await context_prefetch.history_used(request.user_id)
+        await chat_log_writer.submit(
+            db_manager.chat_log_row(request.user_id, request.message, fast['answer'], fast['context_preview'])
+        )
+        metadata = sql_answer_metadata(fast, request.include_timings)
+
+        async def single_answer():
+            yield sse_event("token", {"text": fast['answer']})
+            yield sse_event("done", {"context_used": fast['transactions_count'], "metadata": metadata})
+
+        return StreamingResponse(
+            single_answer(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    transactions, summary, prefetched = await load_chat_data(request.user_id)
+    tx_count = len(transactions) if transactions else 0
+
+    fingerprint = context_fingerprint(summary, transactions)
+    with stage("answer_cache"):
+        cached_result = answer_cache.get(request.user_id, request.message, fingerprint)
+    assembly = None
+    if cached_result is None:
+        chat_history, conversation = await load_chat_history(request.user_id, prefetched)
+        with stage("retrieval"):
+            retrieved = await retrieve(request.user_id, request.message)
+        payload, context, assembly = rag_pipeline.prepare_chat(
+            request.message, transactions, chat_history, summary, retrieved, conversation
+        )
+    else:
+        context = rag_pipeline.build_context(transactions, summary)
+
+    # The generator runs after the middleware has returned; keep feeding the same breakdown
+    timings = metrics.current_timings.get()
+
+    async def event_stream():
+        metrics.current_timings.set(timings)
+        chunks = []
+        degraded = False
+        if cached_result is not None:
+            # A cached answer goes out as a single token event
+            chunks.append(cached_result['answer'])
+            yield sse_event("token", {"text": cached_result['answer']})
+        else:
+            try:
+                async for text in rag_pipeline.stream_query(request.user_id, payload):
+                    chunks.append(text)
+                    yield sse_event("token", {"text": text})
+            except (CircuitOpen, LLMError) as e:
+                if chunks or (isinstance(e, LLMError) and e.status_code not in RETRYABLE_STATUS):
+                    logger.error(f"Chat stream failed for user {request.user_id}: {e}")
+                    yield sse_event("error", {"detail": str(e)})
+                    return
+                # Gemini unavailable: answer from local data, uncached so the next question retries
+                degraded = True
+                chunks = [rag_pipeline.fallback_answer(transactions, summary)]
+                yield sse_event("token", {"text": chunks[0]})
+            except Exception as e:
+                logger.error(f"Chat stream failed for user {request.user_id}: {e}")
+                yield sse_event("error", {"detail": str(e)})
+                return
+
+        answer = "".join(chunks) or "No text generated."
+        if cached_result is None and chunks and not degraded:
+            answer_cache.put(request.user_id, request.message, fingerprint, {
+                'answer': answer,
+                'transactions_count': tx_count,
+                'context_used': True,
+                'context_preview': context[:200],
+                'prompt': assembly['metrics'],
+                'summary_update': assembly['summary_update']
+            })
+            await save_conversation_summary(request.user_id, assembly['summary_update'])
+        await chat_log_writer.submit(db_manager.chat_log_row(request.user_id, request.message, answer, context[:200]))
+
+        metadata = {
+            "timestamp": datetime.now().isoformat(),
+            "model": "gemini-1.5-flash",
+            "provider": "Google",
+            "cached": cached_result is not None,
+            "prompt": assembly['metrics'] if assembly else None
+        }
+        if request.include_timings:
+            metadata["timings"] = timings
+        yield sse_event("done", {"context_used": tx_count, "metadata": metadata})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/history/{user_id}")
-def get_chat_history_endpoint(user_id: int):
+async def get_chat_history_endpoint(user_id: int, limit: int = Query(50, ge=1, le=200), before: Optional[int] = None):
+    """
+    Newest page by default; pass the returned next_cursor as ?before= for older pages.
+    """
     try:
         if not db_manager:
             raise HTTPException(status_code=503, detail="Database not initialized")
-        history = db_manager.fetch_chat_history(user_id, limit=50)
-        return {"history": history}
+        if before is None:
+            # The analytics page opens with this call; a chat message usually follows
+            warm_chat_context(user_id)
+        page = await db_manager.run(db_manager.fetch_chat_page, user_id, limit=limit, before_id=before)
+        if page is None:
+            raise HTTPException(status_code=503, detail="Chat history unavailable")
+        return page
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching history: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/history/{user_id}/{log_id}/context")
+async def get_chat_context_endpoint(user_id: int, log_id: int):
+    if not db_manager:
+        raise HTTPException(status_code=503, detail="Database not initialized")
+    result = await db_manager.run(db_manager.fetch_chat_snapshot, user_id, log_id)
+    if result is None:
+        raise HTTPException(status_code=503, detail="Chat history unavailable")
+    if result['snapshot'] is None:
+        raise HTTPException(status_code=404, detail="Chat log not found")
+    return result['snapshot']
     
+async def load_analytics(user_id: int, days: int = 30) -> Dict:
+    rows = await db_manager.run(db_manager.fetch_transaction_window, user_id, days=days)
+    bills = await db_manager.run(db_manager.fetch_upcoming_bills, user_id, UPCOMING_BILLS_DAYS)
+    return dashboard_analytics(rows, bills, days=days)
+
+
+async def compute_dashboard(user_id: int) -> Optional[Dict]:
+    transactions = await db_manager.run(db_manager.fetch_transactions, user_id, days=30)
+    logger.info(f"Generating dashboard for User {user_id}. Found {len(transactions)} transactions.")
+    summary = await load_summary(user_id)
+    analytics = await load_analytics(user_id)
+    return await rag_pipeline.generate_dashboard_insights(transactions, summary, analytics, user_id=user_id)
+
+
 @app.get("/dashboard/{user_id}")
-def get_dashboard_data(user_id: int):
+async def get_dashboard_data(user_id: int):
     try:
         if not rag_pipeline or not db_manager:
             raise HTTPException(status_code=503, detail="Service not initialized")
+        warm_chat_context(user_id)
 
-        transactions = db_manager.fetch_transactions(user_id, days=30)
-        logger.info(f"Dashboard request for User {user_id}. Found {len(transactions)} transactions.")
-
-        dashboard_data = rag_pipeline.generate_dashboard_insights(transactions)
+        if dashboard_cache:
+            dashboard_data = await dashboard_cache.get_or_compute(user_id, lambda: compute_dashboard(user_id))
+        else:
+            dashboard_data = await compute_dashboard(user_id)
         
         if not dashboard_data:
+            # The forecast is computed locally, so it survives an LLM failure
+            analytics = await load_analytics(user_id)
             return {
                 "initial_message": "Welcome back! I'm ready to analyze your finances.",
                 "summary_cards": [],
                 "smart_insights": [],
-                "prediction": None
+                "prediction": analytics['forecast']
             }
             
         return dashboard_data
 
     except Exception as e:
         logger.error(f"Dashboard Error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+class DashboardBatchRequest(BaseModel):
+    user_ids: List[int]
+    use_cache: bool = True
+    # False: deterministic summary and forecast only, no Gemini calls
+    generate: bool = True
+
+
+@app.post("/dashboard/batch")
+async def dashboard_batch_endpoint(request: DashboardBatchRequest):
+    """
+    Dashboards for many users as NDJSON, one line per user in completion order:
+    {"user_id", "source": "cache" | "generated" | "summary", "dashboard"} or {"user_id", "error"}.
+    """
+    if not dashboard_batch:
+        raise HTTPException(status_code=503, detail="Service not initialized")
+    if len(set(request.user_ids)) > dashboard_batch.max_users:
+        raise HTTPException(status_code=400, detail=f"At most {dashboard_batch.max_users} users per batch")
+
+    async def lines():
+        async for result in dashboard_batch.run(request.user_ids, use_cache=request.use_cache, generate=request.generate):
+            yield json.dumps(result, default=str) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/budgets/{user_id}/status")
+async def get_budget_status(user_id: int):
+    try:
+        if not budget_tracker:
+            raise HTTPException(status_code=503, detail="Budget tracker not initialized")
+        return {"budgets": await budget_tracker.status(user_id)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Budget status error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def worker_stats() -> Dict[str, Optional[Dict]]:
+    """This worker's component stats"""
+    return {
+        "dashboard": dashboard_cache.stats() if dashboard_cache else None,
+        "aggregates": aggregate_store.stats() if aggregate_store else None,
+        "answers": answer_cache.stats(),
+        "retrieval": retrieval_index.stats() if retrieval_index else None,
+        "budgets": budget_tracker.stats() if budget_tracker else None,
+        "chat_logs": chat_log_writer.stats() if chat_log_writer else None,
+        "dashboard_batch": dashboard_batch.stats() if dashboard_batch else None,
+        "intents": intent_router.stats() if intent_router else None,
+        "prefetch": context_prefetch.stats() if context_prefetch else None,
+        "prompt": rag_pipeline.assembler.stats() if rag_pipeline else None,
+        "llm": rag_pipeline.stats() if rag_pipeline else None,
+        "events": event_consumer.stats(),
+        "pool": db_manager.pool_stats() if db_manager else None,
+    }
+
+
+def all_workers() -> Dict[str, Dict]:
+    if not shared_metrics:
+        raise HTTPException(status_code=503, detail="Service not initialized")
+    return shared_metrics.collect(worker_stats())
+
+
+@app.get("/stats/pool")
+def get_pool_stats():
+    """Per worker pid: each worker has its own pools"""
+    if not db_manager:
+        raise HTTPException(status_code=503, detail="Database not initialized")
+    return {"workers": {worker: data["stats"].get("pool") for worker, data in all_workers().items()}}
+
+
+@app.get("/stats/cache")
+def get_cache_stats():
+    """Per worker pid: each worker has its own in-memory caches and counters"""
+    stats = {}
+    for worker, data in all_workers().items():
+        stats[worker] = {name: value for name, value in data["stats"].items() if name != "pool"}
+    return {"workers": stats}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Prometheus scrape endpoint: latency histograms, token counters and the component stats as
+    gauges, for every worker (label `worker`), so any worker can answer the scrape
+    """
+    return PlainTextResponse(metrics.render(all_workers()), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,251 @@
+"""
+Load generator for insights-llm: drives /chat, /dashboard and /history at a fixed
+concurrency and writes throughput and p50/p95/p99 latency per endpoint as JSON.
+
+    # 1. data:   python bench/seed.py --users 1000 --tx-per-user 300
+    # 2. Gemini: uvicorn fake_gemini:app --port 8200    (FAKE_GEMINI_LATENCY / _ERROR_RATE ...)
+    # 3. app:    GEMINI_BASE_URL=http://localhost:8200/v1beta uvicorn app:app --port 8105
+    # 4. load:
+    python bench/load.py --url http://localhost:8105 --users 100000-100999 \\
+        --concurrency 32 --duration 60 --mix chat=2,dashboard=1,history=3 --output bench/results/$(git rev-parse --short HEAD).json
+    # compare two runs
+    python bench/load.py --compare bench/results/abc123.json bench/results/def456.json
+
+Requests are picked at random by --mix weight for a random user in --users, so runs
+with the same --seed send the same sequence.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import httpx
+
+QUESTIONS = [
+    "How much did I spend on groceries this month?",
+    "Where can I cut back?",
+    "Am I on track with my budget?",
+    "What was my biggest expense last week?",
+    "How does my dining spending compare to last month?",
+    "Can I afford a 5,000,000 VND purchase?",
+]
+
+
+def percentile(ordered: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    rank = max(1, int(round(p / 100.0 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(latencies: List[float], errors: int, statuses: Dict[str, int], seconds: float) -> Dict:
+    ordered = sorted(latencies)
+    ms = lambda v: round(v * 1000, 2) if v is not None else None
+    return {
+        "requests": len(ordered) + errors,
+        "errors": errors,
+        "statuses": statuses,
+        "throughput_rps": round(len(ordered) / seconds, 2) if seconds else 0.0,
+        "mean_ms": ms(sum(ordered) / len(ordered)) if ordered else None,
+        "p50_ms": ms(percentile(ordered, 50)),
+        "p95_ms": ms(percentile(ordered, 95)),
+        "p99_ms": ms(percentile(ordered, 99)),
+        "max_ms": ms(ordered[-1]) if ordered else None,
+    }
+
+
+def parse_users(spec: str) -> List[int]:
+    """'100000-100999' or '1,2,3'"""
+    if "-" in spec:
+        first, last = spec.split("-", 1)
+        return list(range(int(first), int(last) + 1))
+    return [int(u) for u in spec.split(",") if u.strip()]
+
+
+def parse_mix(spec: str) -> List[Tuple[str, float]]:
+    mix = []
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        mix.append((name.strip(), float(weight or 1)))
+    return mix
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=5, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+class LoadGenerator:
+    def __init__(self, url: str, users: List[int], mix: List[Tuple[str, float]], concurrency: int,
+                 timeout: float, seed: int, history_limit: int = 50):
+        self.url = url.rstrip("/")
+        self.users = users
+        self.endpoints = [name for name, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        self.history_limit = history_limit
+        self.latencies: Dict[str, List[float]] = {name: [] for name in self.endpoints}
+        self.errors: Dict[str, int] = {name: 0 for name in self.endpoints}
+        self.statuses: Dict[str, Dict[str, int]] = {name: {} for name in self.endpoints}
+
+    def _request(self) -> Tuple[str, str, str, Optional[Dict]]:
+        endpoint = self.rng.choices(self.endpoints, self.weights)[0]
+        user_id = self.rng.choice(self.users)
+        if endpoint == "chat":
+            return endpoint, "POST", "/chat", {"user_id": user_id, "message": self.rng.choice(QUESTIONS)}
+        if endpoint == "chat_stream":
+            return endpoint, "POST", "/chat/stream", {"user_id": user_id, "message": self.rng.choice(QUESTIONS)}
+        if endpoint == "dashboard":
+            return endpoint, "GET", f"/dashboard/{user_id}", None
+        if endpoint == "history":
+            return endpoint, "GET", f"/history/{user_id}?limit={self.history_limit}", None
+        if endpoint == "budgets":
+            return endpoint, "GET", f"/budgets/{user_id}/status", None
+        raise ValueError(f"Unknown endpoint in --mix: {endpoint}")
+
+    async def _worker(self, client: httpx.AsyncClient, deadline: float, remaining: List[int], record: bool):
+        while time.monotonic() < deadline and (remaining[0] is None or remaining[0] > 0):
+            if remaining[0] is not None:
+                remaining[0] -= 1
+            endpoint, method, path, body = self._request()
+            started = time.perf_counter()
+            status = "error"
+            try:
+                # Streams are timed to the last byte, like the non-streaming answer
+                async with client.stream(method, path, json=body) as response:
+                    await response.aread()
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - started
+            if not record:
+                continue
+            self.statuses[endpoint][status] = self.statuses[endpoint].get(status, 0) + 1
+            if status.startswith("2"):
+                self.latencies[endpoint].append(elapsed)
+            else:
+                self.errors[endpoint] += 1
+
+    async def _phase(self, client: httpx.AsyncClient, seconds: float, requests: Optional[int], record: bool) -> float:
+        started = time.monotonic()
+        remaining = [requests]
+        await asyncio.gather(*(
+            self._worker(client, started + seconds, remaining, record) for _ in range(self.concurrency)
+        ))
+        return time.monotonic() - started
+
+    async def run(self, duration: float, requests: Optional[int], warmup: float) -> Dict:
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(base_url=self.url, timeout=self.timeout, limits=limits) as client:
+            if warmup > 0:
+                await self._phase(client, warmup, None, record=False)
+            seconds = await self._phase(client, duration if requests is None else float("inf"), requests, record=True)
+            server_stats = await self._server_stats(client)
+
+        all_latencies = [v for values in self.latencies.values() for v in values]
+        all_statuses: Dict[str, int] = {}
+        for statuses in self.statuses.values():
+            for status, count in statuses.items():
+                all_statuses[status] = all_statuses.get(status, 0) + count
+        return {
+            "seconds": round(seconds, 2),
+            "overall": summarize(all_latencies, sum(self.errors.values()), all_statuses, seconds),
+            "endpoints": {
+                name: summarize(self.latencies[name], self.errors[name], self.statuses[name], seconds)
+                for name in self.endpoints
+            },
+            "server": server_stats,
+        }
+
+    async def _server_stats(self, client: httpx.AsyncClient) -> Optional[Dict]:
+        """Cache/pool/LLM counters at the end of the run, if the service exposes them"""
+        try:
+            response = await client.get("/stats/cache")
+            return response.json() if response.status_code == 200 else None
+        except httpx.HTTPError:
+            return None
+
+
+def compare(baseline_path: str, candidate_path: str):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(candidate_path) as f:
+        candidate = json.load(f)
+
+    def delta(old, new):
+        if old in (None, 0) or new is None:
+            return "n/a"
+        return f"{(new - old) / old * 100:+.1f}%"
+
+    print(f"{'endpoint':<14}{'metric':<16}{'baseline':>12}{'candidate':>12}{'change':>10}")
+    names = ["overall"] + sorted(set(baseline["endpoints"]) | set(candidate["endpoints"]))
+    for name in names:
+        old = baseline["overall"] if name == "overall" else baseline["endpoints"].get(name, {})
+        new = candidate["overall"] if name == "overall" else candidate["endpoints"].get(name, {})
+        for metric in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "errors"):
+            print(f"{name:<14}{metric:<16}{str(old.get(metric)):>12}{str(new.get(metric)):>12}"
+                  f"{delta(old.get(metric), new.get(metric)):>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="insights-llm load generator")
+    parser.add_argument("--url", default="http://localhost:8105")
+    parser.add_argument("--users", default="100000-100099", help="user id range 'first-last' or a list '1,2,3'")
+    parser.add_argument("--mix", default="chat=2,dashboard=1,history=3",
+                        help="endpoint weights: chat, chat_stream, dashboard, history, budgets")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to measure")
+    parser.add_argument("--requests", type=int, help="stop after this many requests instead of --duration")
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds of unrecorded load first")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--label", help="free-form note stored with the results")
+    parser.add_argument("--output", help="write the results JSON here (default: stdout)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"), help="diff two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    generator = LoadGenerator(args.url, parse_users(args.users), parse_mix(args.mix), args.concurrency,
+                              args.timeout, args.seed)
+    started_at = datetime.now().isoformat(timespec="seconds")
+    results = asyncio.run(generator.run(args.duration, args.requests, args.warmup))
+    report = {
+        "commit": git_commit(),
+        "label": args.label,
+        "started_at": started_at,
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        **results,
+    }
+
+    summary = report["overall"]
+    print(
+        f"{summary['requests']} requests in {report['seconds']}s: {summary['throughput_rps']} req/s, "
+        f"p50 {summary['p50_ms']}ms, p95 {summary['p95_ms']}ms, p99 {summary['p99_ms']}ms, {summary['errors']} errors",
+        file=sys.stderr
+    )
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""
+Seeds financedb and insightsdb with synthetic users for benchmarking.
+
+Each user gets the shape of 020-seed-finance.sql (accounts, categories, monthly
+budgets, a wage, monthly bills, everyday spending across merchants) scaled to
+`--tx-per-user` transactions over `--days`, plus `--chat-logs` chat turns.
+
+    # against the docker-compose databases, from services/insights-llm
+    DB_HOST=127.0.0.1 DB_PORT=3308 INSIGHTS_DB_HOST=127.0.0.1 INSIGHTS_DB_PORT=3309 \\
+        python bench/seed.py --users 1000 --tx-per-user 300          # 300k transactions
+    python bench/seed.py --users 10000 --tx-per-user 500 --reset     # 5M transactions
+
+Bench users get ids from --first-user-id (default 100000) up, so the demo user is
+never touched; --reset deletes that id range first. Same --seed, same data.
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+import mysql.connector
+
+logger = logging.getLogger(__name__)
+
+EXPENSE_CATEGORIES = {
+    # name: (icon, typical amount VND, share of everyday spending)
+    "Groceries": ("cart", 250_000, 0.30),
+    "Dining": ("utensils", 120_000, 0.25),
+    "Transport": ("car", 60_000, 0.20),
+    "Entertainment": ("film", 200_000, 0.10),
+    "Shopping": ("bag", 450_000, 0.10),
+    "Health": ("heart", 300_000, 0.05),
+    "Utilities": ("bolt", 0, 0.0),
+    "Loan Payments": ("bank", 0, 0.0),
+}
+INCOME_CATEGORIES = {"Wages": "briefcase", "Other Income": "gift"}
+
+MERCHANTS = {
+    "Groceries": ["ABC Supermarket", "Co.opmart", "WinMart", "Bach Hoa Xanh", "Lotte Mart"],
+    "Dining": ["Pho 24", "Highlands Coffee", "The Coffee House", "KFC", "Com Tam Ba Ghien"],
+    "Transport": ["Grab", "Be", "Petrolimex", "Xanh SM"],
+    "Entertainment": ["Popcorn World", "CGV Cinemas", "Netflix", "Spotify"],
+    "Shopping": ["Shopee", "Lazada", "Tiki", "Uniqlo"],
+    "Health": ["Pharmacity", "Long Chau", "Vinmec"],
+    "Utilities": ["EVN", "Viettel", "Sawaco"],
+    "Loan Payments": ["HQ Mutual"],
+    "Wages": ["Best Company"],
+    "Other Income": ["Freelance Client"],
+}
+
+# Monthly bills: (category, merchant, amount, day of month)
+BILLS = [
+    ("Utilities", "EVN", 850_000, 5),
+    ("Utilities", "Viettel", 250_000, 12),
+    ("Entertainment", "Netflix", 260_000, 18),
+    ("Loan Payments", "HQ Mutual", 4_500_000, 25),
+]
+
+ACCOUNTS = [("Wallet", "CASH", "HIGH"), ("Momo", "WALLET", "LOW"), ("VCB", "BANK", "MEDIUM")]
+
+QUESTIONS = [
+    "How much did I spend on groceries this month?",
+    "Where can I cut back?",
+    "Am I on track with my budget?",
+    "What was my biggest expense last week?",
+]
+
+
+def connect(prefix: str, database: str):
+    return mysql.connector.connect(
+        host=os.getenv(f"{prefix}HOST", "127.0.0.1"),
+        port=int(os.getenv(f"{prefix}PORT", 3306)),
+        user=os.getenv(f"{prefix}USER", "root"),
+        password=os.getenv(f"{prefix}PASS", "rootpass"),
+        database=os.getenv(f"{prefix}NAME", database),
+        autocommit=False
+    )
+
+
+class Seeder:
+    def __init__(self, finance, insights, first_user_id: int, users: int, tx_per_user: int, days: int,
+                 chat_logs: int, batch_size: int, seed: int):
+        self.finance = finance
+        self.insights = insights
+        self.first_user_id = first_user_id
+        self.last_user_id = first_user_id + users - 1
+        self.users = users
+        self.tx_per_user = tx_per_user
+        self.days = days
+        self.chat_logs = chat_logs
+        self.batch_size = batch_size
+        self.rng = random.Random(seed)
+        self.now = datetime.now().replace(microsecond=0)
+        self.counts: Dict[str, int] = {}
+
+    def _insert(self, conn, sql: str, rows: List[Tuple], table: str):
+        """Multi-row INSERTs of batch_size rows, one commit per batch"""
+        cursor = conn.cursor()
+        try:
+            for i in range(0, len(rows), self.batch_size):
+                cursor.executemany(sql, rows[i:i + self.batch_size])
+                conn.commit()
+        finally:
+            cursor.close()
+        self.counts[table] = self.counts.get(table, 0) + len(rows)
+
+    def _select(self, conn, sql: str, params: Tuple = ()) -> List[Tuple]:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    # ---------- Reset ----------
+
+    def reset(self):
+        user_range = (self.first_user_id, self.last_user_id)
+        cursor = self.finance.cursor()
+        try:
+            # Children first: transactions/budgets reference categories and accounts
+            for table in ("transactions", "budgets", "recurring_rules", "alerts", "categories", "accounts", "users"):
+                column = "id" if table == "users" else "user_id"
+                cursor.execute(f"DELETE FROM {table} WHERE {column} BETWEEN %s AND %s", user_range)
+                self.finance.commit()
+        finally:
+            cursor.close()
+        cursor = self.insights.cursor()
+        try:
+            for table in ("chat_logs", "chat_summaries"):
+                cursor.execute(f"DELETE FROM {table} WHERE user_id BETWEEN %s AND %s", user_range)
+                self.insights.commit()
+        finally:
+            cursor.close()
+        logger.info(f"Removed bench users {user_range[0]}-{user_range[1]}")
+
+    # ---------- Reference data ----------
+
+    def seed_merchants(self) -> Dict[str, int]:
+        names = sorted({m for ms in MERCHANTS.values() for m in ms})
+        self._insert(self.finance, "INSERT IGNORE INTO merchants (name) VALUES (%s)", [(n,) for n in names], "merchants")
+        return dict((name, mid) for mid, name in self._select(self.finance, "SELECT id, name FROM merchants"))
+
+    def seed_users(self, user_ids: List[int]) -> Tuple[Dict, Dict]:
+        self._insert(self.finance, """
+            INSERT IGNORE INTO users (id, phone, email, name, currency) VALUES (%s, %s, %s, %s, 'VND')
+        """, [(uid, f"+84 9{uid:08d}", f"bench{uid}@example.com", f"Bench User {uid}") for uid in user_ids], "users")
+
+        self._insert(self.finance, """
+            INSERT INTO categories (user_id, name, icon, type) VALUES (%s, %s, %s, %s)
+        """, [
+            (uid, name, icon, kind)
+            for uid in user_ids
+            for name, icon, kind in (
+                [(n, v[0], "EXPENSE") for n, v in EXPENSE_CATEGORIES.items()]
+                + [(n, icon, "INCOME") for n, icon in INCOME_CATEGORIES.items()]
+            )
+        ], "categories")
+        self._insert(self.finance, """
+            INSERT INTO accounts (user_id, name, type, currency, friction_level) VALUES (%s, %s, %s, 'VND', %s)
+        """, [(uid, name, kind, friction) for uid in user_ids for name, kind, friction in ACCOUNTS], "accounts")
+
+        bounds = (user_ids[0], user_ids[-1])
+        categories: Dict[int, Dict[str, int]] = {}
+        for cid, uid, name in self._select(
+            self.finance, "SELECT id, user_id, name FROM categories WHERE user_id BETWEEN %s AND %s", bounds
+        ):
+            categories.setdefault(uid, {})[name] = cid
+        accounts: Dict[int, List[int]] = {}
+        for aid, uid in self._select(
+            self.finance, "SELECT id, user_id FROM accounts WHERE user_id BETWEEN %s AND %s ORDER BY id", bounds
+        ):
+            accounts.setdefault(uid, []).append(aid)
+        return categories, accounts
+
+    # ---------- Per-user data ----------
+
+    def _transactions(self, uid: int, merchants: Dict[str, int], categories: Dict[str, int],
+                      accounts: List[int]) -> List[Tuple]:
+        rng = self.rng
+        start = self.now - timedelta(days=self.days)
+        rows = []
+
+        def add(kind, amount, description, category, merchant, occurred_at, essential, tags):
+            rows.append((
+                uid, kind, round(amount, -3), description, categories[category], merchants[merchant],
+                rng.choice(accounts), essential, json.dumps(tags), occurred_at
+            ))
+
+        # Wage and bills every month, at a slightly varying time of day
+        month = start.replace(day=1, hour=0, minute=0, second=0)
+        wage = rng.choice([18_000_000, 25_000_000, 35_000_000])
+        while month <= self.now:
+            payday = month.replace(day=1) + timedelta(hours=rng.randint(8, 11))
+            if start <= payday <= self.now:
+                add("INCOME", wage, "Monthly wage", "Wages", "Best Company", payday, True, ["salary"])
+            for category, merchant, amount, day in BILLS:
+                due = month.replace(day=day) + timedelta(hours=rng.randint(7, 20))
+                if start <= due <= self.now:
+                    add("EXPENSE", amount * rng.uniform(0.9, 1.1) if category == "Utilities" else amount,
+                        f"{merchant} bill", category, merchant, due, True, ["bill"])
+            month = (month + timedelta(days=32)).replace(day=1)
+
+        # Everyday spending fills the rest
+        everyday = [(n, v) for n, v in EXPENSE_CATEGORIES.items() if v[2] > 0]
+        weights = [v[2] for _, v in everyday]
+        span = max(1, int((self.now - start).total_seconds()))
+        for _ in range(max(0, self.tx_per_user - len(rows))):
+            name, (_, typical, _) = rng.choices(everyday, weights)[0]
+            merchant = rng.choice(MERCHANTS[name])
+            occurred_at = start + timedelta(seconds=rng.randrange(span))
+            amount = max(10_000, rng.lognormvariate(0, 0.6) * typical)
+            add("EXPENSE", amount, f"{merchant} purchase", name, merchant, occurred_at, name == "Groceries", [])
+        return rows
+
+    def _budgets(self, uid: int, categories: Dict[str, int]) -> List[Tuple]:
+        first = self.now.date().replace(day=1)
+        last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        return [
+            (uid, categories["Groceries"], 3_000_000, first, last),
+            (uid, categories["Dining"], 2_000_000, first, last),
+            (uid, categories["Entertainment"], 1_000_000, first, last),
+        ]
+
+    def _chat_logs(self, uid: int) -> List[Tuple]:
+        rows = []
+        for i in range(self.chat_logs):
+            question = self.rng.choice(QUESTIONS)
+            asked = self.now - timedelta(minutes=(self.chat_logs - i) * self.rng.randint(30, 600))
+            rows.append((
+                uid, question,
+                "Based on your recent transactions your spending is within a normal range; "
+                "groceries are your largest category.",
+                json.dumps({"context": f"User {uid} transactions (last 30 days)"}),
+                asked
+            ))
+        return rows
+
+    # ---------- Run ----------
+
+    def run(self, users_per_chunk: int = 200):
+        started = time.monotonic()
+        merchants = self.seed_merchants()
+        for chunk_start in range(self.first_user_id, self.last_user_id + 1, users_per_chunk):
+            user_ids = list(range(chunk_start, min(chunk_start + users_per_chunk, self.last_user_id + 1)))
+            categories, accounts = self.seed_users(user_ids)
+
+            transactions, budgets, chat_logs = [], [], []
+            for uid in user_ids:
+                transactions.extend(self._transactions(uid, merchants, categories[uid], accounts[uid]))
+                budgets.extend(self._budgets(uid, categories[uid]))
+                chat_logs.extend(self._chat_logs(uid))
+
+            self._insert(self.finance, """
+                INSERT INTO transactions
+                    (user_id, type, amount, currency, description, category_id, merchant_id, account_id, essential, tags, occurred_at)
+                VALUES (%s, %s, %s, 'VND', %s, %s, %s, %s, %s, %s, %s)
+            """, transactions, "transactions")
+            self._insert(self.finance, """
+                INSERT INTO budgets (user_id, category_id, amount_limit, period, alert_threshold, start_date, end_date)
+                VALUES (%s, %s, %s, 'MONTHLY', 0.80, %s, %s)
+            """, budgets, "budgets")
+            self._insert(self.insights, """
+                INSERT INTO chat_logs (user_id, user_query, ai_response, context_snapshot, timestamp)
+                VALUES (%s, %s, %s, %s, %s)
+            """, chat_logs, "chat_logs")
+
+            done = user_ids[-1] - self.first_user_id + 1
+            elapsed = time.monotonic() - started
+            logger.info(
+                f"{done}/{self.users} users, {self.counts.get('transactions', 0)} transactions "
+                f"({self.counts.get('transactions', 0) / elapsed:.0f} rows/s)"
+            )
+        return {"users": [self.first_user_id, self.last_user_id], "rows": self.counts,
+                "seconds": round(time.monotonic() - started, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed synthetic benchmark data")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--tx-per-user", type=int, default=200)
+    parser.add_argument("--days", type=int, default=180, help="history span of the generated transactions")
+    parser.add_argument("--chat-logs", type=int, default=20, help="chat turns per user")
+    parser.add_argument("--first-user-id", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=2000, help="rows per INSERT")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="delete the bench user range first")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    finance = connect("DB_", "financedb")
+    insights = connect("INSIGHTS_DB_", "insightsdb")
+    try:
+        seeder = Seeder(finance, insights, args.first_user_id, args.users, args.tx_per_user, args.days,
+                        args.chat_logs, args.batch_size, args.seed)
+        if args.reset:
+            seeder.reset()
+        json.dump(seeder.run(), sys.stdout)
+        print()
+    finally:
+        finance.close()
+        insights.close()
+
+
+if __name__ == "__main__":
+    main()
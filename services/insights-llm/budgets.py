@@ -0,0 +1,338 @@
+import json
+import asyncio
+import logging
+import redis.asyncio as redis
+from datetime import date
+from typing import Dict, Any, Optional, List
+from aggregates import to_cents, to_day
+
+logger = logging.getLogger(__name__)
+
+LEVELS = {"warning": 1, "over": 2}
+
+
+def budget_record(row: Dict) -> Dict[str, Any]:
+    return {
+        "id": row["id"],
+        "category_id": row["category_id"],
+        "category_name": row.get("category_name"),
+        "limit_cents": to_cents(row["amount_limit"]),
+        "alert_threshold": float(row.get("alert_threshold") or 0.8),
+        "period": row.get("period"),
+        "start_date": to_day(row["start_date"]),
+        "end_date": to_day(row["end_date"]),
+    }
+
+
+def budget_level(budget: Dict, spent_cents: int) -> Optional[str]:
+    if spent_cents > budget["limit_cents"]:
+        return "over"
+    if budget["limit_cents"] > 0 and spent_cents >= budget["alert_threshold"] * budget["limit_cents"]:
+        return "warning"
+    return None
+
+
+class BudgetTracker:
+    """
+    Per-budget spent totals kept in Redis and updated from events.
+
+    budgets:{uid}          hash of budget id -> budget record (limit in cents, dates, threshold)
+    budgets:{uid}:spent    hash of budget id -> EXPENSE cents in the budget's category and range
+    budgets:{uid}:ready    marker set once the user has been loaded from SQL
+    budgets:alert:{bid}:{end}:{level}  set (NX) once that threshold crossing has been alerted
+    budgets:users          every user with tracked budgets (for reconciliation)
+
+    Transaction deltas come from AggregateStore.apply_change, budget lifecycle events
+    reload the single budget from SQL, and a periodic reconciliation pass rewrites
+    everything from one grouped query to correct drift.
+    """
+
+    def __init__(self, redis_url: str, db_manager, alert_flush_delay: float = 0.5):
+        self.redis = redis.from_url(redis_url, decode_responses=True)
+        self.db = db_manager
+        self.alert_flush_delay = alert_flush_delay
+        self._pending_alerts: List[Dict] = []
+        self._flush_task: Optional[asyncio.Task] = None
+
+        self.deltas_applied = 0
+        self.budget_events = 0
+        self.alerts_written = 0
+        self.reconciliations = 0
+        self.drift_corrected = 0
+        logger.info("Budget tracker initialized")
+
+    def _key(self, user_id: int) -> str:
+        return f"budgets:{user_id}"
+
+    def _alert_key(self, budget: Dict, level: str) -> str:
+        # The end date is part of the key so a renewed period alerts again
+        return f"budgets:alert:{budget['id']}:{budget['end_date']}:{level}"
+
+    # ---------- Threshold crossings ----------
+
+    async def _check(self, user_id: int, budget: Dict, spent_cents: int):
+        level = budget_level(budget, spent_cents)
+        rank = LEVELS.get(level, 0)
+        pipe = self.redis.pipeline(transaction=False)
+        for name, value in LEVELS.items():
+            if value <= rank:
+                pipe.set(self._alert_key(budget, name), "1", nx=True, ex=400 * 86400)
+            else:
+                # Dropped back under this threshold (edit/delete): crossing it again alerts again
+                pipe.delete(self._alert_key(budget, name))
+        crossed = await pipe.execute()
+        if rank and crossed[rank - 1]:
+            self._queue_alert(user_id, budget, spent_cents, level)
+
+    def _queue_alert(self, user_id: int, budget: Dict, spent_cents: int, level: str):
+        spent, limit = spent_cents / 100, budget["limit_cents"] / 100
+        if level == "over":
+            message = f"You have exceeded your {budget['category_name']} budget: {spent:,.0f} of {limit:,.0f} VND spent."
+        else:
+            message = (
+                f"You have used {spent / limit:.0%} of your {budget['category_name']} budget "
+                f"({spent:,.0f} of {limit:,.0f} VND)."
+            )
+        self._pending_alerts.append({"user_id": user_id, "type": "BUDGET_OVERRUN", "message": message})
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.alert_flush_delay)
+        await self.flush_alerts()
+
+    async def flush_alerts(self):
+        """Writes every queued crossing in one executemany"""
+        alerts, self._pending_alerts = self._pending_alerts, []
+        if not alerts:
+            return
+        try:
+            await self.db.run(self.db.insert_alerts, alerts)
+            self.alerts_written += len(alerts)
+        except Exception as e:
+            logger.error(f"Failed to write {len(alerts)} budget alerts: {e}")
+
+    # ---------- Loading ----------
+
+    async def _write_user(self, user_id: int, rows: List[Dict]) -> int:
+        """Replaces a user's budgets and totals; returns how many totals had drifted"""
+        key = self._key(user_id)
+        previous = await self.redis.hgetall(f"{key}:spent")
+        budgets = {str(r["id"]): budget_record(r) for r in rows}
+        spent = {str(r["id"]): to_cents(r["spent"]) for r in rows}
+
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.delete(key, f"{key}:spent")
+        if budgets:
+            pipe.hset(key, mapping={bid: json.dumps(b) for bid, b in budgets.items()})
+            pipe.hset(f"{key}:spent", mapping=spent)
+            pipe.sadd("budgets:users", user_id)
+        else:
+            pipe.srem("budgets:users", user_id)
+        pipe.set(f"{key}:ready", "1")
+        await pipe.execute()
+
+        for bid, budget in budgets.items():
+            await self._check(user_id, budget, spent[bid])
+        return sum(1 for bid, cents in spent.items() if bid in previous and int(previous[bid]) != cents)
+
+    async def load_user(self, user_id: int):
+        rows = await self.db.run(self.db.fetch_budget_totals, user_id)
+        await self._write_user(user_id, rows)
+
+    async def reload(self, user_id: int):
+        """Reloads a tracked user from SQL when no exact delta is available"""
+        if await self.redis.exists(f"{self._key(user_id)}:ready"):
+            await self.load_user(user_id)
+
+    # ---------- Event path ----------
+
+    async def apply_delta(self, user_id: int, old: Optional[Dict], new: Optional[Dict]):
+        """
+        old/new: transaction contribution records (aggregates.tx_record) before and after the event.
+        Adjusts every budget whose category and date range the transaction falls in.
+        """
+        key = self._key(user_id)
+        if not await self.redis.exists(f"{key}:ready"):
+            return  # Loaded from SQL on first read
+        budgets = [json.loads(raw) for raw in (await self.redis.hgetall(key)).values()]
+
+        changes: Dict[str, int] = {}
+        for record, sign in ((old, -1), (new, +1)):
+            if not record or record["type"] != "EXPENSE":
+                continue
+            for budget in budgets:
+                if budget["category_id"] == record["category_id"] and budget["start_date"] <= record["day"] <= budget["end_date"]:
+                    changes[str(budget["id"])] = changes.get(str(budget["id"]), 0) + sign * record["cents"]
+
+        changes = {bid: delta for bid, delta in changes.items() if delta}
+        if not changes:
+            return
+        pipe = self.redis.pipeline(transaction=True)
+        for bid, delta in changes.items():
+            pipe.hincrby(f"{key}:spent", bid, delta)
+        totals = await pipe.execute()
+
+        by_id = {str(b["id"]): b for b in budgets}
+        for bid, spent_cents in zip(changes, totals):
+            await self._check(user_id, by_id[bid], spent_cents)
+        self.deltas_applied += 1
+
+    async def handle_budget_event(self, event: Dict):
+        """BUDGET_CREATED / UPDATED / DELETED from the budgets service (payloads are partial)"""
+        data = event.get("data") or {}
+        user_id, budget_id = data.get("user_id"), data.get("id")
+        if not user_id or not budget_id:
+            return
+        user_id, budget_id = int(user_id), int(budget_id)
+        key = self._key(user_id)
+        self.budget_events += 1
+
+        if not await self.redis.exists(f"{key}:ready"):
+            return
+        if event.get("type") == "BUDGET_DELETED":
+            await self.redis.hdel(key, str(budget_id))
+            await self.redis.hdel(f"{key}:spent", str(budget_id))
+            return
+
+        rows = await self.db.run(self.db.fetch_budget_totals, user_id, budget_id)
+        if not rows:
+            # Not active (dates moved out of range) or already gone
+            await self.redis.hdel(key, str(budget_id))
+            await self.redis.hdel(f"{key}:spent", str(budget_id))
+            return
+        budget, spent_cents = budget_record(rows[0]), to_cents(rows[0]["spent"])
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hset(key, str(budget_id), json.dumps(budget))
+        pipe.hset(f"{key}:spent", str(budget_id), spent_cents)
+        pipe.sadd("budgets:users", user_id)
+        await pipe.execute()
+        await self._check(user_id, budget, spent_cents)
+
+    # ---------- Reconciliation ----------
+
+    def _stream_reconcile(self, loop) -> Dict[str, int]:
+        """Runs in a DB worker thread: one grouped query, written back user by user"""
+        seen, drifted = set(), 0
+        current_user, rows = None, []
+        for row in self.db.fetch_budget_totals() + [None]:
+            if row is None or row["user_id"] != current_user:
+                if current_user is not None:
+                    drifted += asyncio.run_coroutine_threadsafe(self._write_user(current_user, rows), loop).result()
+                    seen.add(current_user)
+                if row is None:
+                    break
+                current_user, rows = row["user_id"], []
+            rows.append(row)
+        return {"seen": seen, "drifted": drifted}
+
+    async def reconcile(self, lock_ttl: int = 300) -> Optional[Dict]:
+        """
+        Recomputes every active budget from SQL and corrects drifted totals.
+        Only one process runs it at a time; returns None if another one holds the lock.
+        """
+        if not await self.redis.set("budgets:reconcile:lock", "1", nx=True, ex=lock_ttl):
+            return None
+        try:
+            loop = asyncio.get_running_loop()
+            result = await self.db.run(self._stream_reconcile, loop)
+            # Users whose budgets all ended or were deleted
+            for user_id in await self.redis.smembers("budgets:users"):
+                if int(user_id) not in result["seen"]:
+                    await self._write_user(int(user_id), [])
+            await self.flush_alerts()
+        finally:
+            await self.redis.delete("budgets:reconcile:lock")
+
+        self.reconciliations += 1
+        self.drift_corrected += result["drifted"]
+        summary = {"users": len(result["seen"]), "drifted": result["drifted"]}
+        logger.info(f"Budget reconciliation finished: {summary}")
+        return summary
+
+    async def run_reconciliation(self, interval: int):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reconcile()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Budget reconciliation failed: {e}")
+
+    # ---------- Read path ----------
+
+    async def status(self, user_id: int) -> List[Dict[str, Any]]:
+        """
+        Active budgets with spending progress, read from Redis in O(budgets).
+        Same fields the old per-request GROUP BY produced.
+        """
+        key = self._key(user_id)
+        if not await self.redis.exists(f"{key}:ready"):
+            await self.load_user(user_id)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hgetall(key)
+        pipe.hgetall(f"{key}:spent")
+        raw_budgets, raw_spent = await pipe.execute()
+
+        today = date.today().isoformat()
+        results = []
+        for bid, raw in raw_budgets.items():
+            budget = json.loads(raw)
+            if not budget["start_date"] <= today <= budget["end_date"]:
+                continue
+            spent, limit = int(raw_spent.get(bid, 0)) / 100, budget["limit_cents"] / 100
+            percent = (spent / limit) * 100 if limit > 0 else 0
+            is_over_budget = spent > limit
+            results.append({
+                "id": budget["id"],
+                "category_name": budget["category_name"],
+                "amount_limit": limit,
+                "alert_threshold": budget["alert_threshold"],
+                "period": budget["period"],
+                "start_date": budget["start_date"],
+                "end_date": budget["end_date"],
+                "spent": spent,
+                "remaining": limit - spent,
+                "percent": percent,
+                "is_over_budget": is_over_budget,
+                "is_warning": percent >= budget["alert_threshold"] * 100 and not is_over_budget,
+            })
+        return sorted(results, key=lambda r: r["id"])
+
+    def stats(self) -> Dict:
+        return {
+            "deltas_applied": self.deltas_applied,
+            "budget_events": self.budget_events,
+            "alerts_written": self.alerts_written,
+            "alerts_pending": len(self._pending_alerts),
+            "reconciliations": self.reconciliations,
+            "drift_corrected": self.drift_corrected,
+        }
+
+    async def close(self):
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush_alerts()
+        await self.redis.aclose()
+
+
+if __name__ == "__main__":
+    # One reconciliation pass against financedb: python budgets.py
+    import os
+    from dotenv import load_dotenv
+    from database import DatabaseManager
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    async def main():
+        db = DatabaseManager()
+        tracker = BudgetTracker(os.getenv("REDIS_URL", "redis://redis:6379/0"), db)
+        try:
+            await tracker.reconcile()
+        finally:
+            await tracker.close()
+            db.close()
+
+    asyncio.run(main())
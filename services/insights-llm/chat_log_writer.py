@@ -0,0 +1,247 @@
+import os
+import glob
+import json
+import time
+import uuid
+import fcntl
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ChatLogWriter:
+    """
+    Write-behind buffer for chat_logs.
+
+    Requests queue rows and return; a background task flushes them with one
+    multi-row INSERT when `batch_size` rows are waiting or every `flush_interval`
+    seconds. When `max_pending` rows are queued, submit() waits for room
+    (backpressure). Rows that cannot be written (insightsdb down, or still no
+    room after `backpressure_timeout`) go to a local spill file and are replayed
+    once the database accepts writes again.
+
+    Queued and spilled rows stay visible to DatabaseManager.fetch_chat_history
+    through merge(), so a user always sees their own last turns.
+    """
+
+    def __init__(self, db_manager, batch_size: int = 100, flush_interval: float = 1.0, max_pending: int = 5000,
+                 backpressure_timeout: float = 2.0, spill_dir: str = "data/chat_log_spill",
+                 replay_interval: float = 30.0, overlay_per_user: int = 50):
+        self.db = db_manager
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.backpressure_timeout = backpressure_timeout
+        self.spill_dir = spill_dir
+        self.spill_path = os.path.join(spill_dir, f"{os.getpid()}.jsonl")
+        self.replay_interval = replay_interval
+        self.overlay_per_user = overlay_per_user
+        os.makedirs(spill_dir, exist_ok=True)
+
+        self._buffer: deque = deque()
+        self._in_flight = 0
+        self._wake = asyncio.Event()
+        self._room = asyncio.Condition()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._last_replay = 0.0
+
+        # user -> entries not yet in chat_logs; read from DB worker threads
+        self._overlay: Dict[int, List[Dict]] = {}
+        self._overlay_lock = threading.Lock()
+
+        self.queued = 0
+        self.flushed = 0
+        self.batches = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.backpressure_waits = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer) + self._in_flight
+
+    # ---------- Read-your-writes overlay ----------
+
+    def _add_overlay(self, entry: Dict):
+        with self._overlay_lock:
+            entries = self._overlay.setdefault(entry["row"]["user_id"], [])
+            entries.append(entry)
+            del entries[:-self.overlay_per_user]
+
+    def _remove_overlay(self, seqs: set):
+        with self._overlay_lock:
+            for user_id in list(self._overlay):
+                entries = [e for e in self._overlay[user_id] if e["seq"] not in seqs]
+                if entries:
+                    self._overlay[user_id] = entries
+                else:
+                    del self._overlay[user_id]
+
+    def merge(self, user_id: int, rows: List[Dict], limit: int) -> List[Dict]:
+        """
+        rows: chat_logs rows for the user, newest first (as fetch_chat_history selects them).
+        Returns them with the user's unflushed turns in front, trimmed to `limit`.
+        """
+        with self._overlay_lock:
+            entries = list(self._overlay.get(user_id, ()))
+        if not entries:
+            return rows
+
+        # A batch committed while the rows were being read can show up in both places
+        persisted = {(r['user_query'], r['ai_response']) for r in rows}
+        pending = [
+            {"id": None, "user_query": e["row"]["user_query"], "ai_response": e["row"]["ai_response"]}
+            for e in entries
+            if e["state"] == "queued" or (e["row"]["user_query"], e["row"]["ai_response"]) not in persisted
+        ]
+        return (list(reversed(pending)) + list(rows))[:limit]
+
+    # ---------- Write path ----------
+
+    async def submit(self, row: Dict):
+        """Queue a DatabaseManager.chat_log_row(); waits while the buffer is full"""
+        entry = {"seq": uuid.uuid4().hex, "row": row, "state": "queued"}
+        self._add_overlay(entry)
+        self.queued += 1
+
+        if self.pending >= self.max_pending:
+            self.backpressure_waits += 1
+            try:
+                async with self._room:
+                    await asyncio.wait_for(
+                        self._room.wait_for(lambda: self.pending < self.max_pending),
+                        self.backpressure_timeout
+                    )
+            except asyncio.TimeoutError:
+                logger.warning("Chat log buffer still full, spilling to disk")
+                await self._spill([entry])
+                return
+
+        self._buffer.append(entry)
+        if len(self._buffer) >= self.batch_size:
+            self._wake.set()
+
+    async def _release(self, count: int):
+        self._in_flight -= count
+        async with self._room:
+            self._room.notify_all()
+
+    async def flush(self):
+        """Writes everything queued; on a database error the rest is spilled"""
+        while self._buffer:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            self._in_flight += len(batch)
+            for entry in batch:
+                entry["state"] = "flushing"
+            try:
+                await self.db.run(self.db.save_chat_logs, [e["row"] for e in batch])
+            except Exception as e:
+                logger.error(f"Chat log flush failed ({e}); spilling {len(batch) + len(self._buffer)} rows")
+                rest = list(self._buffer)
+                self._buffer.clear()
+                self._in_flight += len(rest)
+                await self._spill(batch + rest)
+                await self._release(len(batch) + len(rest))
+                return
+
+            self._remove_overlay({e["seq"] for e in batch})
+            self.flushed += len(batch)
+            self.batches += 1
+            await self._release(len(batch))
+
+    # ---------- Spill file ----------
+
+    def _append_spill(self, entries: List[Dict]):
+        with open(self.spill_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.write("".join(json.dumps({"seq": e["seq"], "row": e["row"]}) + "\n" for e in entries))
+
+    async def _spill(self, entries: List[Dict]):
+        for entry in entries:
+            entry["state"] = "spilled"
+        try:
+            await asyncio.to_thread(self._append_spill, entries)
+            self.spilled += len(entries)
+        except Exception as e:
+            logger.error(f"Failed to spill {len(entries)} chat logs: {e}")
+
+    def _replay_file(self, path: str) -> List[str]:
+        """Runs in a worker thread. Inserts a spill file's rows and truncates it; returns replayed seqs"""
+        replayed: List[str] = []
+        with open(path, "r+") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return replayed  # Another worker is replaying it
+            entries = [json.loads(line) for line in f if line.strip()]
+            try:
+                for i in range(0, len(entries), self.batch_size):
+                    batch = entries[i:i + self.batch_size]
+                    self.db.save_chat_logs([e["row"] for e in batch])
+                    replayed.extend(e["seq"] for e in batch)
+            finally:
+                # Keep whatever was not written; truncate rather than unlink so appenders never lose lines
+                remaining = entries[len(replayed):]
+                f.seek(0)
+                f.truncate()
+                f.write("".join(json.dumps(e) + "\n" for e in remaining))
+        return replayed
+
+    async def replay_spill(self):
+        """Replays every worker's spill file (including ones left by previous processes)"""
+        self._last_replay = time.monotonic()
+        for path in glob.glob(os.path.join(self.spill_dir, "*.jsonl")):
+            if not os.path.getsize(path):
+                continue
+            try:
+                seqs = await asyncio.to_thread(self._replay_file, path)
+            except Exception as e:
+                logger.warning(f"Chat log spill replay stopped: {e}")
+                return
+            if seqs:
+                self._remove_overlay(set(seqs))
+                self.replayed += len(seqs)
+                logger.info(f"Replayed {len(seqs)} spilled chat logs from {path}")
+
+    # ---------- Lifecycle ----------
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+            if time.monotonic() - self._last_replay >= self.replay_interval:
+                await self.replay_spill()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stops the flush loop and drains the buffer (to chat_logs, or the spill file)"""
+        # Let an in-flight batch finish instead of cancelling it half-written
+        self._closing = True
+        self._wake.set()
+        if self._task:
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            "pending": self.pending,
+            "queued": self.queued,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "backpressure_waits": self.backpressure_waits,
+        }
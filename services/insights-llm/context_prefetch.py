@@ -0,0 +1,162 @@
+import json
+import asyncio
+import logging
+import redis.asyncio as redis
+from typing import Dict, Optional, Callable, Awaitable
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ContextPrefetcher:
+    """
+    Short-lived per-user chat context (recent transactions, history window, rolling
+    summary), loaded speculatively when the analytics page calls /dashboard or
+    /history, so the first chat message skips those DB reads.
+
+    prefetch:{uid}          the context, reused until `ttl` or until the caller's
+                            validate() says the data changed
+    prefetch:{uid}:history  history and rolling summary, handed out once (GETDEL),
+                            since each chat adds a turn
+
+    Entries live in Redis, so the chat can use them on whichever worker it lands.
+    warm() starts a background load and never delays the caller; take() waits for a
+    load this worker is still running. At most `max_inflight` loads run at once per
+    worker; warms beyond that are dropped, not queued.
+    """
+
+    def __init__(self, redis_url: str, loader: Callable[[int], Awaitable[Dict]], ttl: int = 60,
+                 max_inflight: int = 32):
+        self.redis = redis.from_url(redis_url, decode_responses=True)
+        self.loader = loader
+        self.ttl = ttl
+        self.max_inflight = max_inflight
+        self._loading: Dict[int, asyncio.Task] = {}
+
+        self.warms = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.hits = 0
+        self.history_hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.errors = 0
+
+    def _keys(self, user_id: int):
+        return f"prefetch:{user_id}", f"prefetch:{user_id}:history"
+
+    def warm(self, user_id: int):
+        if user_id in self._loading:
+            return
+        if len(self._loading) >= self.max_inflight:
+            self.dropped += 1
+            return
+        task = asyncio.ensure_future(self._load(user_id))
+        self._loading[user_id] = task
+        task.add_done_callback(lambda t: self._loaded(user_id, t))
+
+    def _loaded(self, user_id: int, task: asyncio.Task):
+        if self._loading.get(user_id) is task:
+            del self._loading[user_id]
+
+    async def _load(self, user_id: int):
+        # The task inherited the triggering request's labels; its queries are not part of that request
+        metrics.current_endpoint.set("prefetch")
+        metrics.current_timings.set(None)
+        context_key, history_key = self._keys(user_id)
+        try:
+            # An unused entry loaded recently (by any worker) is still good
+            if await self.redis.pttl(history_key) > self.ttl * 500:
+                self.skipped += 1
+                return
+            self.warms += 1
+            context = await self.loader(user_id)
+            if self._loading.get(user_id) is not asyncio.current_task():
+                # Invalidated while loading: the data may predate the change
+                return
+            history = {"history": context.pop("history"), "conversation": context.pop("conversation")}
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.set(context_key, json.dumps(context, default=str), ex=self.ttl)
+            pipe.set(history_key, json.dumps(history, default=str), ex=self.ttl)
+            await pipe.execute()
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Context prefetch failed for user {user_id}: {e}")
+
+    async def take(self, user_id: int, validate: Optional[Callable[[Dict], bool]] = None) -> Optional[Dict]:
+        """
+        The prefetched context, or None. 'history' / 'conversation' are None when they
+        were already used by an earlier chat and must be loaded fresh.
+        """
+        task = self._loading.get(user_id)
+        if task is not None:
+            try:
+                # shield: a chat that is cancelled must not cancel the load for the next one
+                await asyncio.shield(task)
+            except Exception:
+                pass
+
+        context_key, history_key = self._keys(user_id)
+        try:
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.get(context_key)
+            pipe.getdel(history_key)
+            raw_context, raw_history = await pipe.execute()
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Context prefetch read failed for user {user_id}: {e}")
+            return None
+
+        if raw_context is None:
+            self.misses += 1
+            return None
+        context = json.loads(raw_context)
+        if validate is not None and not validate(context):
+            await self.invalidate(user_id)
+            self.stale += 1
+            return None
+
+        self.hits += 1
+        history = json.loads(raw_history) if raw_history else {"history": None, "conversation": None}
+        if history["history"] is not None:
+            self.history_hits += 1
+        context.update(history)
+        return context
+
+    async def history_used(self, user_id: int):
+        """A chat answered without take() (SQL fast path) still added a turn"""
+        try:
+            await self.redis.delete(self._keys(user_id)[1])
+        except Exception as e:
+            logger.warning(f"Context prefetch cleanup failed for user {user_id}: {e}")
+
+    def detach(self, user_id: int):
+        """A load this worker has in flight may have read the old data; it is not stored"""
+        self._loading.pop(user_id, None)
+
+    async def invalidate(self, user_id: int):
+        self.detach(user_id)
+        try:
+            await self.redis.delete(*self._keys(user_id))
+        except Exception as e:
+            logger.warning(f"Context prefetch invalidation failed for user {user_id}: {e}")
+
+    async def close(self):
+        for task in list(self._loading.values()):
+            task.cancel()
+        await self.redis.aclose()
+
+    def stats(self) -> Dict:
+        taken = self.hits + self.misses + self.stale
+        return {
+            "loading": len(self._loading),
+            "warms": self.warms,
+            "skipped": self.skipped,
+            "dropped": self.dropped,
+            "hits": self.hits,
+            "history_hits": self.history_hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_ratio": round(self.hits / taken, 4) if taken else 0.0,
+            "errors": self.errors,
+        }
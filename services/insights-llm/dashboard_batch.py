@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import threading
+import concurrent.futures
+from contextlib import closing
+from typing import Dict, List, AsyncIterator, Any
+from aggregates import summary_from_rows
+from analytics import dashboard_analytics
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class DashboardBatch:
+    """
+    Dashboards for many users in one pass (POST /dashboard/batch).
+
+    Cached dashboards are answered first. For the rest, every user's 30-day window
+    comes from one streamed set-based query (DatabaseManager.iter_user_windows);
+    the summary and analytics are computed from those rows, without per-user
+    queries or Redis reads, and Gemini generation fans out over `concurrency`
+    workers. Results are yielded as each user completes.
+
+    Memory stays flat: the DB thread, the workers and the consumer are joined by
+    bounded queues, so a slow reader slows generation and the query down instead
+    of buffering results.
+    """
+
+    def __init__(self, rag_pipeline, db_manager, cache=None, concurrency: int = 8, days: int = 30,
+                 max_users: int = 10000, bills_days: int = 14):
+        self.rag = rag_pipeline
+        self.db = db_manager
+        self.cache = cache
+        self.concurrency = concurrency
+        self.days = days
+        self.max_users = max_users
+        self.bills_days = bills_days
+
+        self.batches = 0
+        self.users = 0
+        self.cached = 0
+        self.generated = 0
+        self.fallbacks = 0
+
+    def _read_windows(self, loop, user_ids: List[int], rows_queue: asyncio.Queue, stop: threading.Event):
+        """Runs in a DB worker thread: hands each user's rows to the event loop, waiting for room"""
+        # closing(): stopping early must still close the cursor and return the connection
+        with closing(self.db.iter_user_windows(user_ids, self.days)) as windows:
+            for user_id, rows in windows:
+                future = asyncio.run_coroutine_threadsafe(rows_queue.put((user_id, rows)), loop)
+                while True:
+                    if stop.is_set():
+                        future.cancel()
+                        return
+                    try:
+                        future.result(timeout=0.5)
+                        break
+                    except concurrent.futures.TimeoutError:
+                        continue
+
+    async def _dashboard(self, user_id: int, rows: List[Dict], bills: List[Dict], generate: bool) -> Dict[str, Any]:
+        summary = summary_from_rows(rows, self.days)
+        analytics = dashboard_analytics(rows, bills, days=self.days)
+        data = None
+        if generate:
+            # Same newest-50 sample the single-user path sends
+            transactions = sorted((r for r in rows if r['recency'] <= 50), key=lambda r: r['recency'])
+            data = await self.rag.generate_dashboard_insights(transactions, summary, analytics, user_id=user_id)
+        if data:
+            self.generated += 1
+            if self.cache:
+                await self.cache.set(user_id, data)
+            return {"user_id": user_id, "source": "generated", "dashboard": data}
+
+        self.fallbacks += int(generate)
+        return {
+            "user_id": user_id,
+            "source": "summary",
+            "dashboard": {
+                "initial_message": "Welcome back! I'm ready to analyze your finances.",
+                "summary_cards": [],
+                "smart_insights": [],
+                "prediction": analytics['forecast']
+            },
+            "summary": {k: summary[k] for k in ("income", "expenses", "net", "count")},
+        }
+
+    async def _worker(self, rows_queue: asyncio.Queue, results: asyncio.Queue, bills: Dict[int, List[Dict]], generate: bool):
+        while True:
+            item = await rows_queue.get()
+            if item is _DONE:
+                await results.put(_DONE)
+                return
+            user_id, rows = item
+            try:
+                result = await self._dashboard(user_id, rows, bills.get(user_id, []), generate)
+            except Exception as e:
+                logger.error(f"Batch dashboard failed for user {user_id}: {e}")
+                result = {"user_id": user_id, "error": str(e)}
+            await results.put(result)
+
+    async def run(self, user_ids: List[int], use_cache: bool = True, generate: bool = True) -> AsyncIterator[Dict[str, Any]]:
+        user_ids = list(dict.fromkeys(user_ids))
+        if len(user_ids) > self.max_users:
+            raise ValueError(f"At most {self.max_users} users per batch")
+        self.batches += 1
+        self.users += len(user_ids)
+
+        remaining = user_ids
+        if use_cache and self.cache:
+            fresh = await self.cache.get_fresh_many(user_ids)
+            for user_id, data in fresh.items():
+                self.cached += 1
+                yield {"user_id": user_id, "source": "cache", "dashboard": data}
+            remaining = [uid for uid in user_ids if uid not in fresh]
+        if not remaining:
+            return
+
+        # Upcoming bills for the whole batch in one query, like the transaction windows
+        bills = await self.db.run(self.db.fetch_upcoming_bills_many, remaining, self.bills_days)
+        loop = asyncio.get_running_loop()
+        rows_queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency)
+        results: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency)
+        stop = threading.Event()
+
+        async def produce():
+            try:
+                await self.db.run(self._read_windows, loop, remaining, rows_queue, stop)
+            except Exception as e:
+                logger.error(f"Batch dashboard query failed: {e}")
+                if not stop.is_set():
+                    await results.put({"error": f"query failed: {e}"})
+            finally:
+                # Once stopped nobody reads the queues any more: a blocking put would never return
+                if not stop.is_set():
+                    for _ in range(self.concurrency):
+                        await rows_queue.put(_DONE)
+
+        tasks = [asyncio.create_task(produce())]
+        tasks += [asyncio.create_task(self._worker(rows_queue, results, bills, generate)) for _ in range(self.concurrency)]
+        try:
+            finished = 0
+            while finished < self.concurrency:
+                result = await results.get()
+                if result is _DONE:
+                    finished += 1
+                    continue
+                yield result
+        finally:
+            # Client went away (or we are done): release the DB thread and the workers
+            stop.set()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict:
+        return {
+            "batches": self.batches,
+            "users": self.users,
+            "cached": self.cached,
+            "generated": self.generated,
+            "fallbacks": self.fallbacks,
+        }
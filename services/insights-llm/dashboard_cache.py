@@ -0,0 +1,163 @@
+import time
+import json
+import asyncio
+import logging
+import redis.asyncio as redis
+from typing import Dict, Any, Optional, Callable, Awaitable, List
+
+logger = logging.getLogger(__name__)
+
+
+class DashboardCache:
+    """
+    Per-user cache of generate_dashboard_insights results in Redis.
+
+    Entries are fresh for `ttl` seconds. After that they are served stale for up to
+    `stale_ttl` more seconds while a single background refresh regenerates them.
+    Transaction events invalidate (and optionally refresh) a user's entry.
+    """
+
+    def __init__(self, redis_url: str, ttl: int = 900, stale_ttl: int = 3600, refresh_delay: float = 2.0):
+        self.redis = redis.from_url(redis_url, decode_responses=True)
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.refresh_delay = refresh_delay
+        self._pending_refresh: Dict[int, asyncio.Task] = {}
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.errors = 0
+        logger.info(f"Dashboard cache initialized (ttl={ttl}s, stale={stale_ttl}s)")
+
+    def _key(self, user_id: int) -> str:
+        return f"dashboard:{user_id}"
+
+    async def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Returns {'data': ..., 'generated_at': ...} or None"""
+        try:
+            raw = await self.redis.get(self._key(user_id))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Dashboard cache read failed: {e}")
+            return None
+        return json.loads(raw) if raw else None
+
+    async def set(self, user_id: int, data: Dict[str, Any]):
+        entry = {"data": data, "generated_at": time.time()}
+        try:
+            await self.redis.set(self._key(user_id), json.dumps(entry, default=str), ex=self.ttl + self.stale_ttl)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Dashboard cache write failed: {e}")
+
+    async def invalidate(self, user_id: int):
+        try:
+            await self.redis.delete(self._key(user_id))
+            logger.info(f"Dashboard cache invalidated for user {user_id}")
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Dashboard cache invalidation failed: {e}")
+
+    async def missing(self, user_ids: List[int]) -> List[int]:
+        """Users without a cached entry, checked in one round trip"""
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for user_id in user_ids:
+                pipe.exists(self._key(user_id))
+            found = await pipe.execute()
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Dashboard cache lookup failed: {e}")
+            return list(user_ids)
+        return [user_id for user_id, hit in zip(user_ids, found) if not hit]
+
+    async def get_fresh_many(self, user_ids: List[int], chunk: int = 500) -> Dict[int, Dict[str, Any]]:
+        """Users whose entry is still fresh -> cached dashboard data, via MGET"""
+        fresh: Dict[int, Dict[str, Any]] = {}
+        now = time.time()
+        try:
+            for i in range(0, len(user_ids), chunk):
+                ids = user_ids[i:i + chunk]
+                for user_id, raw in zip(ids, await self.redis.mget([self._key(uid) for uid in ids])):
+                    if not raw:
+                        continue
+                    entry = json.loads(raw)
+                    if now - entry["generated_at"] < self.ttl:
+                        fresh[user_id] = entry["data"]
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Dashboard cache read failed: {e}")
+        self.hits += len(fresh)
+        self.misses += len(user_ids) - len(fresh)
+        return fresh
+
+    async def _acquire_refresh_lock(self, user_id: int) -> bool:
+        # Only one worker/process regenerates a given user at a time
+        try:
+            return bool(await self.redis.set(f"{self._key(user_id)}:refresh", "1", nx=True, ex=60))
+        except Exception:
+            return False
+
+    async def _refresh(self, user_id: int, compute: Callable[[], Awaitable[Optional[Dict]]]):
+        if not await self._acquire_refresh_lock(user_id):
+            return
+        try:
+            data = await compute()
+            if data:
+                await self.set(user_id, data)
+        except Exception as e:
+            logger.warning(f"Background dashboard refresh failed for user {user_id}: {e}")
+        finally:
+            try:
+                await self.redis.delete(f"{self._key(user_id)}:refresh")
+            except Exception:
+                pass
+
+    async def get_or_compute(self, user_id: int, compute: Callable[[], Awaitable[Optional[Dict]]]) -> Optional[Dict]:
+        entry = await self.get(user_id)
+        if entry:
+            age = time.time() - entry["generated_at"]
+            if age < self.ttl:
+                self.hits += 1
+                return entry["data"]
+            # Stale: serve it now, regenerate in the background
+            self.stale_hits += 1
+            asyncio.create_task(self._refresh(user_id, compute))
+            return entry["data"]
+
+        self.misses += 1
+        data = await compute()
+        if data:
+            await self.set(user_id, data)
+        return data
+
+    def schedule_refresh(self, user_id: int, compute: Callable[[], Awaitable[Optional[Dict]]]):
+        """
+        Debounced refresh after a burst of transaction events for the same user.
+        """
+        pending = self._pending_refresh.get(user_id)
+        if pending and not pending.done():
+            pending.cancel()
+
+        async def delayed():
+            await asyncio.sleep(self.refresh_delay)
+            self._pending_refresh.pop(user_id, None)
+            await self._refresh(user_id, compute)
+
+        self._pending_refresh[user_id] = asyncio.create_task(delayed())
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+    async def close(self):
+        for task in self._pending_refresh.values():
+            task.cancel()
+        await self.redis.aclose()
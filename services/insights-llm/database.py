@@ -1,8 +1,14 @@
 import os
 import json
-import mysql.connector
-from typing import List, Dict
+import time
+import asyncio
+import functools
+from datetime import date, datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Callable, Any, Optional, Iterator, Tuple
 import logging
+from db_pool import ConnectionPool
+from metrics import DB_QUERY_SECONDS, record_stage
 
 logger = logging.getLogger(__name__)
 
@@ -28,19 +34,62 @@ class DatabaseManager:
             'password': os.getenv('INSIGHTS_DB_PASS', 'rootpass'),
             'database': os.getenv('INSIGHTS_DB_NAME', 'insightsdb')
         }
+
+        # Pooled connections: one pool per database, sized via env
+        pool_recycle = int(os.getenv('DB_POOL_RECYCLE', 1800))
+        pool_timeout = float(os.getenv('DB_POOL_TIMEOUT', 5))
+        self.finance_pool = ConnectionPool(
+            'financedb',
+            self.finance_db_config,
+            size=int(os.getenv('DB_POOL_SIZE', 10)),
+            recycle=pool_recycle,
+            timeout=pool_timeout
+        )
+        self.insights_pool = ConnectionPool(
+            'insightsdb',
+            self.insights_db_config,
+            size=int(os.getenv('INSIGHTS_DB_POOL_SIZE', 5)),
+            recycle=pool_recycle,
+            timeout=pool_timeout
+        )
+
+        # Unflushed chat logs (a ChatLogWriter), merged into fetch_chat_history for read-your-writes
+        self.chat_log_overlay = None
+
+        # Dedicated worker threads for blocking queries issued from async handlers,
+        # sized to the pools so async callers never queue on a thread without a connection
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.finance_pool.size + self.insights_pool.size,
+            thread_name_prefix='db'
+        )
         
         logger.info("Database manager initialized")
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run a blocking DatabaseManager method without blocking the event loop.
+        Usage: await db_manager.run(db_manager.fetch_transactions, user_id)
+        """
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            elapsed = time.perf_counter() - started
+            name = getattr(fn, "__name__", "call")
+            DB_QUERY_SECONDS.observe(elapsed, query=name)
+            record_stage(f"db.{name}", elapsed)
     
     def get_finance_connection(self):
         try:
-            return mysql.connector.connect(**self.finance_db_config)
+            return self.finance_pool.get_connection()
         except Exception as e:
             logger.error(f"Finance DB connection failed: {e}")
             raise
     
     def get_insights_connection(self):
         try:
-            return mysql.connector.connect(**self.insights_db_config)
+            return self.insights_pool.get_connection()
         except Exception as e:
             logger.warning(f"Insights DB connection failed: {e}")
             return None
@@ -88,10 +137,27 @@ class DatabaseManager:
         finally:
             if cursor: cursor.close()
             if conn: conn.close()
+
     def fetch_chat_history(self, user_id: int, limit: int = 5) -> List[Dict]:
         """
         Fetch recent chat history for context from insightsdb.
-        Returns a list of dicts: [{'role': 'user', 'message': '...'}, ...]
+        Returns a list of dicts: [{'id': 12, 'role': 'user', 'message': '...'}, ...]
+        (both turns of one chat_logs row share its id; turns still waiting in the
+        write-behind buffer have id None)
+        """
+        try:
+            page = self.fetch_chat_page(user_id, limit)
+            return page['history'] if page else []
+        except Exception as e:
+            logger.error(f"Failed to fetch chat history: {e}")
+            return []
+
+    def fetch_chat_page(self, user_id: int, limit: int = 50, before_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        One page of a user's chat history, newest page first, oldest turn first within the page.
+        Keyset pagination on the (user_id, id) index: pass the returned next_cursor as
+        before_id to get the previous page. Cost is the same for every page.
+        Returns {'history': [...turns...], 'next_cursor': id or None}, None if insightsdb is unavailable
         """
         conn = None
         cursor = None
@@ -99,143 +165,876 @@ class DatabaseManager:
         try:
             conn = self.get_insights_connection()
             if not conn:
-                return []
-            
+                return None
             cursor = conn.cursor(dictionary=True)
             
             query = """
-                SELECT user_query, ai_response 
+                SELECT id, user_query, ai_response 
                 FROM chat_logs 
-                WHERE user_id = %s 
+                WHERE user_id = %s {before}
                 ORDER BY id DESC 
                 LIMIT %s
             """
+            params = [user_id]
+            if before_id is not None:
+                params.append(before_id)
+            params.append(limit + 1)
             
-            cursor.execute(query, (user_id, limit))
+            cursor.execute(query.format(before="AND id < %s" if before_id is not None else ""), tuple(params))
             rows = cursor.fetchall()
+            if self.chat_log_overlay and before_id is None:
+                rows = self.chat_log_overlay.merge(user_id, rows, limit + 1)
+
+            # The extra row only tells whether an older page exists
+            next_cursor = None
+            if len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = rows[-1]['id']
             
             history = []
             for row in reversed(rows):
                 # 1. User turn
                 if row['user_query']:
-                    history.append({"role": "user", "message": row['user_query']})
+                    history.append({"id": row['id'], "role": "user", "message": row['user_query']})
                 # 2. AI turn
                 if row['ai_response']:
-                    history.append({"role": "model", "message": row['ai_response']})
+                    history.append({"id": row['id'], "role": "model", "message": row['ai_response']})
             
             logger.info(f"Fetched {len(history)} history turns for user {user_id}")
-            return history
-            
-        except Exception as e:
-            logger.error(f"Failed to fetch chat history: {e}")
-            return []
+            return {"history": history, "next_cursor": next_cursor}
             
         finally:
             if cursor: cursor.close()
             if conn: conn.close()
-    
-    def save_chat_log(self, user_id: int, query: str, response: str, context: str) -> bool:
+
+    def archive_chat_snapshots(self, older_than_days: int = 7, batch_size: int = 5000) -> int:
         """
-        Save chat log to 'insightsdb'
+        Moves context_snapshot of chat_logs older than `older_than_days` into
+        chat_log_snapshots, compressed server-side (COMPRESS), one id range per batch.
+        Progress is kept in job_state; GET_LOCK keeps concurrent workers out.
+        Returns the number of snapshots archived.
         """
         conn = None
         cursor = None
-        
+        archived = 0
+
         try:
             conn = self.get_insights_connection()
             if not conn:
-                return False
-            
+                return 0
             cursor = conn.cursor()
-            
-    
-            insert_query = """
+            cursor.execute("SELECT GET_LOCK('chat_snapshot_archive', 0)")
+            if not cursor.fetchone()[0]:
+                return 0
+
+            try:
+                cursor.execute("SELECT value FROM job_state WHERE name = 'chat_snapshot_archive:last_id'")
+                row = cursor.fetchone()
+                last_id = int(row[0]) if row else 0
+                while True:
+                    # Next PK range; it ends before the first row that is still recent
+                    cursor.execute(
+                        """
+                        SELECT MAX(id), MIN(CASE WHEN timestamp >= NOW() - INTERVAL %s DAY THEN id END)
+                        FROM (SELECT id, timestamp FROM chat_logs WHERE id > %s ORDER BY id LIMIT %s) batch
+                        """,
+                        (older_than_days, last_id, batch_size)
+                    )
+                    max_id, first_recent = cursor.fetchone()
+                    end_id = first_recent - 1 if first_recent else max_id
+                    if not end_id or end_id <= last_id:
+                        break
+
+                    cursor.execute(
+                        """
+                        INSERT IGNORE INTO chat_log_snapshots (log_id, snapshot)
+                        SELECT id, COMPRESS(context_snapshot) FROM chat_logs
+                        WHERE id > %s AND id <= %s AND context_snapshot IS NOT NULL
+                        """,
+                        (last_id, end_id)
+                    )
+                    archived += cursor.rowcount
+                    cursor.execute(
+                        "UPDATE chat_logs SET context_snapshot = NULL WHERE id > %s AND id <= %s AND context_snapshot IS NOT NULL",
+                        (last_id, end_id)
+                    )
+                    cursor.execute(
+                        """
+                        INSERT INTO job_state (name, value) VALUES ('chat_snapshot_archive:last_id', %s)
+                        ON DUPLICATE KEY UPDATE value = VALUES(value)
+                        """,
+                        (str(end_id),)
+                    )
+                    conn.commit()
+                    last_id = end_id
+                    if first_recent:
+                        break
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK('chat_snapshot_archive')")
+                cursor.fetchone()
+
+            if archived:
+                logger.info(f"Archived {archived} chat context snapshots")
+            return archived
+
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+
+    def fetch_chat_snapshot(self, user_id: int, log_id: int) -> Optional[Dict]:
+        """
+        The context a chat answer was generated from, whether still inline or archived.
+        Returns {'snapshot': context or None if there is no such log}, None if insightsdb is unavailable
+        """
+        conn = None
+        cursor = None
+
+        try:
+            conn = self.get_insights_connection()
+            if not conn:
+                return None
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT COALESCE(l.context_snapshot, CAST(UNCOMPRESS(s.snapshot) AS CHAR))
+                FROM chat_logs l
+                LEFT JOIN chat_log_snapshots s ON s.log_id = l.id
+                WHERE l.id = %s AND l.user_id = %s
+                """,
+                (log_id, user_id)
+            )
+            row = cursor.fetchone()
+            return {'snapshot': json.loads(row[0]) if row and row[0] else None}
+
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+
+    @staticmethod
+    def chat_log_row(user_id: int, query: str, response: str, context: str) -> Dict[str, Any]:
+        """A chat_logs row as queued by ChatLogWriter (timestamp set when the turn happened)"""
+        # Safely serialize the context to JSON
+        context_json = json.dumps({
+            "preview": context[:500] + "..." if len(context) > 500 else context
+        })
+        return {
+            "user_id": user_id,
+            "user_query": query,
+            "ai_response": response,
+            "context_snapshot": context_json,
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+    def save_chat_logs(self, rows: List[Dict]) -> int:
+        """
+        Multi-row INSERT of chat_log_row() dicts in one round trip and one commit.
+        Raises on failure so the caller can keep (spill) the rows.
+        """
+        if not rows:
+            return 0
+        conn = None
+        cursor = None
+
+        try:
+            conn = self.get_insights_connection()
+            cursor = conn.cursor()
+            cursor.executemany(
+                """
                 INSERT INTO chat_logs 
-                (user_id, user_query, ai_response, context_snapshot)
-                VALUES (%s, %s, %s, %s)
-            """
-            
-            # Safely serialize the context to JSON
-            context_json = json.dumps({
-                "preview": context[:500] + "..." if len(context) > 500 else context
-            })
-            
-            cursor.execute(insert_query, (user_id, query, response, context_json))
+                (user_id, user_query, ai_response, context_snapshot, timestamp)
+                VALUES (%s, %s, %s, %s, %s)
+                """,
+                [(r['user_id'], r['user_query'], r['ai_response'], r['context_snapshot'], r['timestamp']) for r in rows]
+            )
             conn.commit()
-            
-            logger.info(f"Saved chat log for user {user_id}")
+            logger.info(f"Saved {len(rows)} chat logs")
+            return len(rows)
+
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+
+    def save_chat_log(self, user_id: int, query: str, response: str, context: str) -> bool:
+        """
+        Save a single chat log to 'insightsdb' synchronously (the API queues through ChatLogWriter)
+        """
+        try:
+            self.save_chat_logs([self.chat_log_row(user_id, query, response, context)])
             return True
-            
         except Exception as e:
             logger.error(f"Failed to save chat log: {e}")
             return False
-            
+
+    def fetch_chat_summary(self, user_id: int) -> Optional[Dict]:
+        """
+        Rolling summary of a user's older chat turns: {'summary': str, 'last_log_id': int}
+        """
+        conn = None
+        cursor = None
+
+        try:
+            conn = self.get_insights_connection()
+            if not conn:
+                return None
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("SELECT summary, last_log_id FROM chat_summaries WHERE user_id = %s", (user_id,))
+            return cursor.fetchone()
+
+        except Exception as e:
+            logger.error(f"Failed to fetch chat summary: {e}")
+            return None
+
         finally:
             if cursor: cursor.close()
             if conn: conn.close()
-    def fetch_budgets_status(self, user_id: int):
+
+    def save_chat_summary(self, user_id: int, summary: str, last_log_id: int) -> bool:
+        conn = None
+        cursor = None
+
+        try:
+            conn = self.get_insights_connection()
+            if not conn:
+                return False
+            cursor = conn.cursor()
+            # Never move the watermark backwards if two requests race
+            cursor.execute(
+                """
+                INSERT INTO chat_summaries (user_id, summary, last_log_id) VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    summary = IF(VALUES(last_log_id) > last_log_id, VALUES(summary), summary),
+                    last_log_id = GREATEST(last_log_id, VALUES(last_log_id))
+                """,
+                (user_id, summary, last_log_id)
+            )
+            conn.commit()
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to save chat summary: {e}")
+            return False
+
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+
+    def fetch_budget_totals(self, user_id: Optional[int] = None, budget_id: Optional[int] = None) -> List[Dict]:
         """
-        Fetches active budgets and calculates spending progress based on start/end dates.
+        Currently active budgets with the EXPENSE total of their category and date range.
+        One grouped pass for a user, a single budget, or (neither) every user, used to
+        seed and reconcile BudgetTracker rather than on every request.
         """
         conn = None
         cursor = None
-        
+
         try:
             conn = self.get_finance_connection()
             cursor = conn.cursor(dictionary=True)
-            
-            # Updated Query for your specific schema
+
             query = """
                 SELECT 
                     b.id,
+                    b.user_id,
+                    b.category_id,
                     c.name as category_name,
                     b.amount_limit,
                     b.alert_threshold,
                     b.period,
                     b.start_date,
                     b.end_date,
-                    COALESCE(SUM(t.amount), 0) as spent,
-                    (b.amount_limit - COALESCE(SUM(t.amount), 0)) as remaining
+                    COALESCE(SUM(t.amount), 0) as spent
                 FROM budgets b
                 JOIN categories c ON b.category_id = c.id
                 LEFT JOIN transactions t ON 
                     b.category_id = t.category_id 
                     AND t.user_id = b.user_id
                     AND t.type = 'EXPENSE'
-                    AND t.occurred_at BETWEEN b.start_date AND b.end_date
-                WHERE b.user_id = %s
-                  AND CURRENT_DATE BETWEEN b.start_date AND b.end_date -- Only fetch currently active budgets
-                GROUP BY b.id, c.name, b.amount_limit, b.alert_threshold, b.period, b.start_date, b.end_date
+                    AND t.occurred_at >= b.start_date
+                    AND t.occurred_at < b.end_date + INTERVAL 1 DAY
+                WHERE CURRENT_DATE BETWEEN b.start_date AND b.end_date
             """
-            
-            cursor.execute(query, (user_id,))
-            results = cursor.fetchall()
-            
-            # Process results for the frontend
-            for row in results:
-                row['spent'] = float(row['spent'])
-                row['amount_limit'] = float(row['amount_limit'])
-                row['alert_threshold'] = float(row['alert_threshold']) # e.g., 0.80
-                
-                # Calculate percentages
-                if row['amount_limit'] > 0:
-                    row['percent'] = (row['spent'] / row['amount_limit']) * 100
-                else:
-                    row['percent'] = 0
-                
-                # Logic: 
-                # 1. Over Budget (> 100%) -> RED
-                # 2. Near Limit (> 80%) -> YELLOW/ORANGE
-                # 3. Safe -> BLUE
-                row['is_over_budget'] = row['spent'] > row['amount_limit']
-                row['is_warning'] = row['percent'] >= (row['alert_threshold'] * 100) and not row['is_over_budget']
-                
-            return results
+            params = []
+            if user_id is not None:
+                query += " AND b.user_id = %s"
+                params.append(user_id)
+            if budget_id is not None:
+                query += " AND b.id = %s"
+                params.append(budget_id)
+            query += """
+                GROUP BY b.id, b.user_id, b.category_id, c.name, b.amount_limit, b.alert_threshold, b.period, b.start_date, b.end_date
+                ORDER BY b.user_id
+            """
+
+            cursor.execute(query, tuple(params))
+            return cursor.fetchall()
+
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+
+    def insert_alerts(self, alerts: List[Dict]) -> int:
+        """
+        Bulk insert into financedb.alerts: [{'user_id', 'type', 'message'}, ...]
+        """
+        if not alerts:
+            return 0
+        conn = None
+        cursor = None
+
+        try:
+            conn = self.get_finance_connection()
+            cursor = conn.cursor()
+            cursor.executemany(
+                "INSERT INTO alerts (user_id, type, message) VALUES (%s, %s, %s)",
+                [(a['user_id'], a['type'], a['message']) for a in alerts]
+            )
+            conn.commit()
+            return cursor.rowcount
+
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+
+    def fetch_transaction(self, transaction_id: int) -> Optional[Dict]:
+        """
+        Fetch a single transaction by primary key (used to resolve queue events)
+        """
+        conn = None
+        cursor = None
+
+        try:
+            conn = self.get_finance_connection()
+            cursor = conn.cursor(dictionary=True)
+
+            query = """
+                SELECT 
+                    t.id,
+                    t.user_id,
+                    t.occurred_at,
+                    t.description,
+                    t.amount,
+                    t.type,
+                    t.category_id,
+                    COALESCE(c.name, 'Uncategorized') as category_name,
+                    COALESCE(m.name, 'Unknown Merchant') as merchant_name
+                FROM transactions t
+                LEFT JOIN categories c ON t.category_id = c.id
+                LEFT JOIN merchants m ON t.merchant_id = m.id
+                WHERE t.id = %s
+            """
+
+            cursor.execute(query, (transaction_id,))
+            return cursor.fetchone()
 
         except Exception as e:
-            logger.error(f"Error fetching budget status: {e}")
+            logger.error(f"Error fetching transaction {transaction_id}: {e}")
+            return None
+
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+
+    def iter_transactions(self, days: int, user_id: Optional[int] = None, user_ids: Optional[List[int]] = None, batch_size: int = 5000) -> Iterator[Dict]:
+        """
+        Streams transactions of the last `days` days ordered by user, without LIMIT.
+        Rows are fetched in batches so memory stays flat for bulk passes.
+        """
+        conn = None
+        cursor = None
+
+        try:
+            conn = self.get_finance_connection()
+            cursor = conn.cursor(dictionary=True)
+
+            query = """
+                SELECT 
+                    t.id,
+                    t.user_id,
+                    t.occurred_at,
+                    t.description,
+                    t.amount,
+                    t.type,
+                    t.category_id,
+                    COALESCE(c.name, 'Uncategorized') as category_name,
+                    COALESCE(m.name, 'Unknown Merchant') as merchant_name
+                FROM transactions t
+                LEFT JOIN categories c ON t.category_id = c.id
+                LEFT JOIN merchants m ON t.merchant_id = m.id
+                WHERE t.occurred_at >= DATE_SUB(NOW(), INTERVAL %s DAY)
+            """
+            params = [days]
+            if user_id is not None:
+                query += " AND t.user_id = %s"
+                params.append(user_id)
+            if user_ids:
+                query += f" AND t.user_id IN ({', '.join(['%s'] * len(user_ids))})"
+                params.extend(user_ids)
+            query += " ORDER BY t.user_id, t.occurred_at"
+
+            cursor.execute(query, tuple(params))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+
+    def iter_user_windows(self, user_ids: List[int], days: int = 30, chunk_users: int = 1000,
+                          batch_size: int = 5000) -> Iterator[Tuple[int, List[Dict]]]:
+        """
+        (user_id, rows) for every requested user, in user id order, from one set-based query
+        per `chunk_users` users. Rows are the user's whole window, oldest first, each with
+        `recency` (1 = newest) from ROW_NUMBER() so callers can take the same newest-50
+        sample fetch_transactions() returns. Users without transactions get an empty list.
+        Only one user's rows are held at a time.
+        """
+        user_ids = sorted(set(user_ids))
+        for i in range(0, len(user_ids), chunk_users):
+            chunk = user_ids[i:i + chunk_users]
+            conn = None
+            cursor = None
+            try:
+                conn = self.get_finance_connection()
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute(f"""
+                    SELECT
+                        t.id,
+                        t.user_id,
+                        t.occurred_at,
+                        t.description,
+                        t.amount,
+                        t.type,
+                        t.currency,
+                        t.category_id,
+                        t.merchant_id,
+                        COALESCE(c.name, 'Uncategorized') as category_name,
+                        COALESCE(m.name, 'Unknown Merchant') as merchant_name,
+                        ROW_NUMBER() OVER (PARTITION BY t.user_id ORDER BY t.occurred_at DESC, t.id DESC) AS recency
+                    FROM transactions t
+                    LEFT JOIN categories c ON t.category_id = c.id
+                    LEFT JOIN merchants m ON t.merchant_id = m.id
+                    WHERE t.user_id IN ({', '.join(['%s'] * len(chunk))})
+                      AND t.occurred_at >= DATE_SUB(NOW(), INTERVAL %s DAY)
+                    ORDER BY t.user_id, t.occurred_at, t.id
+                """, tuple(chunk) + (days,))
+
+                pending = iter(chunk)
+                current_user, rows = None, []
+                while True:
+                    batch = cursor.fetchmany(batch_size)
+                    if not batch:
+                        break
+                    for row in batch:
+                        if row['user_id'] != current_user:
+                            if current_user is not None:
+                                yield current_user, rows
+                            # Requested users with no rows in between
+                            for user_id in pending:
+                                if user_id == row['user_id']:
+                                    break
+                                yield user_id, []
+                            current_user, rows = row['user_id'], []
+                        rows.append(row)
+                if current_user is not None:
+                    yield current_user, rows
+                for user_id in pending:
+                    yield user_id, []
+
+            finally:
+                if cursor: cursor.close()
+                if conn: conn.close()
+
+    def fetch_user_labels(self, user_id: int) -> Dict[str, List[str]]:
+        """
+        Names a user's questions can refer to: their categories and the merchants they
+        have transactions with.
+        """
+        conn = None
+        cursor = None
+
+        try:
+            conn = self.get_finance_connection()
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT DISTINCT name FROM categories WHERE user_id = %s OR user_id IS NULL", (user_id,)
+            )
+            categories = [row[0] for row in cursor.fetchall()]
+            cursor.execute("""
+                SELECT DISTINCT m.name
+                FROM transactions t
+                JOIN merchants m ON t.merchant_id = m.id
+                WHERE t.user_id = %s
+            """, (user_id,))
+            merchants = [row[0] for row in cursor.fetchall()]
+            return {"categories": categories, "merchants": merchants}
+
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+
+    def aggregate_transactions(self, user_id: int, start: date, end: date, tx_type: Optional[str] = None,
+                               category: Optional[str] = None, merchant: Optional[str] = None,
+                               group_by: Optional[str] = None, limit: int = 5) -> List[Dict]:
+        """
+        SUM/COUNT of a user's transactions between two dates (inclusive), optionally filtered
+        by type, category name and merchant name. group_by: None (one totals row per type),
+        'category' or 'merchant' (top `limit` groups by total).
+        Rows: {'label', 'type', 'total', 'count'}.
+        """
+        group_columns = {
+            None: "t.type",
+            "category": "COALESCE(c.name, 'Uncategorized')",
+            "merchant": "COALESCE(m.name, 'Unknown Merchant')",
+        }
+        if group_by not in group_columns:
+            raise ValueError(f"Unsupported group_by: {group_by}")
+
+        conn = None
+        cursor = None
+
+        try:
+            conn = self.get_finance_connection()
+            cursor = conn.cursor(dictionary=True)
+
+            query = f"""
+                SELECT
+                    {group_columns[group_by]} AS label,
+                    t.type,
+                    SUM(t.amount) AS total,
+                    COUNT(*) AS count
+                FROM transactions t
+                LEFT JOIN categories c ON t.category_id = c.id
+                LEFT JOIN merchants m ON t.merchant_id = m.id
+                WHERE t.user_id = %s
+                  AND t.occurred_at >= %s
+                  AND t.occurred_at < %s + INTERVAL 1 DAY
+            """
+            params: List[Any] = [user_id, start, end]
+            if tx_type:
+                query += " AND t.type = %s"
+                params.append(tx_type)
+            if category:
+                query += " AND c.name = %s"
+                params.append(category)
+            if merchant:
+                query += " AND m.name = %s"
+                params.append(merchant)
+            query += " GROUP BY label, t.type"
+            if group_by:
+                query += " ORDER BY total DESC LIMIT %s"
+                params.append(limit)
+
+            cursor.execute(query, tuple(params))
+            return cursor.fetchall()
+
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+
+    def fetch_largest_transactions(self, user_id: int, start: date, end: date, tx_type: str = "EXPENSE",
+                                   category: Optional[str] = None, merchant: Optional[str] = None,
+                                   limit: int = 1) -> List[Dict]:
+        """A user's largest transactions of one type between two dates (inclusive)"""
+        conn = None
+        cursor = None
+
+        try:
+            conn = self.get_finance_connection()
+            cursor = conn.cursor(dictionary=True)
+
+            query = """
+                SELECT
+                    t.occurred_at,
+                    t.description,
+                    t.amount,
+                    COALESCE(c.name, 'Uncategorized') as category_name,
+                    COALESCE(m.name, 'Unknown Merchant') as merchant_name
+                FROM transactions t
+                LEFT JOIN categories c ON t.category_id = c.id
+                LEFT JOIN merchants m ON t.merchant_id = m.id
+                WHERE t.user_id = %s
+                  AND t.type = %s
+                  AND t.occurred_at >= %s
+                  AND t.occurred_at < %s + INTERVAL 1 DAY
+            """
+            params: List[Any] = [user_id, tx_type, start, end]
+            if category:
+                query += " AND c.name = %s"
+                params.append(category)
+            if merchant:
+                query += " AND m.name = %s"
+                params.append(merchant)
+            query += " ORDER BY t.amount DESC LIMIT %s"
+            params.append(limit)
+
+            cursor.execute(query, tuple(params))
+            return cursor.fetchall()
+
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+
+    def fetch_transaction_window(self, user_id: int, days: int = 30) -> List[Dict]:
+        """
+        All of a user's transactions in the window (no LIMIT), for analytics
+        """
+        try:
+            return list(self.iter_transactions(days, user_id=user_id))
+        except Exception as e:
+            logger.error(f"Error fetching transaction window: {e}")
             return []
-            
+
+    def fetch_active_user_ids(self, days: int = 30, since_id: Optional[int] = None) -> List[int]:
+        """
+        Users with transactions in the window, or (since_id) with transactions newer than that id
+        """
+        conn = None
+        cursor = None
+
+        try:
+            conn = self.get_finance_connection()
+            cursor = conn.cursor()
+            if since_id is not None:
+                cursor.execute("SELECT DISTINCT user_id FROM transactions WHERE id > %s", (since_id,))
+            else:
+                cursor.execute(
+                    "SELECT DISTINCT user_id FROM transactions WHERE occurred_at >= DATE_SUB(NOW(), INTERVAL %s DAY)",
+                    (days,)
+                )
+            return [row[0] for row in cursor.fetchall()]
+
+        except Exception as e:
+            logger.error(f"Error fetching active users: {e}")
+            return []
+
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+
+    def fetch_max_transaction_id(self) -> int:
+        conn = None
+        cursor = None
+
+        try:
+            conn = self.get_finance_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM transactions")
+            return int(cursor.fetchone()[0])
+
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+
+    def fetch_recurring_rules(self, user_ids: List[int]) -> List[Dict]:
+        """Existing recurring_rules (active or not) of these users"""
+        if not user_ids:
+            return []
+        conn = None
+        cursor = None
+
+        try:
+            conn = self.get_finance_connection()
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(
+                f"""
+                SELECT id, user_id, category_id, merchant_id, amount, frequency, next_due_date, is_active
+                FROM recurring_rules
+                WHERE user_id IN ({', '.join(['%s'] * len(user_ids))})
+                ORDER BY id
+                """,
+                tuple(user_ids)
+            )
+            return cursor.fetchall()
+
         finally:
             if cursor: cursor.close()
-            if conn: conn.close()
\ No newline at end of file
+            if conn: conn.close()
+
+    def save_recurring_rules(self, updates: List[Dict], inserts: List[Dict]) -> int:
+        """
+        One transaction: updates existing rules by id and inserts new ones.
+        Rule dicts: {'id' (updates), 'user_id', 'category_id', 'merchant_id', 'amount',
+        'frequency', 'next_due_date', 'is_active'}.
+        """
+        if not updates and not inserts:
+            return 0
+        conn = None
+        cursor = None
+
+        try:
+            conn = self.get_finance_connection()
+            cursor = conn.cursor()
+            if updates:
+                cursor.executemany(
+                    """
+                    UPDATE recurring_rules
+                    SET category_id = %s, amount = %s, frequency = %s, next_due_date = %s, is_active = %s
+                    WHERE id = %s
+                    """,
+                    [(r['category_id'], r['amount'], r['frequency'], r['next_due_date'], r['is_active'], r['id'])
+                     for r in updates]
+                )
+            if inserts:
+                cursor.executemany(
+                    """
+                    INSERT INTO recurring_rules (user_id, category_id, merchant_id, amount, frequency, next_due_date, is_active)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    """,
+                    [(r['user_id'], r['category_id'], r['merchant_id'], r['amount'], r['frequency'],
+                      r['next_due_date'], r['is_active']) for r in inserts]
+                )
+            conn.commit()
+            return len(updates) + len(inserts)
+
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+
+    def fetch_overdue_recurring_user_ids(self, grace_days: int = 7) -> List[int]:
+        """Users with an active rule whose payment is more than `grace_days` late"""
+        conn = None
+        cursor = None
+
+        try:
+            conn = self.get_finance_connection()
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT DISTINCT user_id FROM recurring_rules
+                WHERE is_active AND next_due_date < CURDATE() - INTERVAL %s DAY
+                """,
+                (grace_days,)
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+
+    def fetch_upcoming_bills(self, user_id: int, days: int = 14) -> List[Dict]:
+        """
+        Active recurring payments due in the next `days` days (or overdue), soonest first
+        """
+        return self.fetch_upcoming_bills_many([user_id], days).get(user_id, [])
+
+    def fetch_upcoming_bills_many(self, user_ids: List[int], days: int = 14) -> Dict[int, List[Dict]]:
+        """
+        fetch_upcoming_bills() for a batch of users in one query: {user_id: [bills...]},
+        users without upcoming bills are left out
+        """
+        if not user_ids:
+            return {}
+        conn = None
+        cursor = None
+
+        try:
+            conn = self.get_finance_connection()
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(
+                f"""
+                SELECT
+                    r.user_id,
+                    r.amount,
+                    r.frequency,
+                    r.next_due_date,
+                    COALESCE(m.name, c.name, 'Unknown') AS name
+                FROM recurring_rules r
+                LEFT JOIN merchants m ON r.merchant_id = m.id
+                LEFT JOIN categories c ON r.category_id = c.id
+                WHERE r.user_id IN ({', '.join(['%s'] * len(user_ids))})
+                  AND r.is_active
+                  AND r.next_due_date <= CURDATE() + INTERVAL %s DAY
+                ORDER BY r.user_id, r.next_due_date
+                """,
+                tuple(user_ids) + (days,)
+            )
+            bills: Dict[int, List[Dict]] = {}
+            for row in cursor.fetchall():
+                bills.setdefault(row.pop('user_id'), []).append(row)
+            return bills
+
+        except Exception as e:
+            logger.error(f"Error fetching upcoming bills: {e}")
+            return {}
+
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+
+    def get_job_state(self, name: str) -> Optional[str]:
+        """
+        Read a background job's watermark from insightsdb.job_state
+        """
+        conn = None
+        cursor = None
+
+        try:
+            conn = self.get_insights_connection()
+            if not conn:
+                return None
+            cursor = conn.cursor()
+            cursor.execute("SELECT value FROM job_state WHERE name = %s", (name,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+        except Exception as e:
+            logger.error(f"Failed to read job state '{name}': {e}")
+            return None
+
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+
+    def set_job_state(self, name: str, value: str) -> bool:
+        conn = None
+        cursor = None
+
+        try:
+            conn = self.get_insights_connection()
+            if not conn:
+                return False
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                INSERT INTO job_state (name, value) VALUES (%s, %s)
+                ON DUPLICATE KEY UPDATE value = VALUES(value)
+                """,
+                (name, value)
+            )
+            conn.commit()
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to save job state '{name}': {e}")
+            return False
+
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+
+    def pool_stats(self) -> Dict:
+        """
+        Returns checkout metrics for both connection pools
+        """
+        return {
+            'finance': self.finance_pool.stats(),
+            'insights': self.insights_pool.stats()
+        }
+
+    def warm_up(self, connections: int = 2) -> Dict:
+        """
+        Opens a few connections in each pool so the first requests don't pay for the handshake.
+        Raises if a database is unreachable.
+        """
+        return {
+            'finance': self.finance_pool.warm(connections),
+            'insights': self.insights_pool.warm(connections)
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.finance_pool.close_all()
+        self.insights_pool.close_all()
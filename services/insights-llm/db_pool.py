@@ -0,0 +1,213 @@
+import time
+import queue
+import threading
+import logging
+import mysql.connector
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+# Put on the idle queue when a connection is dropped, so a waiting thread opens a replacement
+_FREED = (None, 0.0)
+
+
+class PoolExhausted(Exception):
+    """Raised when no connection could be checked out within the timeout"""
+
+
+class PooledConnection:
+    """
+    Thin wrapper around a mysql connection.
+    close() hands the connection back to its pool instead of closing the socket,
+    so existing `finally: conn.close()` code keeps working unchanged.
+    """
+
+    def __init__(self, pool: "ConnectionPool", conn, created_at: float):
+        self._pool = pool
+        self._conn = conn
+        self.created_at = created_at
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        self._pool.release(self)
+
+
+class ConnectionPool:
+    """
+    Fixed-size MySQL connection pool.
+
+    - Connections are created lazily up to `size`.
+    - Every checkout pings the connection; dead ones are replaced.
+    - Connections older than `recycle` seconds are closed and reopened.
+    - Checkout latency, waits and timeouts are tracked for metrics.
+    """
+
+    def __init__(self, name: str, config: Dict, size: int = 5, recycle: int = 1800, timeout: float = 5.0):
+        self.name = name
+        self.config = config
+        self.size = size
+        self.recycle = recycle
+        self.timeout = timeout
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._freed = 0
+
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._recycled = 0
+        self._failed_health_checks = 0
+        self._checkout_time_total = 0.0
+        self._checkout_time_max = 0.0
+
+        logger.info(f"Connection pool '{name}' initialized (size={size}, recycle={recycle}s)")
+
+    def _open(self):
+        conn = mysql.connector.connect(**self.config)
+        return conn, time.monotonic()
+
+    def _is_healthy(self, conn) -> bool:
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn, wake: bool = False):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._created -= 1
+            if wake:
+                self._freed += 1
+        if wake:
+            self._idle.put(_FREED)
+
+    def get_connection(self) -> PooledConnection:
+        started = time.monotonic()
+        waited = False
+
+        while True:
+            try:
+                conn, created_at = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_open = self._created < self.size
+                    if can_open:
+                        self._created += 1
+                if can_open:
+                    try:
+                        conn, created_at = self._open()
+                    except Exception:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                else:
+                    waited = True
+                    remaining = self.timeout - (time.monotonic() - started)
+                    try:
+                        conn, created_at = self._idle.get(timeout=max(remaining, 0))
+                    except queue.Empty:
+                        with self._lock:
+                            self._timeouts += 1
+                        raise PoolExhausted(f"Pool '{self.name}' exhausted after {self.timeout}s")
+
+            if conn is None:
+                # A slot was freed by a dropped connection: loop back and open one
+                with self._lock:
+                    self._freed -= 1
+                continue
+
+            # Recycle connections that lived too long (MySQL wait_timeout, failovers)
+            if self.recycle and time.monotonic() - created_at > self.recycle:
+                self._discard(conn, wake=True)
+                with self._lock:
+                    self._recycled += 1
+                continue
+
+            if not self._is_healthy(conn):
+                self._discard(conn, wake=True)
+                with self._lock:
+                    self._failed_health_checks += 1
+                continue
+
+            break
+
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            if waited:
+                self._waits += 1
+            self._checkout_time_total += elapsed
+            self._checkout_time_max = max(self._checkout_time_max, elapsed)
+
+        return PooledConnection(self, conn, created_at)
+
+    def release(self, pooled: PooledConnection):
+        conn = pooled._conn
+        with self._lock:
+            self._in_use -= 1
+
+        try:
+            # Never hand out a connection with an open transaction
+            if conn.in_transaction:
+                conn.rollback()
+        except Exception:
+            self._discard(conn, wake=True)
+            return
+
+        self._idle.put((conn, pooled.created_at))
+
+    def warm(self, count: int) -> int:
+        """Opens up to `count` connections ahead of traffic; returns how many are idle afterwards"""
+        held = []
+        try:
+            for _ in range(min(count, self.size)):
+                held.append(self.get_connection())
+        finally:
+            for pooled in held:
+                pooled.close()
+        return len(held)
+
+    def close_all(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if conn is None:
+                with self._lock:
+                    self._freed -= 1
+                continue
+            self._discard(conn)
+        logger.info(f"Connection pool '{self.name}' closed")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            avg = self._checkout_time_total / self._checkouts if self._checkouts else 0.0
+            return {
+                "name": self.name,
+                "size": self.size,
+                "open": self._created,
+                "in_use": self._in_use,
+                "idle": self._idle.qsize() - self._freed,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "recycled": self._recycled,
+                "failed_health_checks": self._failed_health_checks,
+                "checkout_ms_avg": round(avg * 1000, 3),
+                "checkout_ms_max": round(self._checkout_time_max * 1000, 3),
+            }
@@ -0,0 +1,130 @@
+import json
+import asyncio
+import logging
+import aio_pika
+from typing import Dict, List, Callable, Awaitable
+
+logger = logging.getLogger(__name__)
+
+EventHandler = Callable[[Dict], Awaitable[None]]
+
+
+class EventConsumer:
+    """
+    Consumes the JSON events other services publish to RabbitMQ
+    (e.g. 'transaction_events' from the transactions service).
+
+    Handlers are registered per queue and receive the decoded event:
+    {"type": "TRANSACTION_CREATED", "data": {...}, "timestamp": "..."}
+
+    Those queues are shared by every worker, so each event reaches one process.
+    State each process keeps for itself is invalidated through broadcast exchanges
+    instead: every worker binds its own exclusive queue to the fanout exchange, and
+    broadcast() reaches all of them (the publishing worker included).
+    """
+
+    def __init__(self, rabbit_url: str, retry_delay: float = 5.0):
+        self.rabbit_url = rabbit_url
+        self.retry_delay = retry_delay
+        self.handlers: Dict[str, List[EventHandler]] = {}
+        self.broadcast_handlers: Dict[str, List[EventHandler]] = {}
+        self._connection = None
+        self._exchanges: Dict[str, aio_pika.abc.AbstractExchange] = {}
+        self._task = None
+
+        self.processed = 0
+        self.failed = 0
+        self.broadcasts = 0
+        self.broadcast_failures = 0
+
+    def subscribe(self, queue_name: str, handler: EventHandler):
+        self.handlers.setdefault(queue_name, []).append(handler)
+
+    def subscribe_broadcast(self, exchange_name: str, handler: EventHandler):
+        self.broadcast_handlers.setdefault(exchange_name, []).append(handler)
+
+    async def _dispatch(self, queue_name: str, handlers: List[EventHandler], message: aio_pika.abc.AbstractIncomingMessage):
+        async with message.process(requeue=False, ignore_processed=True):
+            try:
+                event = json.loads(message.body)
+            except ValueError:
+                logger.warning(f"[{queue_name}] Dropping malformed event")
+                return
+
+            for handler in handlers:
+                try:
+                    await handler(event)
+                except Exception as e:
+                    self.failed += 1
+                    logger.error(f"[{queue_name}] Handler {handler.__name__} failed on {event.get('type')}: {e}")
+            self.processed += 1
+
+    async def _run(self):
+        # Same retry behaviour as the Node publishers: keep trying every few seconds
+        while True:
+            try:
+                logger.info("[Insights] Connecting to RabbitMQ...")
+                self._connection = await aio_pika.connect_robust(self.rabbit_url)
+                channel = await self._connection.channel()
+                await channel.set_qos(prefetch_count=50)
+
+                # Declared first: handlers of the shared queues broadcast as soon as they run
+                for exchange_name in self.broadcast_handlers:
+                    exchange = await channel.declare_exchange(exchange_name, aio_pika.ExchangeType.FANOUT, durable=True)
+                    # Server-named, exclusive to this connection: deleted with the worker
+                    queue = await channel.declare_queue(exclusive=True, auto_delete=True)
+                    await queue.bind(exchange)
+                    await queue.consume(lambda msg, q=exchange_name: self._dispatch(q, self.broadcast_handlers[q], msg))
+                    self._exchanges[exchange_name] = exchange
+                    logger.info(f"[Insights] Listening to broadcasts on '{exchange_name}'")
+
+                for queue_name in self.handlers:
+                    # amqplib's assertQueue() declares durable queues by default
+                    queue = await channel.declare_queue(queue_name, durable=True)
+                    await queue.consume(lambda msg, q=queue_name: self._dispatch(q, self.handlers[q], msg))
+                    logger.info(f"[Insights] Consuming '{queue_name}'")
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[Insights] Failed to connect to RabbitMQ: {e}. Retrying in {self.retry_delay}s")
+                await asyncio.sleep(self.retry_delay)
+
+    async def broadcast(self, exchange_name: str, event: Dict) -> bool:
+        """
+        Publishes to every worker's queue on the exchange. Returns False when that was not
+        possible (not connected yet); the caller then has to act on the event locally.
+        """
+        exchange = self._exchanges.get(exchange_name)
+        if exchange is None:
+            self.broadcast_failures += 1
+            return False
+        try:
+            await exchange.publish(aio_pika.Message(body=json.dumps(event).encode()), routing_key="")
+        except Exception as e:
+            self.broadcast_failures += 1
+            logger.warning(f"[{exchange_name}] Broadcast of {event.get('type')} failed: {e}")
+            return False
+        self.broadcasts += 1
+        return True
+
+    def start(self):
+        if (self.handlers or self.broadcast_handlers) and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self._exchanges.clear()
+        if self._connection:
+            await self._connection.close()
+            self._connection = None
+
+    def stats(self) -> Dict:
+        return {
+            "processed": self.processed,
+            "failed": self.failed,
+            "broadcasts": self.broadcasts,
+            "broadcast_failures": self.broadcast_failures,
+        }
@@ -0,0 +1,131 @@
+"""
+Local stand-in for the Gemini generateContent / streamGenerateContent endpoints.
+
+    uvicorn fake_gemini:app --port 8200
+    GEMINI_BASE_URL=http://localhost:8200/v1beta uvicorn app:app
+
+Behaviour is set with env vars (or per request with ?latency=&error_rate=&throttle_rate=):
+    FAKE_GEMINI_LATENCY        mean seconds before answering (default 0.3)
+    FAKE_GEMINI_JITTER         +/- fraction of the latency (default 0.5)
+    FAKE_GEMINI_SLOW_RATE      fraction of requests that take 10x longer (default 0.02)
+    FAKE_GEMINI_ERROR_RATE     fraction answered with 503 (default 0)
+    FAKE_GEMINI_THROTTLE_RATE  fraction answered with 429 + Retry-After (default 0)
+    FAKE_GEMINI_CHUNKS         number of SSE chunks per streamed answer (default 8)
+"""
+import os
+import json
+import random
+import asyncio
+from typing import Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Fake Gemini")
+
+LATENCY = float(os.getenv("FAKE_GEMINI_LATENCY", 0.3))
+JITTER = float(os.getenv("FAKE_GEMINI_JITTER", 0.5))
+SLOW_RATE = float(os.getenv("FAKE_GEMINI_SLOW_RATE", 0.02))
+ERROR_RATE = float(os.getenv("FAKE_GEMINI_ERROR_RATE", 0))
+THROTTLE_RATE = float(os.getenv("FAKE_GEMINI_THROTTLE_RATE", 0))
+CHUNKS = int(os.getenv("FAKE_GEMINI_CHUNKS", 8))
+
+DASHBOARD = {
+    "initial_message": "Welcome back! Your spending is on track this month.",
+    "summary_cards": [
+        {"id": 1, "type": "success", "title": "Net savings", "subtitle": "2.500.000 đ", "badge": "GOOD"},
+        {"id": 2, "type": "warning", "title": "Dining out", "subtitle": "1.200.000 đ", "badge": "WATCH"},
+    ],
+    "smart_insights": [
+        {"id": 1, "type": "info", "title": "Groceries", "desc": "Groceries are your largest expense at 3,100,000 VND."},
+    ],
+    "prediction": {"amount": 1800000, "confidence": 70, "label": "Expected spending next week"},
+}
+
+stats = {"requests": 0, "errors": 0, "throttled": 0}
+
+
+def _prompt_text(body: dict) -> str:
+    parts = [p.get("text", "") for c in body.get("contents", []) for p in c.get("parts", [])]
+    parts += [p.get("text", "") for p in (body.get("systemInstruction") or {}).get("parts", [])]
+    return "".join(parts)
+
+
+def _usage(body: dict, answer: str) -> dict:
+    prompt_tokens = len(_prompt_text(body)) // 4
+    output_tokens = len(answer) // 4
+    return {"promptTokenCount": prompt_tokens, "candidatesTokenCount": output_tokens,
+            "totalTokenCount": prompt_tokens + output_tokens}
+
+
+def _answer(body: dict) -> str:
+    if (body.get("generationConfig") or {}).get("responseMimeType") == "application/json":
+        return json.dumps(DASHBOARD)
+    question = _prompt_text(body).split("User Question:")[-1].split("\n")[0].strip()
+    return (
+        f"Regarding \"{question[:80]}\": based on your recent transactions, your expenses are "
+        "within a normal range. Your largest category is Groceries at 3,100,000 VND, and you "
+        "could save around 500,000 VND per month by cooking at home more often."
+    )
+
+
+async def _delay_or_fail(latency: Optional[float], error_rate: Optional[float], throttle_rate: Optional[float]):
+    stats["requests"] += 1
+    mean = LATENCY if latency is None else latency
+    delay = mean * random.uniform(1 - JITTER, 1 + JITTER)
+    if random.random() < SLOW_RATE:
+        delay *= 10
+    await asyncio.sleep(delay)
+
+    if random.random() < (THROTTLE_RATE if throttle_rate is None else throttle_rate):
+        stats["throttled"] += 1
+        return JSONResponse(
+            {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}}, status_code=429, headers={"Retry-After": "1"}
+        )
+    if random.random() < (ERROR_RATE if error_rate is None else error_rate):
+        stats["errors"] += 1
+        return JSONResponse({"error": {"code": 503, "status": "UNAVAILABLE"}}, status_code=503)
+    return None
+
+
+@app.post("/v1beta/models/{model}:generateContent")
+async def generate_content(model: str, request: Request, latency: Optional[float] = None,
+                           error_rate: Optional[float] = None, throttle_rate: Optional[float] = None):
+    body = await request.json()
+    failure = await _delay_or_fail(latency, error_rate, throttle_rate)
+    if failure:
+        return failure
+    answer = _answer(body)
+    return {
+        "candidates": [{"content": {"role": "model", "parts": [{"text": answer}]}, "finishReason": "STOP"}],
+        "usageMetadata": _usage(body, answer),
+        "modelVersion": model,
+    }
+
+
+@app.post("/v1beta/models/{model}:streamGenerateContent")
+async def stream_generate_content(model: str, request: Request, latency: Optional[float] = None,
+                                  error_rate: Optional[float] = None, throttle_rate: Optional[float] = None):
+    body = await request.json()
+    # Time to first token is a fraction of the full latency
+    failure = await _delay_or_fail((LATENCY if latency is None else latency) / 3, error_rate, throttle_rate)
+    if failure:
+        return failure
+    answer = _answer(body)
+    size = max(1, len(answer) // CHUNKS + 1)
+    pieces = [answer[i:i + size] for i in range(0, len(answer), size)]
+
+    async def events():
+        for i, piece in enumerate(pieces):
+            chunk = {"candidates": [{"content": {"role": "model", "parts": [{"text": piece}]}}]}
+            if i == len(pieces) - 1:
+                chunk["candidates"][0]["finishReason"] = "STOP"
+                chunk["usageMetadata"] = _usage(body, answer)
+            yield f"data: {json.dumps(chunk)}\r\n\r\n"
+            await asyncio.sleep(LATENCY / CHUNKS)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
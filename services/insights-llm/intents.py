@@ -0,0 +1,303 @@
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Dict, Any, Optional, List, Tuple
+from answer_cache import normalize_query
+from retrieval import parse_period
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DAYS = 30
+
+# Questions asking for advice, reasons or comparisons go to the model even if they mention an amount
+_ADVICE = re.compile(
+    r"\b(should|could|would|why|how can|how do i|how to|tips?|advice|advise|recommend|suggest|compare|compared|"
+    r"vs|versus|afford|plan|reduce|cut|improve|better|worse|normal|too much|enough|if)\b"
+)
+_PERIOD_PHRASE = re.compile(
+    r"\b(today|yesterday|this week|last week|this month|last month|this year|last year|(?:last|past) \d+ days)\b"
+)
+# Words a recognized question may contain besides its period and the user's category/merchant
+# names; anything else ("except rent", "per day", "in March", "in Da Nang") goes to the model
+_KNOWN_WORDS = {
+    # the intent patterns below
+    "top", "biggest", "largest", "main", "category", "categories", "most", "merchant", "merchants", "store",
+    "stores", "shop", "shops", "where", "expensive", "highest", "expense", "expenses", "purchase", "purchases",
+    "transaction", "transactions", "payment", "payments", "spending", "how", "many", "times", "much", "earn",
+    "earned", "income", "receive", "received", "make", "made", "total", "earnings", "save", "saved",
+    "balance", "net", "savings", "cash", "flow", "cashflow", "spend", "spent", "pay", "paid",
+    # stopwords
+    "i", "me", "my", "the", "a", "an", "what", "whats", "s", "is", "was", "are", "were", "do", "does", "did",
+    "have", "has", "had", "on", "at", "in", "for", "from", "to", "with", "of", "so", "far", "money", "please",
+}
+# Asked of the same numbers, but not their total: leave them to the model even if a name matches
+_UNSUPPORTED = re.compile(
+    r"\b(except|excluding|exclude|without|not|besides|other than|average|avg|per|each|every|daily|weekly|monthly)\b"
+)
+
+# (intent, pattern), first match wins
+_INTENTS: List[Tuple[str, re.Pattern]] = [
+    ("top_categories", re.compile(
+        r"\b(top|biggest|largest|main)\b.*\bcategor(y|ies)\b|\bwhat (do|did) i (spend|spent) (the )?most on\b"
+    )),
+    ("top_merchants", re.compile(
+        r"\b(top|biggest|largest|main)\b.*\b(merchants?|stores?|shops?)\b|\bwhere (do|did) i (spend|spent) (the )?most\b"
+    )),
+    ("largest_expense", re.compile(
+        r"\b(biggest|largest|most expensive|highest)\b.*\b(expenses?|purchases?|transactions?|payments?|spending)\b"
+    )),
+    ("transaction_count", re.compile(r"\bhow many\b.*\b(transactions?|purchases?|payments?|times)\b")),
+    ("income_total", re.compile(
+        r"\bhow much\b.*\b(earn|earned|income|receive|received|make|made)\b|\b(my|total) (income|earnings)\b"
+    )),
+    ("net_total", re.compile(
+        r"\bhow much\b.*\b(save|saved)\b|\b(my|net) (balance|net|savings|cash ?flow)\b|\bnet savings\b"
+    )),
+    ("spend_total", re.compile(
+        r"\bhow much\b.*\b(spend|spent|pay|paid)\b|\b(total|my) (spending|expenses?)\b|\bwhat did i spend\b"
+    )),
+]
+
+
+def format_vnd(amount) -> str:
+    return f"{float(amount or 0):,.0f} VND"
+
+
+def plural(count: int, noun: str) -> str:
+    return f"{count} {noun}" if count == 1 else f"{count} {noun}s"
+
+
+class IntentRouter:
+    """
+    Answers simple factual chat questions ("how much did I spend on Groceries this month",
+    "what's my biggest expense") with one parameterized aggregate query instead of a
+    Gemini round trip.
+
+    Intents are matched with patterns on the normalized question; the category and
+    merchant slots are matched against the names the user actually has, the period
+    with retrieval.parse_period (last 30 days when none is named). The fast path is
+    taken only when every word is accounted for by the intent, a slot, the period or
+    a stopword; anything else (a filter, an unreadable date, "per day"), or a request
+    for advice, returns None for the LLM path.
+    """
+
+    def __init__(self, db_manager, labels_ttl: int = 300, max_users: int = 10000, max_words: int = 20):
+        self.db = db_manager
+        self.labels_ttl = labels_ttl
+        self.max_users = max_users
+        self.max_words = max_words
+        # user -> (loaded_at, {"categories": [...], "merchants": [...]})
+        self._labels: "OrderedDict[int, Tuple[float, Dict[str, List[str]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.queries = 0
+        self.fast_path = 0
+        self.by_intent: Dict[str, int] = {}
+        self.unresolved = 0
+        self.errors = 0
+
+    # ---------- Classification ----------
+
+    def classify(self, query: str) -> Optional[str]:
+        text = normalize_query(query)
+        if not text or len(text.split()) > self.max_words or _ADVICE.search(text):
+            return None
+        for intent, pattern in _INTENTS:
+            if pattern.search(text):
+                return intent
+        return None
+
+    @staticmethod
+    def _find_label(text: str, names: List[str]) -> Optional[str]:
+        """Longest of the user's names that appears as whole words in the question"""
+        best = None
+        for name in names:
+            normalized = normalize_query(name or "")
+            if len(normalized) < 3 or normalized in ("uncategorized", "unknown merchant"):
+                continue
+            if re.search(rf"\b{re.escape(normalized)}\b", text) and (best is None or len(normalized) > len(normalize_query(best))):
+                best = name
+        return best
+
+    @staticmethod
+    def _unrecognized(text: str, found: List[Optional[str]]) -> Optional[str]:
+        """
+        The words of the question that are not accounted for by the intent vocabulary, the
+        matched names or a period parse_period reads, or None when every word is
+        """
+        rest = _PERIOD_PHRASE.sub(" ", text)
+        for name in filter(None, found):
+            rest = re.sub(rf"\b{re.escape(normalize_query(name))}\b", " ", rest)
+        match = _UNSUPPORTED.search(rest)
+        if match:
+            return match.group(0)
+        unknown = [word for word in rest.split() if word not in _KNOWN_WORDS]
+        return " ".join(unknown) or None
+
+    async def _user_labels(self, user_id: int) -> Dict[str, List[str]]:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._labels.get(user_id)
+            if cached and now - cached[0] < self.labels_ttl:
+                self._labels.move_to_end(user_id)
+                return cached[1]
+        labels = await self.db.run(self.db.fetch_user_labels, user_id)
+        with self._lock:
+            self._labels[user_id] = (now, labels)
+            self._labels.move_to_end(user_id)
+            while len(self._labels) > self.max_users:
+                self._labels.popitem(last=False)
+        return labels
+
+    def invalidate_user(self, user_id: int):
+        """New categories or merchants: reload the user's names on the next question"""
+        with self._lock:
+            self._labels.pop(user_id, None)
+
+    @staticmethod
+    def _period(text: str, today: Optional[date] = None) -> Tuple[date, date, str]:
+        today = today or date.today()
+        period = parse_period(text, today)
+        if period is None:
+            return today - timedelta(days=DEFAULT_DAYS - 1), today, f"in the last {DEFAULT_DAYS} days"
+        match = _PERIOD_PHRASE.search(text)
+        if match is None:
+            return period[0], period[1], f"between {period[0].isoformat()} and {period[1].isoformat()}"
+        phrase = match.group(1)
+        return period[0], period[1], f"in the {phrase}" if phrase.endswith("days") else phrase
+
+    # ---------- Answers ----------
+
+    async def answer(self, user_id: int, query: str) -> Optional[Dict[str, Any]]:
+        """
+        A process_query()-shaped result for recognized questions, None for the LLM path.
+        """
+        self.queries += 1
+        intent = self.classify(query)
+        if intent is None:
+            return None
+
+        text = normalize_query(query)
+        start, end, period_label = self._period(text)
+        try:
+            category = merchant = None
+            if intent in ("spend_total", "largest_expense", "transaction_count", "income_total"):
+                labels = await self._user_labels(user_id)
+                category = self._find_label(text, labels["categories"])
+                merchant = self._find_label(text, labels["merchants"])
+            unrecognized = self._unrecognized(text, [category, merchant])
+            if unrecognized:
+                # A filter, period or aggregate we cannot express: the plain total would answer another question
+                self.unresolved += 1
+                logger.debug(f"Fast path skipped for user {user_id}: '{unrecognized}' not understood")
+                return None
+            answer, count = await getattr(self, f"_{intent}")(user_id, start, end, period_label, category, merchant)
+        except Exception as e:
+            # The model can still answer it
+            self.errors += 1
+            logger.warning(f"Fast path failed for user {user_id} ({intent}): {e}")
+            return None
+
+        self.fast_path += 1
+        self.by_intent[intent] = self.by_intent.get(intent, 0) + 1
+        return {
+            'answer': answer,
+            'transactions_count': count,
+            'context_used': True,
+            'context_preview': f"[{intent}] {start.isoformat()}..{end.isoformat()}"
+                               + (f" category={category}" if category else "") + (f" merchant={merchant}" if merchant else ""),
+            'intent': intent,
+            'prompt': None,
+            'summary_update': None,
+        }
+
+    async def _totals(self, user_id, start, end, **filters) -> Dict[str, Dict]:
+        rows = await self.db.run(self.db.aggregate_transactions, user_id, start, end, **filters)
+        return {row['type']: row for row in rows}
+
+    @staticmethod
+    def _scope(category: Optional[str], merchant: Optional[str]) -> str:
+        if category and merchant:
+            return f" on {category} at {merchant}"
+        if category:
+            return f" on {category}"
+        if merchant:
+            return f" at {merchant}"
+        return ""
+
+    async def _spend_total(self, user_id, start, end, period_label, category, merchant):
+        totals = await self._totals(user_id, start, end, tx_type="EXPENSE", category=category, merchant=merchant)
+        row = totals.get("EXPENSE")
+        scope = self._scope(category, merchant)
+        if not row:
+            return f"You have no expenses{scope} recorded {period_label}.", 0
+        return f"You spent {format_vnd(row['total'])}{scope} {period_label} ({plural(row['count'], 'transaction')}).", row['count']
+
+    async def _income_total(self, user_id, start, end, period_label, category, merchant):
+        totals = await self._totals(user_id, start, end, tx_type="INCOME", category=category, merchant=merchant)
+        row = totals.get("INCOME")
+        scope = self._scope(category, merchant)
+        if not row:
+            return f"You have no income{scope} recorded {period_label}.", 0
+        return f"You received {format_vnd(row['total'])} in income{scope} {period_label} ({plural(row['count'], 'transaction')}).", row['count']
+
+    async def _net_total(self, user_id, start, end, period_label, category, merchant):
+        totals = await self._totals(user_id, start, end)
+        income = float(totals.get("INCOME", {}).get('total') or 0)
+        expenses = float(totals.get("EXPENSE", {}).get('total') or 0)
+        count = sum(row['count'] for row in totals.values())
+        net = income - expenses
+        verdict = "saved" if net >= 0 else "spent more than you earned by"
+        return (
+            f"{period_label[0].upper()}{period_label[1:]}: income {format_vnd(income)}, expenses {format_vnd(expenses)}. "
+            f"You {verdict} {format_vnd(abs(net))}."
+        ), count
+
+    async def _transaction_count(self, user_id, start, end, period_label, category, merchant):
+        totals = await self._totals(user_id, start, end, category=category, merchant=merchant)
+        count = sum(row['count'] for row in totals.values())
+        parts = [f"{totals[t]['count']} {label}" for t, label in (("EXPENSE", "expenses"), ("INCOME", "income"), ("TRANSFER", "transfers")) if t in totals]
+        detail = f" ({', '.join(parts)})" if parts else ""
+        return f"You made {plural(count, 'transaction')}{self._scope(category, merchant)} {period_label}{detail}.", count
+
+    async def _largest_expense(self, user_id, start, end, period_label, category, merchant):
+        rows = await self.db.run(self.db.fetch_largest_transactions, user_id, start, end,
+                                 category=category, merchant=merchant, limit=1)
+        scope = self._scope(category, merchant)
+        if not rows:
+            return f"You have no expenses{scope} recorded {period_label}.", 0
+        top = rows[0]
+        when = str(top['occurred_at'])[:10]
+        return (
+            f"Your biggest expense{scope} {period_label} was {format_vnd(top['amount'])} at {top['merchant_name']} "
+            f"({top['category_name']}) on {when}."
+        ), 1
+
+    async def _top_groups(self, user_id, start, end, period_label, group_by: str) -> Tuple[str, int]:
+        rows = await self.db.run(self.db.aggregate_transactions, user_id, start, end,
+                                 tx_type="EXPENSE", group_by=group_by, limit=3)
+        if not rows:
+            return f"You have no expenses recorded {period_label}.", 0
+        listed = ", ".join(f"{r['label']} {format_vnd(r['total'])} ({r['count']})" for r in rows)
+        noun = "categories" if group_by == "category" else "merchants"
+        return f"Your top spending {noun} {period_label}: {listed}.", sum(r['count'] for r in rows)
+
+    async def _top_categories(self, user_id, start, end, period_label, category, merchant):
+        return await self._top_groups(user_id, start, end, period_label, "category")
+
+    async def _top_merchants(self, user_id, start, end, period_label, category, merchant):
+        return await self._top_groups(user_id, start, end, period_label, "merchant")
+
+    def stats(self) -> Dict:
+        return {
+            "queries": self.queries,
+            "fast_path": self.fast_path,
+            "llm_path": self.queries - self.fast_path,
+            "hit_ratio": round(self.fast_path / self.queries, 4) if self.queries else 0.0,
+            "unresolved": self.unresolved,
+            "errors": self.errors,
+            "by_intent": dict(self.by_intent),
+        }
@@ -0,0 +1,440 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import httpx
+from collections import deque
+from typing import Dict, Any, Optional, AsyncIterator
+from prompt_builder import estimate_tokens
+from metrics import record_stage, record_usage
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """Gemini answered with a non-200 status (after retries, if it was retryable)"""
+
+    def __init__(self, status_code: int, detail: str = ""):
+        super().__init__(f"Gemini returned {status_code}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+class CircuitOpen(Exception):
+    """Gemini is failing; calls are rejected until the breaker's cool-down ends"""
+
+
+class TokenBucket:
+    """
+    Refills `per_minute` units per minute up to `per_minute` (one minute of burst).
+    acquire() waits for the units; a request larger than the bucket waits for a full bucket.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """Returns the seconds spent waiting"""
+        if self.capacity <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                delay = (amount - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+                self._refill()
+            self.tokens -= amount
+        return waited
+
+    def try_acquire(self, amount: float = 1.0) -> bool:
+        if self.capacity <= 0:
+            return True
+        self._refill()
+        if self.tokens < min(amount, self.capacity) or self._lock.locked():
+            return False
+        self.tokens -= min(amount, self.capacity)
+        return True
+
+    def adjust(self, amount: float):
+        """Correct an estimate once the real usage is known (positive = used more)"""
+        if self.capacity > 0:
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive upstream failures, rejects calls for
+    `reset_timeout` seconds, then lets a single probe through (half-open). A probe that
+    ends without a verdict (cancelled, local error) is released, and one that has not
+    reported back within `reset_timeout` is given up on, so the next call probes instead.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        # open: the cool-down is over; half_open: the probe is taking too long
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+    def success(self):
+        self.state = "closed"
+        self.failures = 0
+
+    def failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.opens += 1
+                logger.warning(f"Gemini circuit opened after {self.failures} failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """A call ended without telling whether Gemini is healthy: let the next one probe"""
+        if self.state == "half_open":
+            self.state = "open"
+            self.opened_at = time.monotonic() - self.reset_timeout
+
+
+class GeminiClient:
+    """
+    The one way this service talks to Gemini.
+
+    Every request passes an RPM and a TPM token bucket (prompt tokens estimated, then
+    corrected from usageMetadata) and a concurrency semaphore. 429/5xx and transport
+    errors are retried with full-jitter exponential backoff (Retry-After is honoured).
+    Consecutive failures open a circuit breaker so callers can fall back immediately.
+    With hedging on, a second identical request is sent when the first is slower than
+    the recent p95 latency, and whichever answers first wins.
+
+    GEMINI_BASE_URL points it at a local fake server (fake_gemini.py) for testing.
+    """
+
+    def __init__(self, api_key: str, model: Optional[str] = None, base_url: Optional[str] = None):
+        self.api_key = api_key
+        self.model = model or os.getenv("GEMINI_MODEL", "gemini-2.5-flash-lite")
+        base_url = (base_url or os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")).rstrip("/")
+        self.base_url = base_url
+        self.api_url = f"{base_url}/models/{self.model}:generateContent"
+        self.stream_url = f"{base_url}/models/{self.model}:streamGenerateContent"
+        self.timeout = httpx.Timeout(
+            float(os.getenv("GEMINI_TIMEOUT", 30)),
+            connect=float(os.getenv("GEMINI_CONNECT_TIMEOUT", 5))
+        )
+
+        # GEMINI_RPM / GEMINI_TPM are the quota of the whole service: each worker process gets its share
+        workers = max(1, int(os.getenv("WEB_CONCURRENCY", 1)))
+        self.requests_limiter = TokenBucket(float(os.getenv("GEMINI_RPM", 1000)) / workers)
+        self.tokens_limiter = TokenBucket(float(os.getenv("GEMINI_TPM", 1000000)) / workers)
+        self.semaphore = asyncio.Semaphore(int(os.getenv("GEMINI_MAX_CONCURRENCY", 32)))
+        self.max_retries = int(os.getenv("GEMINI_MAX_RETRIES", 3))
+        self.backoff_base = float(os.getenv("GEMINI_BACKOFF_BASE", 0.5))
+        self.backoff_max = float(os.getenv("GEMINI_BACKOFF_MAX", 8))
+        self.hedge = os.getenv("GEMINI_HEDGE", "0") == "1"
+        self.hedge_min_delay = float(os.getenv("GEMINI_HEDGE_MIN_DELAY", 1.0))
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv("GEMINI_BREAKER_FAILURES", 5)),
+            reset_timeout=float(os.getenv("GEMINI_BREAKER_RESET", 30))
+        )
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._latencies: deque = deque(maxlen=200)
+        self.in_flight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.limiter_wait = 0.0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # One keep-alive session shared by every request in this process
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                headers={"Content-Type": "application/json"},
+                limits=httpx.Limits(
+                    max_connections=int(os.getenv("GEMINI_MAX_CONNECTIONS", 100)),
+                    max_keepalive_connections=int(os.getenv("GEMINI_MAX_KEEPALIVE", 20))
+                )
+            )
+        return self._client
+
+    async def warm_up(self):
+        """Opens the keep-alive connection (DNS, TLS) before the first real request needs it"""
+        try:
+            await self.client.get(f"{self.base_url}/models", params={"key": self.api_key, "pageSize": 1})
+        except httpx.HTTPError as e:
+            logger.warning(f"Gemini warm-up failed: {e}")
+
+    async def drain(self, timeout: float) -> bool:
+        """Waits for in-flight calls to finish; False if some were still running after `timeout`"""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(f"{self.in_flight} Gemini calls still in flight after {timeout}s")
+            return False
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    # ---------- Internals ----------
+
+    def _enter(self):
+        self.in_flight += 1
+        self._idle.clear()
+
+    def _exit(self):
+        self.in_flight -= 1
+        if not self.in_flight:
+            self._idle.set()
+
+    def _estimate(self, payload: Dict[str, Any]) -> int:
+        # Prompt plus a typical answer; corrected from usageMetadata afterwards
+        return estimate_tokens(json.dumps(payload)) + 500
+
+    def _hedge_delay(self) -> float:
+        if len(self._latencies) < 20:
+            return max(self.hedge_min_delay, self.timeout.read or 30) / 2
+        ordered = sorted(self._latencies)
+        return max(self.hedge_min_delay, ordered[int(len(ordered) * 0.95) - 1])
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+            if retry_after:
+                try:
+                    return min(float(retry_after), self.backoff_max)
+                except ValueError:
+                    pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _send(self, payload: Dict[str, Any]) -> httpx.Response:
+        async with self.semaphore:
+            started = time.monotonic()
+            response = await self.client.post(f"{self.api_url}?key={self.api_key}", json=payload)
+            if response.status_code == 200:
+                self._latencies.append(time.monotonic() - started)
+            return response
+
+    async def _send_hedged(self, payload: Dict[str, Any], estimate: int) -> httpx.Response:
+        primary = asyncio.ensure_future(self._send(payload))
+        pending = {primary}
+        result = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self._hedge_delay())
+            if done:
+                return primary.result()
+
+            # Only hedge with spare capacity; a hedge must never queue behind real traffic
+            if self.semaphore.locked() or not self.requests_limiter.try_acquire(1) or not self.tokens_limiter.try_acquire(estimate):
+                return await primary
+            self.hedges += 1
+            backup = asyncio.ensure_future(self._send(payload))
+            pending = {primary, backup}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result().status_code == 200:
+                        if task is backup:
+                            self.hedge_wins += 1
+                        return task.result()
+                    result = task
+            return result.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    # ---------- Public API ----------
+
+    async def generate(self, payload: Dict[str, Any], hedge: Optional[bool] = None) -> Dict[str, Any]:
+        """
+        generateContent with limits, retries and the breaker. Returns the response JSON.
+        Raises CircuitOpen, LLMError, or httpx.TimeoutException / TransportError after retries.
+        """
+        self._enter()
+        try:
+            return await self._generate(payload, hedge)
+        finally:
+            self._exit()
+
+    async def _generate(self, payload: Dict[str, Any], hedge: Optional[bool]) -> Dict[str, Any]:
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise CircuitOpen()
+        hedge = self.hedge if hedge is None else hedge
+        estimate = self._estimate(payload)
+        self.requests += 1
+        started = time.perf_counter()
+        settled = False
+
+        try:
+            for attempt in range(self.max_retries + 1):
+                self.limiter_wait += await self.requests_limiter.acquire(1)
+                self.limiter_wait += await self.tokens_limiter.acquire(estimate)
+
+                response, error = None, None
+                try:
+                    response = await (self._send_hedged(payload, estimate) if hedge else self._send(payload))
+                except httpx.TransportError as e:
+                    error = e
+                else:
+                    if response.status_code == 200:
+                        self.breaker.success()
+                        settled = True
+                        data = response.json()
+                        used = (data.get("usageMetadata") or {}).get("totalTokenCount")
+                        if used:
+                            self.tokens_limiter.adjust(used - estimate)
+                        record_stage("gemini", time.perf_counter() - started)
+                        record_usage(data.get("usageMetadata"))
+                        return data
+                    if response.status_code not in RETRYABLE_STATUS:
+                        # Our request is wrong, not Gemini: no retry, and Gemini counts as up
+                        self.breaker.success()
+                        settled = True
+                        raise LLMError(response.status_code, response.text)
+                    error = LLMError(response.status_code, response.text)
+
+                self.failures += 1
+                self.breaker.failure()
+                if attempt == self.max_retries or not self.breaker.allow():
+                    settled = True
+                    raise error
+                self.retries += 1
+                delay = self._backoff(attempt, response)
+                logger.warning(f"Gemini call failed ({error}); retry {attempt + 1} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+        finally:
+            if not settled:
+                self.breaker.release()
+
+    async def stream(self, payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        streamGenerateContent (SSE): yields each decoded chunk. Failures before the
+        first byte are retried like generate(); a stream is never restarted midway.
+        """
+        self._enter()
+        try:
+            async for chunk in self._stream(payload):
+                yield chunk
+        finally:
+            self._exit()
+
+    async def _stream(self, payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise CircuitOpen()
+        estimate = self._estimate(payload)
+        self.requests += 1
+        requested = time.perf_counter()
+        settled = False
+
+        try:
+            for attempt in range(self.max_retries + 1):
+                self.limiter_wait += await self.requests_limiter.acquire(1)
+                self.limiter_wait += await self.tokens_limiter.acquire(estimate)
+
+                error, retry_response, started, usage = None, None, False, None
+                async with self.semaphore:
+                    try:
+                        async with self.client.stream(
+                            "POST", f"{self.stream_url}?alt=sse&key={self.api_key}", json=payload
+                        ) as response:
+                            if response.status_code != 200:
+                                body = await response.aread()
+                                error = LLMError(response.status_code, body[:500].decode(errors="replace"))
+                                if response.status_code not in RETRYABLE_STATUS:
+                                    self.breaker.success()
+                                    settled = True
+                                    raise error
+                                retry_response = response
+                            else:
+                                self.breaker.success()
+                                settled = True
+                                async for line in response.aiter_lines():
+                                    if not line.startswith("data:"):
+                                        continue
+                                    try:
+                                        chunk = json.loads(line[5:].strip())
+                                    except ValueError:
+                                        continue
+                                    usage = chunk.get("usageMetadata") or usage
+                                    if not started:
+                                        record_stage("gemini_first_token", time.perf_counter() - requested)
+                                    started = True
+                                    yield chunk
+                                if usage and usage.get("totalTokenCount"):
+                                    self.tokens_limiter.adjust(usage["totalTokenCount"] - estimate)
+                                record_stage("gemini", time.perf_counter() - requested)
+                                record_usage(usage)
+                                return
+                    except httpx.TransportError as e:
+                        if started:
+                            # Part of the answer is already out; replaying it would duplicate text
+                            self.failures += 1
+                            raise
+                        error = e
+
+                self.failures += 1
+                self.breaker.failure()
+                if attempt == self.max_retries or not self.breaker.allow():
+                    settled = True
+                    raise error
+                self.retries += 1
+                await asyncio.sleep(self._backoff(attempt, retry_response))
+        finally:
+            if not settled:
+                self.breaker.release()
+
+    def stats(self) -> Dict:
+        ordered = sorted(self._latencies)
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "rejected_open_circuit": self.rejected,
+            "circuit": self.breaker.state,
+            "circuit_opens": self.breaker.opens,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "limiter_wait_seconds": round(self.limiter_wait, 3),
+            "in_flight": self.in_flight,
+            "latency_p50": round(ordered[len(ordered) // 2], 3) if ordered else None,
+            "latency_p95": round(ordered[int(len(ordered) * 0.95) - 1], 3) if len(ordered) >= 20 else None,
+        }
@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple, Iterator, Callable
+
+logger = logging.getLogger(__name__)
+
+# Per-request state: the endpoint label and the timing breakdown being collected
+current_endpoint: contextvars.ContextVar[str] = contextvars.ContextVar("current_endpoint", default="background")
+current_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("current_timings", default=None)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def snapshot(self) -> List:
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def render(self, workers: Dict[str, List]) -> List[str]:
+        """workers: worker id -> snapshot()"""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        names = self.label_names + ("worker",)
+        for worker, samples in sorted(workers.items()):
+            for key, value in sorted(samples):
+                lines.append(f"{self.name}{_labels(names, tuple(key) + (worker,))} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = labels
+        self.buckets = buckets
+        # labels -> [bucket counts..., sum, count]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self) -> List:
+        with self._lock:
+            return [[list(key), list(series)] for key, series in self._series.items()]
+
+    def render(self, workers: Dict[str, List]) -> List[str]:
+        """workers: worker id -> snapshot()"""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        names = self.label_names + ("worker",)
+        for worker, samples in sorted(workers.items()):
+            for key, series in sorted(samples):
+                key = tuple(key) + (worker,)
+                for bound, count in zip(self.buckets, series):
+                    le = 'le="%s"' % bound
+                    lines.append(f"{self.name}_bucket{_labels(names, key, le)} {count}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_labels(names, key, le)} {series[-1]}")
+                lines.append(f"{self.name}_sum{_labels(names, key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_labels(names, key)} {series[-1]}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram("insights_request_seconds", "HTTP request latency (time to first byte for streams)", ("endpoint", "method", "status"))
+STAGE_SECONDS = Histogram("insights_stage_seconds", "Time spent per request stage", ("endpoint", "stage"))
+DB_QUERY_SECONDS = Histogram("insights_db_query_seconds", "DatabaseManager call latency, including worker queueing", ("query",))
+LLM_TOKENS = Counter("insights_llm_tokens_total", "Gemini tokens from usageMetadata", ("endpoint", "kind"))
+LLM_CALLS = Counter("insights_llm_calls_total", "Gemini calls that returned usage", ("endpoint",))
+
+_METRICS = [REQUEST_SECONDS, STAGE_SECONDS, DB_QUERY_SECONDS, LLM_TOKENS, LLM_CALLS]
+
+
+def record_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, endpoint=current_endpoint.get(), stage=stage)
+    timings = current_timings.get()
+    if timings is not None:
+        timings[stage] = round(timings.get(stage, 0.0) + seconds * 1000, 3)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """with stage("retrieval"): ...  -> histogram + this request's timing breakdown (ms)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def record_usage(usage: Optional[Dict]):
+    if not usage:
+        return
+    endpoint = current_endpoint.get()
+    LLM_CALLS.inc(endpoint=endpoint)
+    LLM_TOKENS.inc(usage.get("promptTokenCount", 0), endpoint=endpoint, kind="prompt")
+    LLM_TOKENS.inc(usage.get("candidatesTokenCount", 0), endpoint=endpoint, kind="response")
+    # Part of the prompt tokens Gemini served from its (implicit) context cache
+    LLM_TOKENS.inc(usage.get("cachedContentTokenCount", 0), endpoint=endpoint, kind="cached")
+    timings = current_timings.get()
+    if timings is not None:
+        timings["prompt_tokens"] = timings.get("prompt_tokens", 0) + usage.get("promptTokenCount", 0)
+        timings["response_tokens"] = timings.get("response_tokens", 0) + usage.get("candidatesTokenCount", 0)
+        if usage.get("cachedContentTokenCount"):
+            timings["cached_tokens"] = timings.get("cached_tokens", 0) + usage["cachedContentTokenCount"]
+
+
+def _flatten(prefix: str, value, out: List[Tuple[str, float]]):
+    if isinstance(value, bool):
+        out.append((prefix, float(value)))
+    elif isinstance(value, (int, float)):
+        out.append((prefix, float(value)))
+    elif isinstance(value, dict):
+        for k, v in value.items():
+            _flatten(f"{prefix}_{k}", v, out)
+
+
+def snapshot() -> Dict[str, List]:
+    """This process's histograms and counters, JSON-serializable"""
+    return {metric.name: metric.snapshot() for metric in _METRICS}
+
+
+def render(workers: Dict[str, Dict]) -> str:
+    """
+    Prometheus text format for every worker (SharedMetrics.collect()): the histograms/counters
+    above plus every numeric field of the components' stats() dicts as gauges
+    (insights_<component>_<field>), all labelled with the worker's pid. Sum over `worker`
+    for service totals.
+    """
+    lines: List[str] = []
+    for metric in _METRICS:
+        lines.extend(metric.render({w: data["metrics"].get(metric.name, []) for w, data in workers.items()}))
+
+    gauges: Dict[str, List[str]] = {}
+    for worker, data in sorted(workers.items()):
+        for component, values in (data.get("stats") or {}).items():
+            if not values:
+                continue
+            flat: List[Tuple[str, float]] = []
+            _flatten(f"insights_{component}", values, flat)
+            for name, value in flat:
+                name = "".join(c if c.isalnum() or c == "_" else "_" for c in name)
+                gauges.setdefault(name, []).append(f'{name}{{worker="{worker}"}} {value}')
+    for name, samples in gauges.items():
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+class SharedMetrics:
+    """
+    Makes every worker's metrics readable from any of them.
+
+    Each uvicorn worker keeps its metrics in memory and writes a snapshot (metrics plus
+    component stats) to {directory}/{pid}.json every `interval` seconds and on every
+    scrape it serves; a scrape reads all snapshots, so whichever worker answers reports
+    the whole service. Snapshots of workers that exited or stopped writing for `max_age`
+    seconds are removed. The directory must be shared by the workers (one container).
+    """
+
+    def __init__(self, directory: str = "data/metrics", interval: float = 5.0, max_age: float = 60.0):
+        self.directory = directory
+        self.interval = interval
+        self.max_age = max_age
+        self.worker = str(os.getpid())
+        self.path = os.path.join(directory, f"{self.worker}.json")
+        os.makedirs(directory, exist_ok=True)
+
+    def publish(self, stats: Dict[str, Optional[Dict]]) -> Dict:
+        data = {"updated_at": time.time(), "metrics": snapshot(), "stats": stats}
+        tmp = f"{self.path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, default=str)
+        os.replace(tmp, self.path)
+        return data
+
+    @staticmethod
+    def _alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+            return True
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+
+    def collect(self, stats: Dict[str, Optional[Dict]]) -> Dict[str, Dict]:
+        """worker pid -> {"metrics", "stats"}: this worker's current values and the others' snapshots"""
+        workers = {self.worker: self.publish(stats)}
+        now = time.time()
+        for name in os.listdir(self.directory):
+            worker, ext = os.path.splitext(name)
+            if ext != ".json" or worker == self.worker:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if not worker.isdigit() or not self._alive(int(worker)) or now - data.get("updated_at", 0) > self.max_age:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            workers[worker] = data
+        return workers
+
+    async def run(self, stats: Callable[[], Dict[str, Optional[Dict]]]):
+        while True:
+            try:
+                await asyncio.to_thread(self.publish, stats())
+            except Exception as e:
+                logger.warning(f"Metrics snapshot failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,174 @@
+import os
+import time
+import asyncio
+import logging
+import argparse
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+from rag_pipeline import RAGPipeline
+from database import DatabaseManager
+from dashboard_cache import DashboardCache
+from aggregates import AggregateStore
+from analytics import dashboard_analytics
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_KEY = "dashboard_precompute:last_tx_id"
+
+
+class RequestPacer:
+    """
+    Spaces out Gemini calls to stay under a requests-per-minute budget.
+    The interval doubles after a failed call and recovers gradually (AIMD),
+    so a burst of 429s slows the whole batch down instead of failing every user.
+    """
+
+    def __init__(self, rpm: int):
+        self.base_interval = 60.0 / rpm if rpm > 0 else 0.0
+        self.interval = self.base_interval
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def success(self):
+        self.interval = max(self.base_interval, self.interval * 0.9)
+
+    def failure(self):
+        self.interval = min(max(self.interval * 2, 1.0), 60.0)
+
+
+class DashboardPrecomputer:
+    """
+    Regenerates cached dashboards for active users outside the request path.
+
+    Transactions for a batch of users are streamed from one query ordered by user,
+    and generation runs with bounded concurrency under the RPM pacer.
+    """
+
+    def __init__(self, rag_pipeline: RAGPipeline, db_manager: DatabaseManager, cache: DashboardCache,
+                 aggregates: Optional[AggregateStore] = None, concurrency: int = 4, rpm: int = 60,
+                 days: int = 30, batch_users: int = 500, bills_days: int = 14):
+        self.rag = rag_pipeline
+        self.db = db_manager
+        self.cache = cache
+        self.aggregates = aggregates
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.pacer = RequestPacer(rpm)
+        self.days = days
+        self.batch_users = batch_users
+        self.bills_days = bills_days
+
+        self.generated = 0
+        self.failed = 0
+
+    async def _generate(self, user_id: int, rows: List[Dict], bills: List[Dict]):
+        async with self.semaphore:
+            await self.pacer.wait()
+            # Same inputs as the request path: newest 50 rows, exact aggregates, analytics with bills
+            transactions = list(reversed(rows[-50:]))
+            summary = await self.aggregates.summary(user_id) if self.aggregates else None
+            analytics = dashboard_analytics(rows, bills, days=self.days)
+            data = await self.rag.generate_dashboard_insights(transactions, summary, analytics, user_id=user_id)
+            if data:
+                await self.cache.set(user_id, data)
+                self.pacer.success()
+                self.generated += 1
+            else:
+                self.pacer.failure()
+                self.failed += 1
+                logger.warning(f"Precompute failed for user {user_id}")
+
+    def _stream_users(self, loop, user_ids: List[int], tasks: List):
+        """Runs in a DB worker thread: groups the streamed rows per user and schedules generation"""
+        bills = self.db.fetch_upcoming_bills_many(user_ids, self.bills_days)
+        current_user, rows = None, []
+        for row in self.db.iter_transactions(self.days, user_ids=user_ids):
+            if row['user_id'] != current_user:
+                if current_user is not None:
+                    tasks.append(asyncio.run_coroutine_threadsafe(
+                        self._generate(current_user, rows, bills.get(current_user, [])), loop
+                    ))
+                current_user, rows = row['user_id'], []
+            rows.append(row)
+        if current_user is not None:
+            tasks.append(asyncio.run_coroutine_threadsafe(self._generate(current_user, rows, bills.get(current_user, [])), loop))
+
+    async def run(self, full: bool = False) -> Dict:
+        started = time.monotonic()
+        high_watermark = await self.db.run(self.db.fetch_max_transaction_id)
+        last = None if full else await self.db.run(self.db.get_job_state, WATERMARK_KEY)
+
+        active = await self.db.run(self.db.fetch_active_user_ids, self.days)
+        if last is None:
+            targets = active
+        else:
+            # Users with new transactions, plus users whose entry was invalidated or expired
+            changed = set(await self.db.run(self.db.fetch_active_user_ids, self.days, int(last)))
+            targets = sorted(changed.union(await self.cache.missing(active)) & set(active))
+
+        logger.info(f"Precompute: {len(targets)} of {len(active)} active users to refresh")
+
+        loop = asyncio.get_running_loop()
+        for i in range(0, len(targets), self.batch_users):
+            batch = targets[i:i + self.batch_users]
+            tasks: List = []
+            await self.db.run(self._stream_users, loop, batch, tasks)
+            await asyncio.gather(*(asyncio.wrap_future(t) for t in tasks))
+
+        await self.db.run(self.db.set_job_state, WATERMARK_KEY, str(high_watermark))
+        result = {
+            "users": len(targets),
+            "generated": self.generated,
+            "failed": self.failed,
+            "seconds": round(time.monotonic() - started, 2),
+        }
+        logger.info(f"Precompute finished: {result}")
+        return result
+
+
+async def main(args):
+    redis_url = os.getenv("REDIS_URL", "redis://redis:6379/0")
+    rag_pipeline = RAGPipeline(api_key=os.getenv("GEMINI_API_KEY"))
+    db_manager = DatabaseManager()
+    cache = DashboardCache(
+        redis_url=redis_url,
+        ttl=int(os.getenv("DASHBOARD_CACHE_TTL", 900)),
+        stale_ttl=int(os.getenv("DASHBOARD_CACHE_STALE_TTL", 3600))
+    )
+    aggregates = AggregateStore(redis_url, db_manager, retention_days=int(os.getenv("AGGREGATE_RETENTION_DAYS", 90)))
+    precomputer = DashboardPrecomputer(
+        rag_pipeline, db_manager, cache, aggregates,
+        concurrency=int(os.getenv("PRECOMPUTE_CONCURRENCY", 4)),
+        rpm=int(os.getenv("PRECOMPUTE_RPM", 60)),
+        bills_days=int(os.getenv("UPCOMING_BILLS_DAYS", 14))
+    )
+
+    try:
+        while True:
+            await precomputer.run(full=args.full)
+            if not args.loop:
+                break
+            args.full = False
+            await asyncio.sleep(args.loop)
+    finally:
+        await rag_pipeline.close()
+        await cache.close()
+        await aggregates.close()
+        db_manager.close()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Precompute dashboard insights for active users")
+    parser.add_argument("--full", action="store_true", help="ignore the watermark and refresh every active user")
+    parser.add_argument("--loop", type=int, default=0, help="rerun incrementally every N seconds")
+    asyncio.run(main(parser.parse_args()))
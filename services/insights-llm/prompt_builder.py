@@ -0,0 +1,155 @@
+import re
+import math
+import logging
+import threading
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Per-message framing overhead (role, separators) in the Gemini chat format
+MESSAGE_OVERHEAD = 4
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (~4 characters per token for English/VND amounts).
+    Good enough for budgeting; the exact count is reported back by Gemini.
+    """
+    return math.ceil(len(text or "") / 4)
+
+
+def _first_sentence(text: str, max_chars: int) -> str:
+    text = " ".join((text or "").split())
+    sentence = _SENTENCE_END.split(text, 1)[0]
+    return sentence if len(sentence) <= max_chars else sentence[:max_chars - 1].rstrip() + "…"
+
+
+def group_exchanges(history: List[Dict]) -> List[List[Dict]]:
+    """
+    A question and the answer after it form one exchange (they share a chat_logs id,
+    or both have id None while still in the write-behind buffer)
+    """
+    exchanges: List[List[Dict]] = []
+    for turn in history:
+        if exchanges and turn['role'] != 'user' and exchanges[-1][-1]['role'] == 'user' and exchanges[-1][0].get('id') == turn.get('id'):
+            exchanges[-1].append(turn)
+        else:
+            exchanges.append([turn])
+    return exchanges
+
+
+class PromptAssembler:
+    """
+    Fits chat history into an explicit token budget.
+
+    The newest exchanges are kept verbatim while they fit. Older ones are folded into
+    a rolling summary, one compact line per exchange, that is persisted alongside
+    chat_logs and only ever extended with exchanges newer than its watermark.
+    """
+
+    def __init__(self, budget_tokens: int = 3000, max_verbatim: int = 3, summary_tokens: int = 400):
+        self.budget_tokens = budget_tokens
+        self.max_verbatim = max_verbatim
+        self.summary_tokens = summary_tokens
+
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens_total = 0
+        self.prompt_tokens_max = 0
+        self.summarized_exchanges = 0
+
+    def _summary_line(self, exchange: List[Dict]) -> str:
+        question = next((t['message'] for t in exchange if t['role'] == 'user'), "")
+        answer = next((t['message'] for t in exchange if t['role'] != 'user'), "")
+        line = f"- User asked: {_first_sentence(question, 120)}"
+        if answer:
+            line += f" | Advisor: {_first_sentence(answer, 160)}"
+        return line
+
+    def _fold(self, summary: str, exchanges: List[List[Dict]]) -> str:
+        lines = [line for line in (summary or "").splitlines() if line.strip()]
+        lines.extend(self._summary_line(e) for e in exchanges)
+        # Oldest lines fall off once the summary outgrows its own budget
+        while lines and estimate_tokens("\n".join(lines)) > self.summary_tokens:
+            lines.pop(0)
+        return "\n".join(lines)
+
+    def assemble(self, fixed_text: str, history: List[Dict], stored: Optional[Dict] = None) -> Dict[str, Any]:
+        """
+        fixed_text: everything that is always sent (system instruction, context, question).
+        history: turns from fetch_chat_history (oldest first, with chat_logs ids).
+        stored: {'summary', 'last_log_id'} from fetch_chat_summary.
+
+        Returns the verbatim turns, the summary to send, the summary to persist (or None
+        if unchanged) and the prompt-size metrics.
+        """
+        stored = stored or {}
+        summary = stored.get('summary') or ""
+        last_log_id = stored.get('last_log_id') or 0
+
+        fixed_tokens = estimate_tokens(fixed_text) + MESSAGE_OVERHEAD
+        exchanges = group_exchanges(history)
+
+        # Newest first: keep exchanges verbatim while they fit next to the current summary
+        kept: List[List[Dict]] = []
+        used = fixed_tokens + estimate_tokens(summary)
+        for exchange in reversed(exchanges):
+            cost = sum(estimate_tokens(t['message']) + MESSAGE_OVERHEAD for t in exchange)
+            if len(kept) >= self.max_verbatim or used + cost > self.budget_tokens:
+                break
+            kept.insert(0, exchange)
+            used += cost
+
+        while True:
+            dropped = exchanges[:len(exchanges) - len(kept)]
+            new_to_fold = [e for e in dropped if (e[0].get('id') or 0) > last_log_id]
+            folded = self._fold(summary, new_to_fold) if new_to_fold else summary
+
+            turns = [t for exchange in kept for t in exchange]
+            history_tokens = sum(estimate_tokens(t['message']) + MESSAGE_OVERHEAD for t in turns)
+            summary_tokens = estimate_tokens(folded)
+            total = fixed_tokens + history_tokens + summary_tokens
+            # The grown summary may push us over; give up the oldest verbatim exchange
+            if total <= self.budget_tokens or not kept:
+                break
+            kept.pop(0)
+
+        updated = None
+        if new_to_fold:
+            summary = folded
+            updated = {
+                'summary': summary,
+                'last_log_id': max(e[0].get('id') or 0 for e in new_to_fold)
+            }
+
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens_total += total
+            self.prompt_tokens_max = max(self.prompt_tokens_max, total)
+            self.summarized_exchanges += len(new_to_fold)
+
+        return {
+            'history': turns,
+            'summary': summary,
+            'summary_update': updated,
+            'metrics': {
+                'prompt_tokens_est': total,
+                'fixed_tokens': fixed_tokens,
+                'history_tokens': history_tokens,
+                'summary_tokens': summary_tokens,
+                'turns_verbatim': len(turns),
+                'exchanges_summarized': len(new_to_fold),
+                'budget_tokens': self.budget_tokens,
+            }
+        }
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "prompt_tokens_avg": round(self.prompt_tokens_total / self.requests, 1) if self.requests else 0.0,
+                "prompt_tokens_max": self.prompt_tokens_max,
+                "exchanges_summarized": self.summarized_exchanges,
+                "budget_tokens": self.budget_tokens,
+            }
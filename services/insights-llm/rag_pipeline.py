@@ -1,7 +1,12 @@
+import os
 import logging
-import requests
+import httpx
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
+from prompt_builder import PromptAssembler
+from single_flight import SingleFlight, payload_fingerprint
+from llm_client import GeminiClient, LLMError, CircuitOpen, RETRYABLE_STATUS
+from metrics import stage
 
 logger = logging.getLogger(__name__)
 
@@ -12,89 +17,158 @@ class RAGPipeline:
         if not api_key:
             raise ValueError("Gemini API key is required")
         self.api_key = api_key
-        self.api_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-lite:generateContent"
+        # Rate limits, retries, circuit breaker and hedging live in the client
+        self.llm = GeminiClient(api_key)
+        self.assembler = PromptAssembler(
+            budget_tokens=int(os.getenv("PROMPT_TOKEN_BUDGET", 3000)),
+            max_verbatim=int(os.getenv("PROMPT_VERBATIM_EXCHANGES", 3)),
+            summary_tokens=int(os.getenv("PROMPT_SUMMARY_TOKENS", 400))
+        )
+        # Concurrent identical requests (two tabs, React re-mounts) share one Gemini call
+        self.single_flight = SingleFlight()
         logger.info("RAG Pipeline initialized")
 
-    def build_context(self, transactions: List[Dict]) -> str:
-        if not transactions:
-            return "No transactions found."
-        
-        def safe_float(val):
-            try: return float(val)
-            except: return 0.0
+    async def close(self):
+        await self.llm.close()
+
+    def build_context(self, transactions: List[Dict], summary: Optional[Dict] = None, analytics: Optional[Dict] = None,
+                      retrieved: Optional[List[Dict]] = None) -> str:
+        """
+        summary: exact aggregates from AggregateStore.summary(). When present it is
+        used instead of re-summing the (LIMIT 50) transaction sample.
+        analytics: output of analytics.dashboard_analytics() (burn rate, trend, anomalies, upcoming bills).
+        retrieved: the transactions RetrievalIndex.search() found relevant to the question.
+        """
+        if summary is not None:
+            if not summary['count']:
+                return "No transactions found."
+            income, expenses, count = summary['income'], summary['expenses'], summary['count']
+        else:
+            if not transactions:
+                return "No transactions found."
+            
+            def safe_float(val):
+                try: return float(val)
+                except: return 0.0
 
-        income = sum(safe_float(t.get('amount')) for t in transactions if t.get('type') == 'INCOME')
-        expenses = sum(safe_float(t.get('amount')) for t in transactions if t.get('type') == 'EXPENSE')
+            income = sum(safe_float(t.get('amount')) for t in transactions if t.get('type') == 'INCOME')
+            expenses = sum(safe_float(t.get('amount')) for t in transactions if t.get('type') == 'EXPENSE')
+            count = len(transactions)
         
-        return f"""
+        context = f"""
         FINANCIAL SUMMARY:
         Total Income: ${income:,.2f}
         Total Expenses: ${expenses:,.2f}
         Net Savings: ${income - expenses:,.2f}
-        Transaction Count: {len(transactions)}
+        Transaction Count: {count}
         """
 
-    def process_query(self, user_id: int, query: str, transactions: List[Dict], history: List[Dict] = []) -> Dict[str, Any]:
+        if summary and summary['expense_categories']:
+            lines = [f"        - {c['name']}: {c['total']:,.2f} ({c['count']} transactions)" for c in summary['expense_categories'][:5]]
+            context += "TOP EXPENSE CATEGORIES:\n" + "\n".join(lines) + "\n"
+        if summary and summary['expense_merchants']:
+            lines = [f"        - {m['name']}: {m['total']:,.2f}" for m in summary['expense_merchants'][:5]]
+            context += "        TOP MERCHANTS:\n" + "\n".join(lines) + "\n"
+        if analytics:
+            context += (
+                f"        SPENDING TRENDS:\n"
+                f"        - Average daily spend: {analytics['daily_burn']:,.0f}\n"
+                f"        - Average daily spend (last 7 days): {analytics['burn_last_7']:,.0f}\n"
+                f"        - Days with spending: {analytics['active_days']} of {analytics['days']}\n"
+                f"        - Forecast next 7 days: {analytics['forecast']['amount']:,} (confidence {analytics['forecast']['confidence']}%)\n"
+            )
+            for a in analytics['anomalies']:
+                context += f"        - Unusual expense: {a['description'] or a['merchant']} ({a['category']}) {a['amount']:,.0f}\n"
+            if analytics.get('upcoming_bills'):
+                context += "        UPCOMING BILLS (recurring payments):\n"
+                for b in analytics['upcoming_bills']:
+                    context += f"        - {b['next_due_date']} {b['name']} {float(b['amount']):,.0f} ({b['frequency'].lower()})\n"
+        if retrieved:
+            context += "        RELEVANT TRANSACTIONS:\n"
+            for t in retrieved:
+                context += (
+                    f"        - {t['occurred_at'][:10]} {t['type']} {t['amount']:,.0f} | "
+                    f"{t['merchant_name']} | {t['category_name']} | {t['description'] or ''}\n"
+                )
+
+        return context
+
+    def build_chat_payload(self, context: str, query: str, history: List[Dict], conversation_summary: str = "") -> Dict[str, Any]:
         """
-        Modified to accept 'history'. 
-        history format expected from DB: [{'role': 'user', 'message': '...'}, {'role': 'model', 'message': '...'}]
+        Builds the generateContent payload for a chat turn.
+        Shared by the blocking and the streaming chat paths.
         """
-        try:
-            context = self.build_context(transactions)
-            
-            contents_payload = []
+        contents_payload = []
 
-            for turn in history:
-                role = "user" if turn['role'] == 'user' else "model"
-                contents_payload.append({
-                    "role": role,
-                    "parts": [{"text": turn['message']}]
-                })
-
-            current_prompt = f"Context: {context}\nUser Question: {query}\nAnswer concisely."
-            
+        for turn in history:
+            role = "user" if turn['role'] == 'user' else "model"
             contents_payload.append({
-                "role": "user",
-                "parts": [{"text": current_prompt}]
+                "role": role,
+                "parts": [{"text": turn['message']}]
             })
+
+        current_prompt = f"Context: {context}\nUser Question: {query}\nAnswer concisely."
+        
+        contents_payload.append({
+            "role": "user",
+            "parts": [{"text": current_prompt}]
+        })
+        
+        payload = {
+            "systemInstruction": {
+                "role": "user",
+                "parts": [
+                    {
+                        "text": (
+                            "You are a helpful AI Financial Advisor. "
+                            "CRITICAL RULES: "
+                            "1. All transaction amounts in the context are ALREADY in Vietnamese Dong (VND). "
+                            "2. DO NOT apply any currency exchange rates or multiply the numbers. If the data says 101000000, it means exactly 101,000,000 VND. "
+                            "3. Never use the dollar sign ($). Format numbers with commas and add 'VND' or 'đ' (e.g., 101,000,000 VND). "
+                            "4. Always reply in English."
+                        )
+                    }
+                ]
+            },
+            "contents": contents_payload
+        }
+        if conversation_summary:
+            # Older turns that no longer fit verbatim
+            payload["systemInstruction"]["parts"].append({"text": f"Earlier conversation summary:\n{conversation_summary}"})
+        return payload
+
+    def prepare_chat(self, query: str, transactions: List[Dict], history: List[Dict], summary: Optional[Dict] = None,
+                     retrieved: Optional[List[Dict]] = None, conversation: Optional[Dict] = None) -> Tuple[Dict[str, Any], str, Dict[str, Any]]:
+        """
+        Builds the context and fits the history into the prompt token budget.
+        conversation: the stored rolling summary from fetch_chat_summary().
+        Returns (payload, context, assembly); assembly['summary_update'] should be persisted.
+        """
+        with stage("prompt_build"):
+            context = self.build_context(transactions, summary, retrieved=retrieved)
+            bare = self.build_chat_payload(context, query, [])
+            fixed_text = "".join(p['text'] for c in [bare['systemInstruction']] + bare['contents'] for p in c['parts'])
+            assembly = self.assembler.assemble(fixed_text, history, conversation)
+            payload = self.build_chat_payload(context, query, assembly['history'], assembly['summary'])
+        return payload, context, assembly
+
+    async def process_query(self, user_id: int, query: str, transactions: List[Dict], history: List[Dict] = [], summary: Optional[Dict] = None,
+                            retrieved: Optional[List[Dict]] = None, conversation: Optional[Dict] = None) -> Dict[str, Any]:
+        """
+        Modified to accept 'history'. 
+        history format expected from DB: [{'id': 1, 'role': 'user', 'message': '...'}, {'id': 1, 'role': 'model', 'message': '...'}]
+        The result carries the prompt-size metrics ('prompt') and the rolling summary to store ('summary_update').
+        """
+        assembly = {'metrics': None, 'summary_update': None}
+        try:
+            payload, context, assembly = self.prepare_chat(query, transactions, history, summary, retrieved, conversation)
             
-            payload = {
-                "systemInstruction": {
-                    "role": "user",
-                    "parts": [
-                        {
-                            "text": (
-                                "You are a helpful AI Financial Advisor. "
-                                "CRITICAL RULES: "
-                                "1. All transaction amounts in the context are ALREADY in Vietnamese Dong (VND). "
-                                "2. DO NOT apply any currency exchange rates or multiply the numbers. If the data says 101000000, it means exactly 101,000,000 VND. "
-                                "3. Never use the dollar sign ($). Format numbers with commas and add 'VND' or 'đ' (e.g., 101,000,000 VND). "
-                                "4. Always reply in English."
-                            )
-                        }
-                    ]
-                },
-                "contents": contents_payload
-            }
-            
-            response = requests.post(
-                f"{self.api_url}?key={self.api_key}",
-                headers={"Content-Type": "application/json"},
-                json=payload
+            data = await self.single_flight.do(
+                ("chat", user_id, payload_fingerprint(payload)),
+                lambda: self.llm.generate(payload)
             )
             
-            # Check for success
-            if response.status_code != 200:
-                logger.error(f"Gemini API Error {response.status_code}: {response.text}")
-                return {
-                    "answer": f"Error from Google: {response.status_code}",
-                    "transactions_count": 0,
-                    "context_used": False,
-                    "context_preview": ""
-                }
-            
             # Parse Response
-            data = response.json()
             try:
                 answer = data['candidates'][0]['content']['parts'][0]['text']
             except (KeyError, IndexError):
@@ -104,23 +178,90 @@ class RAGPipeline:
                 'answer': answer,
                 'transactions_count': len(transactions),
                 'context_used': True,
-                'context_preview': context[:200]
+                'context_preview': context[:200],
+                'prompt': assembly['metrics'],
+                'summary_update': assembly['summary_update']
             }
             
+        except (CircuitOpen, LLMError) as e:
+            if isinstance(e, LLMError) and e.status_code not in RETRYABLE_STATUS:
+                logger.error(f"Gemini API Error {e.status_code}: {e.detail}")
+                return {
+                    "answer": f"Error from Google: {e.status_code}",
+                    "transactions_count": 0,
+                    "context_used": False,
+                    "context_preview": "",
+                    "prompt": assembly['metrics'],
+                    "summary_update": None
+                }
+            logger.warning(f"Gemini unavailable ({e}), answering user {user_id} from local data")
+            return {
+                'answer': self.fallback_answer(transactions, summary),
+                'transactions_count': len(transactions),
+                'context_used': False,
+                'context_preview': '',
+                'prompt': assembly['metrics'],
+                'summary_update': None
+            }
+        except httpx.TimeoutException:
+            logger.error(f"Gemini request timed out for user {user_id}")
+            return {
+                'answer': "The AI service took too long to respond. Please try again.",
+                'transactions_count': 0,
+                'context_used': False,
+                'context_preview': '',
+                'prompt': assembly['metrics'],
+                'summary_update': None
+            }
         except Exception as e:
             logger.error(f"RAG Pipeline Critical Failure: {e}")
             return {
                 'answer': "I'm having trouble connecting to the AI service.",
                 'transactions_count': 0,
                 'context_used': False,
-                'context_preview': ''
+                'context_preview': '',
+                'prompt': assembly['metrics'],
+                'summary_update': None
             }
-    def generate_dashboard_insights(self, transactions: List[Dict]) -> Dict[str, Any]:
+
+    async def stream_query(self, user_id: int, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Streams the answer using streamGenerateContent (SSE).
+        payload comes from prepare_chat(); yields text chunks as Gemini produces them.
+        Raises CircuitOpen / LLMError like GeminiClient.stream().
+        """
+        async for chunk in self.llm.stream(payload):
+            try:
+                parts = chunk['candidates'][0]['content']['parts']
+            except (KeyError, IndexError):
+                continue
+            for part in parts:
+                text = part.get('text')
+                if text:
+                    yield text
+
+    def fallback_answer(self, transactions: List[Dict], summary: Optional[Dict] = None) -> str:
+        """Deterministic reply used while Gemini is unavailable (open circuit, retries exhausted)"""
+        if summary is not None:
+            income, expenses = summary['income'], summary['expenses']
+        else:
+            income = sum(float(t.get('amount') or 0) for t in transactions if t.get('type') == 'INCOME')
+            expenses = sum(float(t.get('amount') or 0) for t in transactions if t.get('type') == 'EXPENSE')
+        return (
+            "The AI advisor is temporarily unavailable, so here are the basics from your data: "
+            f"income {income:,.0f} VND, expenses {expenses:,.0f} VND, net {income - expenses:,.0f} VND. "
+            "Please ask again in a minute for a detailed answer."
+        )
+
+    async def generate_dashboard_insights(self, transactions: List[Dict], summary: Optional[Dict] = None, analytics: Optional[Dict] = None,
+                                          user_id: Optional[int] = None) -> Dict[str, Any]:
         """
         Generates structured JSON data for the dashboard cards and sidebar.
+        When analytics are given, 'prediction' is the deterministic forecast, not the model's guess.
+        Concurrent calls for the same user and data share one Gemini request.
         """
         try:
-            context = self.build_context(transactions)
+            context = self.build_context(transactions, summary, analytics)
             
             prompt = f"""
             Analyze the following financial summary and return a JSON object for a dashboard.
@@ -167,24 +308,34 @@ class RAGPipeline:
                 } 
             }
             
-            response = requests.post(
-                f"{self.api_url}?key={self.api_key}",
-                headers={"Content-Type": "application/json"},
-                json=payload
+            return await self.single_flight.do(
+                ("dashboard", user_id, payload_fingerprint(payload)),
+                lambda: self._request_dashboard(payload, analytics)
             )
-            
-            if response.status_code == 200:
-                data = response.json()
-                text_content = data['candidates'][0]['content']['parts'][0]['text']
-                
-                # Clean up any potential markdown formatting just in case
-                clean_json = text_content.replace('```json', '').replace('```', '').strip()
-                return json.loads(clean_json)
-            
-            else:
-                logger.error(f"Dashboard Gen Error: {response.text}")
-                return None
 
         except Exception as e:
             logger.error(f"Dashboard Generation Failed: {e}")
-            return None
\ No newline at end of file
+            return None
+
+    async def _request_dashboard(self, payload: Dict[str, Any], analytics: Optional[Dict]) -> Optional[Dict[str, Any]]:
+        """None on failure (or an open circuit): callers serve the cached or deterministic dashboard"""
+        try:
+            data = await self.llm.generate(payload)
+        except CircuitOpen:
+            logger.warning("Gemini circuit open, skipping dashboard generation")
+            return None
+        except LLMError as e:
+            logger.error(f"Dashboard Gen Error: {e.detail}")
+            return None
+
+        text_content = data['candidates'][0]['content']['parts'][0]['text']
+        
+        # Clean up any potential markdown formatting just in case
+        clean_json = text_content.replace('```json', '').replace('```', '').strip()
+        dashboard = json.loads(clean_json)
+        if analytics:
+            dashboard['prediction'] = analytics['forecast']
+        return dashboard
+
+    def stats(self) -> Dict:
+        return {"single_flight": self.single_flight.stats(), "gemini": self.llm.stats()}
\ No newline at end of file
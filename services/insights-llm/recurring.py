@@ -0,0 +1,224 @@
+import os
+import time
+import asyncio
+import calendar
+import logging
+import argparse
+import numpy as np
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from database import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_KEY = "recurring_detect:last_tx_id"
+
+# (frequency, nominal days, shortest and longest accepted gap, occurrences needed)
+FREQUENCIES = (
+    ("WEEKLY", 7, 6, 8, 4),
+    ("MONTHLY", 30, 27, 33, 3),
+    ("YEARLY", 365, 350, 380, 2),
+)
+
+
+def add_period(day: date, frequency: str) -> date:
+    """Next occurrence after `day`: same weekday, same day of month (clamped) or same date next year"""
+    if frequency == "WEEKLY":
+        return day + timedelta(days=7)
+    if frequency == "MONTHLY":
+        year, month = (day.year + 1, 1) if day.month == 12 else (day.year, day.month + 1)
+        return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+    return date(day.year + 1, day.month, min(day.day, calendar.monthrange(day.year + 1, day.month)[1]))
+
+
+def detect_recurring(rows: List[Dict], today: Optional[date] = None, amount_tolerance: float = 0.15,
+                     min_regular: float = 0.75, grace: float = 0.5) -> List[Dict]:
+    """
+    Periodic expenses in one user's transactions.
+
+    Expenses are grouped by merchant (by category when there is no merchant) and sorted
+    by day in one lexsort; gaps between payments come from a single np.diff over all
+    groups. A group is recurring when its median gap falls in a frequency's range, at
+    least `min_regular` of its gaps do too, and its recent amounts stay within
+    `amount_tolerance` of their median. Series whose next payment is more than `grace`
+    periods late are returned with is_active False.
+    """
+    today = today or date.today()
+    expenses = [r for r in rows if r.get('type') == 'EXPENSE']
+    if len(expenses) < 2:
+        return []
+
+    day = np.array([r['occurred_at'] for r in expenses], dtype='datetime64[D]').astype(np.int64)
+    amount = np.abs(np.array([float(r.get('amount') or 0) for r in expenses], dtype=np.float64))
+    merchant = np.array([r.get('merchant_id') or 0 for r in expenses], dtype=np.int64)
+    category = np.array([r.get('category_id') or 0 for r in expenses], dtype=np.int64)
+    # Merchant ids as they are, merchant-less rows keyed by negative category; 0 = neither (skipped)
+    key = np.where(merchant > 0, merchant, -category)
+
+    order = np.lexsort((day, key))
+    key, day, amount, category = key[order], day[order], amount[order], category[order]
+
+    # Several payments to the same payee on one day count once (the total)
+    new_day = np.r_[True, (key[1:] != key[:-1]) | (day[1:] != day[:-1])]
+    starts_day = np.flatnonzero(new_day)
+    amount = np.add.reduceat(amount, starts_day)
+    key, day, category = key[new_day], day[new_day], category[new_day]
+
+    gaps = np.diff(day)
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    ends = np.r_[starts[1:], len(key)]
+    today_day = np.datetime64(today, 'D').astype(np.int64)
+
+    rules = []
+    for start, end in zip(starts, ends):
+        if key[start] == 0 or end - start < 2:
+            continue
+        group_gaps = gaps[start:end - 1]
+        median_gap = float(np.median(group_gaps))
+        match = next((f for f in FREQUENCIES if f[2] <= median_gap <= f[3]), None)
+        if match is None or end - start < match[4]:
+            continue
+        frequency, nominal, low, high, _ = match
+        if np.mean((group_gaps >= low) & (group_gaps <= high)) < min_regular:
+            continue
+
+        recent = amount[max(start, end - 6):end]
+        typical = float(np.median(recent))
+        if typical <= 0 or np.mean(np.abs(recent - typical) <= amount_tolerance * typical) < min_regular:
+            continue
+
+        last = date.fromordinal(date(1970, 1, 1).toordinal() + int(day[end - 1]))
+        next_due = add_period(last, frequency)
+        late_days = today_day - np.datetime64(next_due, 'D').astype(np.int64)
+        rules.append({
+            "merchant_id": int(key[start]) if key[start] > 0 else None,
+            "category_id": int(category[end - 1]) or None,
+            "amount": round(typical, 2),
+            "frequency": frequency,
+            "next_due_date": next_due,
+            "is_active": bool(late_days <= grace * nominal),
+            "occurrences": int(end - start),
+        })
+    return rules
+
+
+def rule_key(rule: Dict) -> Tuple:
+    """Rules are matched by payee: the merchant, or the category when there is none"""
+    if rule.get('merchant_id'):
+        return rule['user_id'], rule['merchant_id'], None
+    return rule['user_id'], None, rule.get('category_id')
+
+
+def plan_changes(detected: List[Dict], existing: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+    """
+    (updates, inserts): detected rules that match an existing rule update it (first by id);
+    new ones are inserted only when active. Existing rules nothing was detected for stay as they are.
+    """
+    by_key: Dict[Tuple, Dict] = {}
+    for rule in existing:
+        by_key.setdefault(rule_key(rule), rule)
+
+    updates, inserts = [], []
+    for rule in detected:
+        current = by_key.get(rule_key(rule))
+        if current is not None:
+            if (
+                current['frequency'] != rule['frequency'] or current['next_due_date'] != rule['next_due_date']
+                or bool(current['is_active']) != rule['is_active'] or float(current['amount'] or 0) != rule['amount']
+                or current['category_id'] != rule['category_id']
+            ):
+                updates.append({**rule, "id": current['id']})
+        elif rule['is_active']:
+            inserts.append(rule)
+    return updates, inserts
+
+
+class RecurringDetector:
+    """
+    Fills financedb.recurring_rules from transaction history.
+
+    Users are scanned in batches: each batch's history comes from the set-based
+    DatabaseManager.iter_user_windows() read, is analyzed per user with
+    detect_recurring(), and the rules are written in one transaction. Reruns only
+    rescan users with transactions past the job_state watermark, plus users whose
+    active rules are overdue (so cancelled subscriptions get deactivated).
+    """
+
+    def __init__(self, db_manager: DatabaseManager, lookback_days: int = 800, batch_users: int = 500,
+                 overdue_grace_days: int = 7):
+        self.db = db_manager
+        self.lookback_days = lookback_days
+        self.batch_users = batch_users
+        self.overdue_grace_days = overdue_grace_days
+
+    def _process_batch(self, user_ids: List[int], today: date) -> Dict[str, int]:
+        """Runs in a DB worker thread"""
+        detected: List[Dict] = []
+        for user_id, rows in self.db.iter_user_windows(user_ids, self.lookback_days):
+            for rule in detect_recurring(rows, today):
+                rule['user_id'] = user_id
+                detected.append(rule)
+
+        updates, inserts = plan_changes(detected, self.db.fetch_recurring_rules(user_ids))
+        self.db.save_recurring_rules(updates, inserts)
+        return {
+            "detected": len(detected),
+            "active": sum(1 for r in detected if r['is_active']),
+            "updated": len(updates),
+            "inserted": len(inserts),
+        }
+
+    async def run(self, full: bool = False) -> Dict:
+        started = time.monotonic()
+        today = date.today()
+        high_watermark = await self.db.run(self.db.fetch_max_transaction_id)
+        last = None if full else await self.db.run(self.db.get_job_state, WATERMARK_KEY)
+
+        if last is None:
+            targets = await self.db.run(self.db.fetch_active_user_ids, self.lookback_days)
+        else:
+            changed = set(await self.db.run(self.db.fetch_active_user_ids, self.lookback_days, int(last)))
+            changed.update(await self.db.run(self.db.fetch_overdue_recurring_user_ids, self.overdue_grace_days))
+            targets = sorted(changed)
+        logger.info(f"Recurring detection: {len(targets)} users to scan")
+
+        totals = {"users": len(targets), "detected": 0, "active": 0, "updated": 0, "inserted": 0}
+        for i in range(0, len(targets), self.batch_users):
+            counts = await self.db.run(self._process_batch, targets[i:i + self.batch_users], today)
+            for name, value in counts.items():
+                totals[name] += value
+
+        await self.db.run(self.db.set_job_state, WATERMARK_KEY, str(high_watermark))
+        totals["seconds"] = round(time.monotonic() - started, 2)
+        logger.info(f"Recurring detection finished: {totals}")
+        return totals
+
+
+async def main(args):
+    db_manager = DatabaseManager()
+    detector = RecurringDetector(
+        db_manager,
+        lookback_days=int(os.getenv("RECURRING_LOOKBACK_DAYS", 800)),
+        batch_users=int(os.getenv("RECURRING_BATCH_USERS", 500))
+    )
+
+    try:
+        while True:
+            await detector.run(full=args.full)
+            if not args.loop:
+                break
+            args.full = False
+            await asyncio.sleep(args.loop)
+    finally:
+        db_manager.close()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Detect recurring payments and update recurring_rules")
+    parser.add_argument("--full", action="store_true", help="ignore the watermark and rescan every user")
+    parser.add_argument("--loop", type=int, default=0, help="rerun incrementally every N seconds")
+    asyncio.run(main(parser.parse_args()))
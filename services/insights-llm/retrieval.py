@@ -0,0 +1,306 @@
+import os
+import re
+import json
+import zlib
+import fcntl
+import logging
+import threading
+import numpy as np
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DIM = 512
+_TOKEN = re.compile(r"[a-z0-9]+")
+_LAST_N_DAYS = re.compile(r"\b(?:last|past) (\d+) days\b")
+_STOPWORDS = {
+    "a", "an", "the", "i", "me", "my", "did", "do", "does", "what", "how", "much", "many", "at", "on",
+    "in", "to", "for", "of", "and", "or", "is", "was", "were", "pay", "paid", "spend", "spent", "buy",
+    "bought", "when", "where", "which", "this", "last", "month", "week", "year", "today", "yesterday",
+}
+
+
+def parse_period(text: str, today: Optional[date] = None) -> Optional[Tuple[date, date]]:
+    """
+    Date range mentioned in a question, e.g. 'last month' -> (first, last day of previous month).
+    Returns None when the text names no period.
+    """
+    today = today or date.today()
+    text = text.lower()
+    if "today" in text:
+        return today, today
+    if "yesterday" in text:
+        day = today - timedelta(days=1)
+        return day, day
+    if "this week" in text:
+        start = today - timedelta(days=today.weekday())
+        return start, today
+    if "last week" in text:
+        start = today - timedelta(days=today.weekday() + 7)
+        return start, start + timedelta(days=6)
+    if "this month" in text:
+        return today.replace(day=1), today
+    if "last month" in text:
+        end = today.replace(day=1) - timedelta(days=1)
+        return end.replace(day=1), end
+    if "this year" in text:
+        return today.replace(month=1, day=1), today
+    if "last year" in text:
+        return date(today.year - 1, 1, 1), date(today.year - 1, 12, 31)
+    match = _LAST_N_DAYS.search(text)
+    if match:
+        return today - timedelta(days=max(int(match.group(1)), 1) - 1), today
+    return None
+
+
+def tokens(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def embed(text: str) -> np.ndarray:
+    """
+    Feature-hashed bag of words, word bigrams and character trigrams, L2 normalized.
+    Deterministic across processes (crc32), so vectors written by one worker are valid in all.
+    """
+    vec = np.zeros(DIM, dtype=np.float32)
+    words = tokens(text)
+    features = words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f"#{word}#"
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    for feature in features:
+        h = zlib.crc32(feature.encode())
+        vec[h % DIM] += 1.0 if (h >> 16) & 1 else -1.0
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+def document_text(row: Dict) -> str:
+    merchant = row.get("merchant_name") or ""
+    category = row.get("category_name") or ""
+    description = row.get("description") or ""
+    # Merchant and category carry most of the signal; repeat them to weight them up
+    return f"{merchant} {merchant} {category} {category} {description} {row.get('type') or ''}"
+
+
+def compact_row(row: Dict) -> Dict[str, Any]:
+    occurred_at = row.get("occurred_at")
+    if isinstance(occurred_at, (datetime, date)):
+        occurred_at = occurred_at.isoformat()
+    return {
+        "occurred_at": str(occurred_at)[:19],
+        "type": row.get("type"),
+        "amount": float(row.get("amount") or 0),
+        "category_name": row.get("category_name"),
+        "merchant_name": row.get("merchant_name"),
+        "description": row.get("description"),
+    }
+
+
+class _LoadedIndex:
+    def __init__(self, vectors: np.ndarray, meta: List[Dict], stamp: Tuple[int, int]):
+        self.vectors = vectors
+        self.stamp = stamp
+        self.rows: List[Dict] = []
+        self.positions: List[int] = []
+
+        # Latest entry per transaction id wins; tombstones remove it
+        latest: Dict[int, int] = {}
+        for pos, entry in enumerate(meta):
+            latest[entry["id"]] = pos
+        for tx_id, pos in latest.items():
+            if not meta[pos].get("deleted"):
+                self.positions.append(pos)
+                self.rows.append(meta[pos]["row"])
+        self.positions_arr = np.array(self.positions, dtype=np.int64)
+        self.days = np.array([r["occurred_at"][:10] for r in self.rows], dtype="datetime64[D]") if self.rows else np.empty(0, "datetime64[D]")
+        self.dead = len(meta) - len(self.positions)
+
+
+class RetrievalIndex:
+    """
+    Per-user similarity index over transaction rows.
+
+    {dir}/{user}.vec   float16 matrix (rows x DIM), append-only, read through np.memmap
+    {dir}/{user}.meta  one JSON line per vector row: {"id", "row"} or {"id", "deleted": true}
+
+    New, updated and deleted transactions are appended; superseded rows are dropped
+    when the dead fraction gets large. Only the top-k rows go into the prompt.
+
+    Appends happen in place under an exclusive flock; builds and compactions write new
+    files and os.replace() them in, so memmaps other threads and workers still hold keep
+    reading the old inode. Readers take the flock shared to see both files at one point.
+    """
+
+    def __init__(self, db_manager, index_dir: str = "data/retrieval", history_days: int = 3650,
+                 cache_users: int = 256, compact_ratio: float = 0.3, min_score: float = 0.15):
+        self.db = db_manager
+        self.index_dir = index_dir
+        self.history_days = history_days
+        self.cache_users = cache_users
+        self.compact_ratio = compact_ratio
+        self.min_score = min_score
+        os.makedirs(index_dir, exist_ok=True)
+
+        self._loaded: "OrderedDict[int, _LoadedIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.searches = 0
+        self.builds = 0
+        self.appends = 0
+        self.compactions = 0
+        logger.info(f"Retrieval index initialized at {index_dir}")
+
+    def _paths(self, user_id: int) -> Tuple[str, str]:
+        base = os.path.join(self.index_dir, str(user_id))
+        return f"{base}.vec", f"{base}.meta"
+
+    def _locked(self, user_id: int, shared: bool = False):
+        lock_file = open(os.path.join(self.index_dir, f"{user_id}.lock"), "a")
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        return lock_file
+
+    @staticmethod
+    def _write(vec_path: str, meta_path: str, entries: List[Dict], vectors: np.ndarray, mode: str):
+        with open(meta_path, mode) as meta_file, open(vec_path, mode + "b") as vec_file:
+            vec_file.write(vectors.astype(np.float16).tobytes())
+            meta_file.write("".join(json.dumps(e) + "\n" for e in entries))
+
+    def _replace(self, user_id: int, entries: List[Dict], vectors: np.ndarray):
+        """Writes both files aside and swaps them in; the caller holds the exclusive lock"""
+        vec_path, meta_path = self._paths(user_id)
+        self._write(f"{vec_path}.tmp", f"{meta_path}.tmp", entries, vectors, "w")
+        os.replace(f"{meta_path}.tmp", meta_path)
+        os.replace(f"{vec_path}.tmp", vec_path)
+
+    def _read(self, user_id: int) -> Tuple[_LoadedIndex, List[Dict]]:
+        """Both files as they are now, and the meta lines; the caller holds the lock"""
+        vec_path, meta_path = self._paths(user_id)
+        stat = os.stat(vec_path)
+        with open(meta_path) as f:
+            meta = [json.loads(line) for line in f]
+        rows = min(len(meta), stat.st_size // (DIM * 2))
+        vectors = np.memmap(vec_path, dtype=np.float16, mode="r", shape=(rows, DIM)) if rows else np.empty((0, DIM), np.float16)
+        return _LoadedIndex(vectors, meta[:rows], (stat.st_ino, stat.st_size)), meta
+
+    # ---------- Build / update (blocking; call from a worker thread) ----------
+
+    def build(self, user_id: int) -> int:
+        rows = list(self.db.iter_transactions(self.history_days, user_id=user_id))
+        entries = [{"id": r["id"], "row": compact_row(r)} for r in rows]
+        vectors = np.stack([embed(document_text(r)) for r in rows]) if rows else np.empty((0, DIM), np.float32)
+
+        lock = self._locked(user_id)
+        try:
+            self._replace(user_id, entries, vectors)
+        finally:
+            lock.close()
+        self.builds += 1
+        logger.info(f"Retrieval index built for user {user_id} ({len(rows)} rows)")
+        return len(rows)
+
+    def apply(self, user_id: int, transaction_id: int, row: Optional[Dict]):
+        """Append the new version of a transaction (or a tombstone when row is None)"""
+        vec_path, meta_path = self._paths(user_id)
+        if not os.path.exists(vec_path):
+            return  # Not built yet; the first search builds from SQL
+
+        if row:
+            entry = {"id": transaction_id, "row": compact_row(row)}
+            vector = embed(document_text(row))
+        else:
+            entry = {"id": transaction_id, "deleted": True}
+            vector = np.zeros(DIM, dtype=np.float32)
+
+        lock = self._locked(user_id)
+        try:
+            self._write(vec_path, meta_path, [entry], vector[None, :], "a")
+        finally:
+            lock.close()
+        self.appends += 1
+
+    def _compact(self, user_id: int):
+        lock = self._locked(user_id)
+        try:
+            # Re-read under the lock: appends since the caller's read must survive the rewrite
+            index, meta = self._read(user_id)
+            if not index.dead:
+                return
+            entries = [meta[pos] for pos in index.positions]
+            vectors = np.asarray(index.vectors[index.positions_arr], dtype=np.float32)
+            self._replace(user_id, entries, vectors)
+        finally:
+            lock.close()
+        self.compactions += 1
+
+    # ---------- Read path ----------
+
+    def _load(self, user_id: int) -> Optional[_LoadedIndex]:
+        vec_path, _ = self._paths(user_id)
+        if not os.path.exists(vec_path):
+            self.build(user_id)
+
+        lock = self._locked(user_id, shared=True)
+        try:
+            stat = os.stat(vec_path)
+            with self._lock:
+                cached = self._loaded.get(user_id)
+                if cached and cached.stamp == (stat.st_ino, stat.st_size):
+                    self._loaded.move_to_end(user_id)
+                    return cached
+            index, _ = self._read(user_id)
+        finally:
+            lock.close()
+
+        if index.dead and index.dead > self.compact_ratio * len(index.vectors):
+            self._compact(user_id)
+            return self._load(user_id)
+
+        with self._lock:
+            self._loaded[user_id] = index
+            self._loaded.move_to_end(user_id)
+            while len(self._loaded) > self.cache_users:
+                self._loaded.popitem(last=False)
+        return index
+
+    def search(self, user_id: int, query: str, k: int = 8) -> List[Dict]:
+        """
+        Top-k transactions for a question, restricted to the period it names (if any).
+        """
+        index = self._load(user_id)
+        self.searches += 1
+        if not index or not index.rows:
+            return []
+
+        candidates = np.arange(len(index.rows))
+        period = parse_period(query)
+        if period:
+            start, end = np.datetime64(period[0]), np.datetime64(period[1])
+            candidates = np.flatnonzero((index.days >= start) & (index.days <= end))
+            if not len(candidates):
+                return []
+
+        scores = np.zeros(len(candidates), dtype=np.float32)
+        if tokens(query):
+            scores = np.asarray(index.vectors[index.positions_arr[candidates]], dtype=np.float32) @ embed(query)
+            relevant = scores >= self.min_score
+            if relevant.any():
+                candidates, scores = candidates[relevant], scores[relevant]
+            elif not period:
+                return []
+            else:
+                scores = np.zeros(len(candidates), dtype=np.float32)
+        # Otherwise (e.g. "what did I buy last month"): most recent rows in the period
+        order = np.lexsort((-index.days[candidates].astype(np.int64), -scores))[:k]
+        return [index.rows[candidates[i]] for i in order]
+
+    def stats(self) -> Dict:
+        return {
+            "loaded_users": len(self._loaded),
+            "searches": self.searches,
+            "builds": self.builds,
+            "appends": self.appends,
+            "compactions": self.compactions,
+        }
@@ -0,0 +1,51 @@
+import json
+import asyncio
+import hashlib
+import logging
+from typing import Dict, Any, Callable, Awaitable, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+def payload_fingerprint(payload: Any) -> str:
+    """Stable hash of a request payload: identical prompts get identical keys"""
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: the first caller for a key runs the call,
+    everyone arriving while it is in flight awaits the same result.
+
+    The call runs in its own task, so a caller that disconnects (and is cancelled)
+    does not cancel it for the others. Nothing is cached once the call completes.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.deduplicated = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.deduplicated += 1
+        else:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        # Mark a failure as retrieved even if every caller went away
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Coalesced call {key} failed: {task.exception()}")
+
+    def stats(self) -> Dict:
+        return {
+            "in_flight": len(self._inflight),
+            "upstream_calls": self.calls,
+            "deduplicated": self.deduplicated,
+        }
@@ -0,0 +1,89 @@
+import asyncio
+from datetime import date, timedelta
+import fakeredis
+import pytest
+from aggregates import AggregateStore, summarize_counters, summary_from_rows, to_cents
+
+TODAY = date.today()
+
+
+def tx(amount, tx_type="EXPENSE", category="Groceries", merchant="Mart", days_ago=0):
+    return {"amount": amount, "type": tx_type, "category_name": category, "merchant_name": merchant,
+            "occurred_at": TODAY - timedelta(days=days_ago)}
+
+
+@pytest.fixture
+def store():
+    store = AggregateStore("redis://localhost", db_manager=None)
+    store.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    return store
+
+
+async def summary(store, user_id=1):
+    fields = await store.redis.hgetall(store._key(user_id))
+    return summarize_counters(fields, 30, store._cutoff(30))
+
+
+def test_to_cents_is_exact():
+    assert to_cents("0.29") == 29
+    assert to_cents(1234.56) == 123456
+    assert to_cents("-15.10") == -1510
+    assert to_cents(None) == 0
+
+
+def test_apply_change_adds_updates_and_deletes(store):
+    async def run():
+        await store.apply_change(1, 10, tx("100.50"))
+        await store.apply_change(1, 11, tx(2000, tx_type="INCOME", category="Salary"))
+        assert (await summary(store))["expenses"] == 100.5
+
+        old, new = await store.apply_change(1, 10, tx(40, category="Coffee"))
+        assert old["category"] == "Groceries" and new["category"] == "Coffee"
+        result = await summary(store)
+        assert result["expense_categories"] == [{"name": "Coffee", "total": 40.0, "count": 1}]
+        assert (result["income"], result["net"], result["count"]) == (2000.0, 1960.0, 2)
+
+        await store.apply_change(1, 10, None)
+        assert (await summary(store))["expenses"] == 0.0
+        # Replaying an event changes nothing
+        old, new = await store.apply_change(1, 11, tx(2000, tx_type="INCOME", category="Salary"))
+        assert old == new
+        assert (await summary(store))["income"] == 2000.0
+        assert store.stats()["events_applied"] == 4
+    asyncio.run(run())
+
+
+def test_rows_past_retention_are_not_counted(store):
+    asyncio.run(store.apply_change(1, 10, tx(100, days_ago=store.retention_days + 1)))
+    assert asyncio.run(store.redis.hgetall(store._key(1))) == {}
+
+
+def test_concurrent_events_for_one_transaction_apply_once(store):
+    async def run():
+        await asyncio.gather(*(store.apply_change(1, 10, tx(100)) for _ in range(10)))
+        result = await summary(store)
+        assert (result["expenses"], result["expense_count"]) == (100.0, 1)
+        assert store.stats()["conflicts"] > 0
+
+        # Each change is applied against what the previous one left
+        await asyncio.gather(*(store.apply_change(1, 10, tx(amount)) for amount in (200, 300, 400)))
+        result = await summary(store)
+        assert result["expense_count"] == 1
+        assert result["expenses"] in (200.0, 300.0, 400.0)
+    asyncio.run(run())
+
+
+def test_summary_from_rows_matches_the_redis_counters(store):
+    rows = [tx(100), tx(50, merchant="Shop", days_ago=3), tx(900, tx_type="INCOME", category="Salary"),
+            tx(10, tx_type="TRANSFER", days_ago=1)]
+
+    async def run():
+        for tx_id, row in enumerate(rows):
+            await store.apply_change(1, tx_id, row)
+        return await summary(store)
+    assert summary_from_rows(rows) == asyncio.run(run())
+
+
+def test_fingerprint_changes_with_the_data():
+    assert AggregateStore.fingerprint({"income": 1}) == AggregateStore.fingerprint({"income": 1})
+    assert AggregateStore.fingerprint({"income": 1}) != AggregateStore.fingerprint({"income": 2})
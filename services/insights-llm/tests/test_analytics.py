@@ -0,0 +1,67 @@
+from datetime import date, datetime
+import numpy as np
+from analytics import TransactionFrame, analyze
+
+TODAY = date(2026, 6, 30)
+
+
+def row(day, amount, category="Groceries", merchant="Mart", tx_type="EXPENSE"):
+    return {"occurred_at": datetime(2026, 6, day, 12, 0), "amount": amount, "type": tx_type,
+            "category_name": category, "merchant_name": merchant, "description": f"{merchant} {day}"}
+
+
+def test_empty_frame():
+    frame = TransactionFrame([], today=TODAY)
+    assert len(frame) == 0
+    assert frame.category_spend() == []
+    assert frame.daily_spend().tolist() == [0.0] * 30
+    assert frame.forecast_next_week()["amount"] == 0
+    assert frame.summary()["active_days"] == 0
+
+
+def test_window_and_category_spend():
+    rows = [
+        row(1, 100), row(2, -300, category="Rent"), row(2, 50),
+        row(3, 1000, tx_type="INCOME", category="Salary"),
+        {**row(1, 999), "occurred_at": datetime(2026, 5, 31, 12, 0)},  # before the 30-day window
+    ]
+    frame = TransactionFrame(rows, days=30, today=TODAY)
+    assert frame.category_spend() == [
+        {"name": "Rent", "total": 300.0, "count": 1},
+        {"name": "Groceries", "total": 150.0, "count": 2},
+    ]
+    daily = frame.daily_spend()
+    assert daily[0] == 100.0 and daily[1] == 350.0 and daily.sum() == 450.0
+    summary = frame.summary()
+    assert summary["total_expense"] == 450.0
+    assert summary["total_income"] == 1000.0
+    assert summary["active_days"] == 2
+
+
+def test_moving_average():
+    rows = [row(day, 70) for day in range(24, 31)]
+    frame = TransactionFrame(rows, today=TODAY)
+    moving = frame.moving_average(7)
+    assert len(moving) == 24
+    assert moving[-1] == 70.0
+    assert np.isclose(moving[-2], 60.0)
+
+
+def test_one_off_purchase_is_an_anomaly_and_left_out_of_the_forecast():
+    rows = [row(day, 100 + day % 3) for day in range(1, 31)]
+    baseline = TransactionFrame(rows, today=TODAY).forecast_next_week()
+    rows.append(row(15, 50000, merchant="Electronics"))
+    frame = TransactionFrame(rows, today=TODAY)
+
+    anomalies = frame.anomalies()
+    assert [a["merchant"] for a in anomalies] == ["Electronics"]
+    assert anomalies[0]["amount"] == 50000.0
+    assert frame.forecast_next_week()["amount"] == baseline["amount"]
+    assert 40 <= baseline["confidence"] <= 95
+
+
+
+def test_analyze_summarizes_the_window():
+    summary = analyze([row(1, 100)], days=7)
+    assert summary["days"] == 7
+    assert set(summary) >= {"category_spend", "anomalies", "forecast", "daily_burn"}
@@ -0,0 +1,80 @@
+from answer_cache import AnswerCache, content_tokens, normalize_query
+
+RESULT = {"answer": "You spent 1,000 VND."}
+
+
+def test_normalize_query():
+    assert normalize_query("  How much did I spend   THIS month?? ") == "how much did i spend this month"
+
+
+def test_content_tokens_drop_filler_only():
+    assert content_tokens("how much did i spend on coffee in the last 30 days") == {"much", "spend", "coffee", "last", "30", "days"}
+
+
+def test_exact_and_near_duplicate_hits():
+    cache = AnswerCache()
+    cache.put(1, "How much did I spend this month?", "fp", RESULT)
+    assert cache.get(1, "how much did i spend this month", "fp") == RESULT
+    assert cache.get(1, "How much did I spend this month, please", "fp") == RESULT
+    assert cache.get(2, "How much did I spend this month?", "fp") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["near_hits"], stats["misses"]) == (1, 1, 1)
+
+
+def test_near_duplicates_must_name_the_same_period():
+    cache = AnswerCache()
+    cache.put(1, "How much did I spend this month?", "fp", RESULT)
+    assert cache.get(1, "How much did I spend last month?", "fp") is None
+    cache.put(1, "spending in the last 30 days", "fp", RESULT)
+    assert cache.get(1, "spending in the last 31 days", "fp") is None
+
+
+def test_differently_named_categories_do_not_collide():
+    cache = AnswerCache()
+    cache.put(1, "How much did I spend on bus this week?", "fp", RESULT)
+    cache.put(1, "How much did I spend on car this month?", "fp", RESULT)
+    assert cache.get(1, "How much did I spend on bar this week?", "fp") is None
+    assert cache.get(1, "How much did I spend on cat this month?", "fp") is None
+    assert cache.get(1, "how much did I spend on the bus this week", "fp") == RESULT
+
+
+def test_new_fingerprint_drops_the_users_answers():
+    cache = AnswerCache()
+    cache.put(1, "q one", "old", RESULT)
+    cache.put(1, "q two", "old", RESULT)
+    cache.put(2, "q one", "old", RESULT)
+    assert cache.get(1, "q one", "new") is None
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["invalidations"] == 1
+    assert cache.get(2, "q one", "old") == RESULT
+
+
+def test_invalidate_user():
+    cache = AnswerCache()
+    cache.put(1, "q", "fp", RESULT)
+    cache.invalidate_user(1)
+    assert cache.get(1, "q", "fp") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_ttl_expiry(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr("answer_cache.time.monotonic", lambda: clock[0])
+    cache = AnswerCache(ttl=10)
+    cache.put(1, "q", "fp", RESULT)
+    clock[0] += 9
+    assert cache.get(1, "q", "fp") == RESULT
+    clock[0] += 2
+    assert cache.get(1, "q", "fp") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_is_evicted():
+    cache = AnswerCache(max_entries=2)
+    cache.put(1, "first question", "fp", RESULT)
+    cache.put(1, "second question", "fp", RESULT)
+    cache.get(1, "first question", "fp")
+    cache.put(1, "third question", "fp", RESULT)
+    assert cache.stats()["evictions"] == 1
+    assert cache.get(1, "second question", "fp") is None
+    assert cache.get(1, "first question", "fp") == RESULT
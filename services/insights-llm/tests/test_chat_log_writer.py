@@ -0,0 +1,121 @@
+import os
+import json
+import asyncio
+from chat_log_writer import ChatLogWriter
+
+
+class StubDB:
+    def __init__(self):
+        self.saved = []
+        self.batches = 0
+        self.down = False
+
+    async def run(self, fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    def save_chat_logs(self, rows):
+        if self.down:
+            raise ConnectionError("insightsdb unavailable")
+        self.batches += 1
+        self.saved.extend(rows)
+
+
+def chat_row(n, user_id=1):
+    return {"user_id": user_id, "user_query": f"question {n}", "ai_response": f"answer {n}"}
+
+
+def writer(tmp_path, db, **kwargs):
+    return ChatLogWriter(db, spill_dir=str(tmp_path), **kwargs)
+
+
+def spill_lines(log_writer):
+    if not os.path.exists(log_writer.spill_path):
+        return []
+    with open(log_writer.spill_path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_rows_are_written_in_batches_and_visible_until_then(tmp_path):
+    async def run():
+        db = StubDB()
+        log_writer = writer(tmp_path, db, batch_size=2)
+        for n in range(3):
+            await log_writer.submit(chat_row(n))
+        merged = log_writer.merge(1, [], limit=10)
+        assert [r["user_query"] for r in merged] == ["question 2", "question 1", "question 0"]
+
+        await log_writer.flush()
+        assert db.saved == [chat_row(n) for n in range(3)]
+        assert db.batches == 2
+        assert log_writer.merge(1, [], limit=10) == []
+        assert log_writer.pending == 0
+    asyncio.run(run())
+
+
+def test_failed_flush_spills_and_replays_once_the_database_is_back(tmp_path):
+    async def run():
+        db = StubDB()
+        db.down = True
+        log_writer = writer(tmp_path, db, batch_size=2)
+        for n in range(3):
+            await log_writer.submit(chat_row(n))
+        await log_writer.flush()
+
+        assert db.saved == []
+        assert [e["row"] for e in spill_lines(log_writer)] == [chat_row(n) for n in range(3)]
+        assert log_writer.stats()["spilled"] == 3
+        # Spilled rows are still shown to their user
+        assert len(log_writer.merge(1, [], limit=10)) == 3
+
+        await log_writer.replay_spill()
+        assert db.saved == []
+        assert len(spill_lines(log_writer)) == 3
+
+        db.down = False
+        await log_writer.replay_spill()
+        assert db.saved == [chat_row(n) for n in range(3)]
+        assert spill_lines(log_writer) == []
+        assert log_writer.merge(1, [], limit=10) == []
+        assert log_writer.stats()["replayed"] == 3
+    asyncio.run(run())
+
+
+def test_full_buffer_waits_then_spills(tmp_path):
+    async def run():
+        db = StubDB()
+        log_writer = writer(tmp_path, db, max_pending=1, backpressure_timeout=0.05)
+        await log_writer.submit(chat_row(0))
+        await log_writer.submit(chat_row(1))
+        assert log_writer.stats()["backpressure_waits"] == 1
+        assert [e["row"] for e in spill_lines(log_writer)] == [chat_row(1)]
+
+        # Room is made while the next one waits: it is queued, not spilled
+        waiting = asyncio.create_task(log_writer.submit(chat_row(2)))
+        await asyncio.sleep(0.01)
+        await log_writer.flush()
+        await waiting
+        assert log_writer.pending == 1
+        assert len(spill_lines(log_writer)) == 1
+    asyncio.run(run())
+
+
+def test_merge_skips_rows_already_persisted(tmp_path):
+    async def run():
+        log_writer = writer(tmp_path, StubDB())
+        await log_writer.submit(chat_row(1))
+        log_writer._buffer[0]["state"] = "flushing"
+        persisted = [{"id": 7, **chat_row(1)}]
+        assert log_writer.merge(1, persisted, limit=10) == persisted
+        assert log_writer.merge(2, persisted, limit=10) == persisted
+    asyncio.run(run())
+
+
+def test_close_drains_the_buffer(tmp_path):
+    async def run():
+        db = StubDB()
+        log_writer = writer(tmp_path, db, flush_interval=10)
+        log_writer.start()
+        await log_writer.submit(chat_row(0))
+        await log_writer.close()
+        assert db.saved == [chat_row(0)]
+    asyncio.run(run())
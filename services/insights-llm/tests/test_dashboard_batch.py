@@ -0,0 +1,100 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from dashboard_batch import DashboardBatch
+
+
+def window(user_id, n=3):
+    now = datetime.now()
+    return [{"occurred_at": now - timedelta(days=i), "amount": 100 * (i + 1), "type": "EXPENSE", "category_name": "Food",
+             "merchant_name": "Mart", "description": "", "recency": i + 1} for i in range(n)]
+
+
+class StubDB:
+    def __init__(self):
+        self.closed = False
+        self.read = []
+
+    async def run(self, fn, *args, **kwargs):
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+    def fetch_upcoming_bills_many(self, user_ids, days):
+        return {user_ids[0]: [{"name": "Netflix", "amount": 260000}]}
+
+    def iter_user_windows(self, user_ids, days):
+        try:
+            for user_id in user_ids:
+                self.read.append(user_id)
+                yield user_id, window(user_id)
+        finally:
+            self.closed = True
+
+
+class StubRAG:
+    def __init__(self, fail_for=()):
+        self.fail_for = set(fail_for)
+        self.analytics = {}
+
+    async def generate_dashboard_insights(self, transactions, summary, analytics, user_id=None):
+        await asyncio.sleep(0.001)
+        self.analytics[user_id] = analytics
+        if user_id in self.fail_for:
+            return None
+        return {"initial_message": f"hello {user_id}", "transactions": len(transactions)}
+
+
+class StubCache:
+    def __init__(self, fresh):
+        self.fresh = fresh
+        self.stored = {}
+
+    async def get_fresh_many(self, user_ids):
+        return {uid: self.fresh[uid] for uid in user_ids if uid in self.fresh}
+
+    async def set(self, user_id, data):
+        self.stored[user_id] = data
+
+
+async def collect(batch, user_ids, **kwargs):
+    return [result async for result in batch.run(user_ids, **kwargs)]
+
+
+def test_every_user_gets_a_dashboard():
+    db, rag = StubDB(), StubRAG(fail_for={3})
+    cache = StubCache({2: {"initial_message": "cached"}})
+    batch = DashboardBatch(rag, db, cache, concurrency=2)
+    results = asyncio.run(collect(batch, [1, 2, 3, 4, 1]))
+
+    by_user = {r["user_id"]: r for r in results}
+    assert results[0]["source"] == "cache" and results[0]["user_id"] == 2
+    assert sorted(by_user) == [1, 2, 3, 4]
+    assert by_user[1]["source"] == "generated" and by_user[1]["dashboard"]["transactions"] == 3
+    assert by_user[3]["source"] == "summary" and by_user[3]["summary"]["count"] == 3
+    assert rag.analytics[1]["upcoming_bills"] == [{"name": "Netflix", "amount": 260000}]
+    assert rag.analytics[4]["upcoming_bills"] == []
+    assert set(cache.stored) == {1, 4}
+    assert db.closed
+    assert batch.stats() == {"batches": 1, "users": 4, "cached": 1, "generated": 2, "fallbacks": 1}
+
+
+def test_too_many_users_is_rejected():
+    batch = DashboardBatch(StubRAG(), StubDB(), max_users=2)
+    with pytest.raises(ValueError):
+        asyncio.run(collect(batch, [1, 2, 3]))
+
+
+def test_reader_going_away_stops_the_query_and_the_workers():
+    async def run():
+        db = StubDB()
+        batch = DashboardBatch(StubRAG(), db, concurrency=2)
+        stream = batch.run(list(range(1, 1001)), use_cache=False)
+        first = await stream.__anext__()
+        await stream.aclose()
+        await asyncio.sleep(0.6)
+        return first, db, [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+
+    first, db, leftover = asyncio.run(run())
+    assert first["source"] == "generated"
+    assert leftover == []
+    assert db.closed
+    assert len(db.read) < 1000
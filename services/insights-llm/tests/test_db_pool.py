@@ -0,0 +1,113 @@
+import time
+import threading
+import pytest
+from db_pool import ConnectionPool, PoolExhausted
+
+
+class FakeConnection:
+    def __init__(self):
+        self.alive = True
+        self.closed = False
+        self.in_transaction = False
+        self.fail_rollback = False
+
+    def ping(self, reconnect=False):
+        if not self.alive:
+            raise OSError("gone")
+
+    def rollback(self):
+        if self.fail_rollback:
+            raise OSError("lost connection during rollback")
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def pool():
+    pool = ConnectionPool("test", {}, size=2, recycle=1800, timeout=2.0)
+    pool.opened = []
+
+    def _open():
+        conn = FakeConnection()
+        pool.opened.append(conn)
+        return conn, time.monotonic()
+
+    pool._open = _open
+    return pool
+
+
+def test_connections_are_opened_lazily_and_reused(pool):
+    first = pool.get_connection()
+    first.close()
+    second = pool.get_connection()
+    assert second._conn is pool.opened[0]
+    assert len(pool.opened) == 1
+    second.close()
+    second.close()  # a second close() is a no-op
+    assert pool.stats()["in_use"] == 0
+    assert pool.stats()["idle"] == 1
+
+
+def test_exhausted_pool_times_out(pool):
+    pool.timeout = 0.05
+    held = [pool.get_connection(), pool.get_connection()]
+    with pytest.raises(PoolExhausted):
+        pool.get_connection()
+    assert pool.stats()["timeouts"] == 1
+    for conn in held:
+        conn.close()
+
+
+def test_open_transaction_is_rolled_back_on_release(pool):
+    conn = pool.get_connection()
+    conn._conn.in_transaction = True
+    conn.close()
+    assert pool.get_connection()._conn.in_transaction is False
+
+
+def test_dead_and_expired_connections_are_replaced(pool):
+    conn = pool.get_connection()
+    conn.close()
+    pool.opened[0].alive = False
+    replacement = pool.get_connection()
+    assert replacement._conn is pool.opened[1]
+    assert pool.opened[0].closed
+    replacement.close()
+
+    pool.recycle = 0.01
+    time.sleep(0.02)
+    recycled = pool.get_connection()
+    assert recycled._conn is pool.opened[2]
+    stats = pool.stats()
+    assert (stats["failed_health_checks"], stats["recycled"], stats["open"]) == (1, 1, 1)
+
+
+def test_waiter_is_woken_when_a_connection_is_dropped(pool):
+    held = [pool.get_connection(), pool.get_connection()]
+    got = {}
+
+    def wait():
+        started = time.monotonic()
+        got["conn"] = pool.get_connection()
+        got["waited"] = time.monotonic() - started
+
+    waiter = threading.Thread(target=wait)
+    waiter.start()
+    time.sleep(0.1)
+    # Release fails: the connection is thrown away instead of returned
+    held[0]._conn.fail_rollback = True
+    held[0]._conn.in_transaction = True
+    held[0].close()
+    waiter.join(1.0)
+
+    assert not waiter.is_alive()
+    assert got["waited"] < pool.timeout
+    assert got["conn"]._conn is pool.opened[2]
+    assert pool.stats()["idle"] == 0
+    assert pool.stats()["open"] == 2
+    held[1].close()
+    got["conn"].close()
+    pool.close_all()
+    assert pool.stats()["idle"] == 0
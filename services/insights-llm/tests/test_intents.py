@@ -0,0 +1,144 @@
+import asyncio
+from datetime import date
+import pytest
+from intents import IntentRouter
+
+
+class StubDB:
+    """Records the aggregate queries the router asks for"""
+
+    def __init__(self):
+        self.calls = []
+        self.label_loads = 0
+
+    async def run(self, fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    def fetch_user_labels(self, user_id):
+        self.label_loads += 1
+        return {"categories": ["Groceries", "Eating Out", "Uncategorized"], "merchants": ["Highlands Coffee", "Grab"]}
+
+    def aggregate_transactions(self, user_id, start, end, tx_type=None, category=None, merchant=None, group_by=None, limit=None):
+        self.calls.append({"tx_type": tx_type, "category": category, "merchant": merchant, "group_by": group_by})
+        if group_by:
+            return [{"label": "Groceries", "total": 500000, "count": 4}]
+        return [{"type": tx_type or "EXPENSE", "total": 1250000, "count": 3}]
+
+    def fetch_largest_transactions(self, user_id, start, end, category=None, merchant=None, limit=1):
+        return [{"amount": 900000, "merchant_name": "Grab", "category_name": "Transport", "occurred_at": "2026-06-01 08:00:00"}]
+
+
+@pytest.mark.parametrize("query, intent", [
+    ("How much did I spend this month?", "spend_total"),
+    ("How much did I earn last month", "income_total"),
+    ("How much did I save?", "net_total"),
+    ("How many transactions did I make this week?", "transaction_count"),
+    ("What's my biggest expense?", "largest_expense"),
+    ("What are my top categories", "top_categories"),
+    ("Where did I spend the most?", "top_merchants"),
+])
+def test_classify(query, intent):
+    assert IntentRouter(StubDB()).classify(query) == intent
+
+
+@pytest.mark.parametrize("query", [
+    "How can I reduce my spending?",
+    "Should I cut back on eating out?",
+    "Why did I spend so much this month?",
+    "Tell me a joke",
+    "how much did i spend " + "and " * 20,
+])
+def test_advice_and_unknown_questions_go_to_the_model(query):
+    assert IntentRouter(StubDB()).classify(query) is None
+
+
+def test_period_defaults_to_last_30_days():
+    start, end, label = IntentRouter._period("how much did i spend", date(2026, 6, 30))
+    assert (start, end, label) == (date(2026, 6, 1), date(2026, 6, 30), "in the last 30 days")
+    start, end, label = IntentRouter._period("how much did i spend last month", date(2026, 6, 30))
+    assert (start, end, label) == (date(2026, 5, 1), date(2026, 5, 31), "last month")
+
+
+def test_category_and_merchant_slots():
+    db = StubDB()
+    router = IntentRouter(db)
+    result = asyncio.run(router.answer(1, "How much did I spend on groceries this month?"))
+    assert result["intent"] == "spend_total"
+    assert db.calls[-1] == {"tx_type": "EXPENSE", "category": "Groceries", "merchant": None, "group_by": None}
+    assert "on Groceries" in result["answer"] and "1,250,000 VND" in result["answer"]
+
+    result = asyncio.run(router.answer(1, "How much did I spend at highlands coffee"))
+    assert db.calls[-1]["merchant"] == "Highlands Coffee"
+    assert "at Highlands Coffee in the last 30 days" in result["answer"]
+    # Names are loaded once per user
+    assert db.label_loads == 1
+
+
+def test_unknown_payee_goes_to_the_model():
+    db = StubDB()
+    router = IntentRouter(db)
+    assert asyncio.run(router.answer(1, "How much did I spend on coffee?")) is None
+    assert asyncio.run(router.answer(1, "How much did I spend at the airport last week")) is None
+    assert db.calls == []
+    assert router.stats()["unresolved"] == 2
+
+
+@pytest.mark.parametrize("query", [
+    "how much did I spend except rent",
+    "how much did I spend not counting rent",
+    "how much did I spend excluding groceries this month",
+    "how much did I spend without grab",
+    "how much did I spend in March",
+    "how much did I spend in the last 2 weeks",
+    "how much did I spend on 2026-05-01",
+    "how much did I spend on average per day",
+    "how much did I spend each week",
+    "how much did I spend in taxes this month",
+    "how much did I spend in Da Nang",
+    "how much did I spend with my card",
+    "what's my balance on my savings account",
+    "how many transactions over 500k last month",
+])
+def test_questions_with_unparsed_words_go_to_the_model(query):
+    db = StubDB()
+    router = IntentRouter(db)
+    assert router.classify(query) is not None
+    assert asyncio.run(router.answer(1, query)) is None
+    assert db.calls == []
+    assert router.stats()["unresolved"] == 1
+
+
+@pytest.mark.parametrize("query", [
+    "what's my balance",
+    "How much did I spend on groceries so far this month?",
+    "how much did I pay at Grab in the past 7 days",
+    "What are my top categories last month",
+    "how many times did I pay at grab",
+])
+def test_fully_understood_questions_take_the_fast_path(query):
+    assert asyncio.run(IntentRouter(StubDB()).answer(1, query)) is not None
+
+
+def test_words_that_are_not_payees_keep_the_fast_path():
+    db = StubDB()
+    router = IntentRouter(db)
+    assert asyncio.run(router.answer(1, "How much did I spend for the last 30 days?")) is not None
+    assert asyncio.run(router.answer(1, "How many transactions did I make on groceries")) is not None
+    assert router.stats()["unresolved"] == 0
+
+
+def test_invalidate_user_reloads_names():
+    db = StubDB()
+    router = IntentRouter(db)
+    asyncio.run(router.answer(1, "How much did I spend on groceries"))
+    router.invalidate_user(1)
+    asyncio.run(router.answer(1, "How much did I spend on groceries"))
+    assert db.label_loads == 2
+
+
+def test_query_failure_falls_back_to_the_model():
+    db = StubDB()
+    db.aggregate_transactions = lambda *args, **kwargs: 1 / 0
+    router = IntentRouter(db)
+    assert asyncio.run(router.answer(1, "What are my top categories")) is None
+    assert router.stats()["errors"] == 1
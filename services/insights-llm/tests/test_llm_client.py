@@ -0,0 +1,119 @@
+import pytest
+from llm_client import CircuitBreaker, TokenBucket
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("llm_client.time.monotonic", clock)
+    return clock
+
+
+def test_bucket_refills_up_to_capacity(clock):
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.try_acquire(60)
+    assert not bucket.try_acquire(1)
+    clock.now += 1
+    assert bucket.try_acquire(1)
+    assert not bucket.try_acquire(1)
+    clock.now += 600
+    bucket._refill()
+    assert bucket.tokens == 60
+
+
+def test_bucket_oversized_request_takes_the_whole_bucket(clock):
+    bucket = TokenBucket(per_minute=10)
+    assert bucket.try_acquire(50)
+    assert bucket.tokens == 0
+
+
+def test_bucket_adjust_corrects_the_estimate(clock):
+    bucket = TokenBucket(per_minute=100)
+    bucket.try_acquire(40)
+    bucket.adjust(30)
+    assert bucket.tokens == 30
+    bucket.adjust(-500)
+    assert bucket.tokens == 100
+
+
+def test_disabled_bucket_always_allows(clock):
+    bucket = TokenBucket(per_minute=0)
+    assert bucket.try_acquire(1000)
+
+
+def open_breaker(clock, threshold=3):
+    breaker = CircuitBreaker(failure_threshold=threshold, reset_timeout=30)
+    for _ in range(threshold):
+        assert breaker.allow()
+        breaker.failure()
+    return breaker
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    breaker.failure()
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    assert breaker.state == "closed"
+    breaker = open_breaker(clock)
+    assert breaker.state == "open"
+    assert breaker.opens == 1
+    assert not breaker.allow()
+
+
+def test_breaker_lets_one_probe_through_after_the_timeout(clock):
+    breaker = open_breaker(clock)
+    clock.now += 30
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens(clock):
+    breaker = open_breaker(clock)
+    clock.now += 30
+    breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open"
+    assert breaker.opens == 2
+    clock.now += 29
+    assert not breaker.allow()
+
+
+def test_released_probe_lets_the_next_call_probe(clock):
+    breaker = open_breaker(clock)
+    clock.now += 30
+    breaker.allow()
+    breaker.release()
+    assert breaker.state == "open"
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+
+
+def test_probe_that_never_reports_is_given_up_on(clock):
+    breaker = open_breaker(clock)
+    clock.now += 30
+    breaker.allow()
+    clock.now += 10
+    assert not breaker.allow()
+    clock.now += 20
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+
+
+def test_release_while_closed_changes_nothing(clock):
+    breaker = CircuitBreaker()
+    breaker.release()
+    assert breaker.state == "closed"
@@ -0,0 +1,33 @@
+import os
+import json
+import time
+import metrics
+
+
+def test_render_labels_every_worker(tmp_path):
+    shared = metrics.SharedMetrics(str(tmp_path))
+    metrics.LLM_CALLS.inc(endpoint="/chat")
+    other = str(os.getppid())
+    with open(tmp_path / f"{other}.json", "w") as f:
+        json.dump({"updated_at": time.time(), "metrics": {"insights_llm_calls_total": [[["/chat"], 5.0]]},
+                   "stats": {"answers": {"hits": 3}}}, f)
+
+    workers = shared.collect({"answers": {"hits": 1}})
+    assert set(workers) == {shared.worker, other}
+    text = metrics.render(workers)
+    assert f'insights_llm_calls_total{{endpoint="/chat",worker="{other}"}} 5.0' in text
+    assert f'insights_answers_hits{{worker="{other}"}} 3.0' in text
+    assert f'insights_answers_hits{{worker="{shared.worker}"}} 1.0' in text
+    assert text.count("# TYPE insights_answers_hits gauge") == 1
+
+
+def test_snapshots_of_gone_or_silent_workers_are_dropped(tmp_path):
+    shared = metrics.SharedMetrics(str(tmp_path), max_age=60)
+    for worker, age in (("999999999", 0), (str(os.getppid()), 120)):
+        with open(tmp_path / f"{worker}.json", "w") as f:
+            json.dump({"updated_at": time.time() - age, "metrics": {}, "stats": {}}, f)
+
+    assert set(shared.collect({})) == {shared.worker}
+    assert os.listdir(tmp_path) == [f"{shared.worker}.json"]
+    shared.remove()
+    assert os.listdir(tmp_path) == []
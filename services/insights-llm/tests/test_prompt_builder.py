@@ -0,0 +1,70 @@
+from prompt_builder import PromptAssembler, estimate_tokens, group_exchanges
+
+
+def exchange(log_id, question="How much did I spend?", answer="You spent 1,000 VND."):
+    return [{"id": log_id, "role": "user", "message": question}, {"id": log_id, "role": "model", "message": answer}]
+
+
+def history(n, **kwargs):
+    return [turn for i in range(1, n + 1) for turn in exchange(i, **kwargs)]
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens(None) == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("abcde") == 2
+
+
+def test_group_exchanges_pairs_question_and_answer():
+    turns = history(2) + [{"id": None, "role": "user", "message": "pending"}, {"id": None, "role": "model", "message": "buffered"}]
+    assert [len(e) for e in group_exchanges(turns)] == [2, 2, 2]
+    # An answer with another id does not belong to the question before it
+    assert [len(e) for e in group_exchanges([exchange(1)[0], exchange(2)[1]])] == [1, 1]
+
+
+def test_short_history_is_kept_verbatim():
+    result = PromptAssembler(budget_tokens=3000, max_verbatim=3).assemble("system", history(2))
+    assert result["history"] == history(2)
+    assert result["summary"] == ""
+    assert result["summary_update"] is None
+    assert result["metrics"]["turns_verbatim"] == 4
+
+
+def test_older_exchanges_are_folded_into_the_summary():
+    result = PromptAssembler(budget_tokens=3000, max_verbatim=2).assemble("system", history(5))
+    assert [t["id"] for t in result["history"]] == [4, 4, 5, 5]
+    assert result["summary_update"]["last_log_id"] == 3
+    assert result["summary"].count("- User asked: How much did I spend? | Advisor: You spent 1,000 VND.") == 3
+    assert result["metrics"]["exchanges_summarized"] == 3
+
+
+def test_only_exchanges_past_the_watermark_are_folded():
+    stored = {"summary": "- User asked: earlier", "last_log_id": 2}
+    result = PromptAssembler(budget_tokens=3000, max_verbatim=2).assemble("system", history(5), stored)
+    assert result["summary_update"]["last_log_id"] == 3
+    assert result["summary"].splitlines()[0] == "- User asked: earlier"
+    assert len(result["summary"].splitlines()) == 2
+
+    unchanged = PromptAssembler(budget_tokens=3000, max_verbatim=2).assemble("system", history(5), {"summary": "s", "last_log_id": 3})
+    assert unchanged["summary_update"] is None
+    assert unchanged["summary"] == "s"
+
+
+def test_budget_is_respected():
+    assembler = PromptAssembler(budget_tokens=200, max_verbatim=10, summary_tokens=60)
+    long_answer = "word " * 60
+    result = assembler.assemble("x" * 200, history(6, answer=long_answer))
+    assert result["metrics"]["prompt_tokens_est"] <= 200
+    assert result["metrics"]["summary_tokens"] <= 60
+    assert len(result["history"]) < 12
+    assert assembler.stats()["requests"] == 1
+
+
+def test_summary_lines_are_shortened():
+    result = PromptAssembler(budget_tokens=3000, max_verbatim=0).assemble(
+        "system", exchange(1, question="First sentence. Second sentence.", answer="a" * 500)
+    )
+    line = result["summary"]
+    assert "Second sentence" not in line
+    assert line.endswith("…")
@@ -0,0 +1,101 @@
+from datetime import date, timedelta
+from analytics import dashboard_analytics
+from recurring import add_period, detect_recurring, plan_changes
+
+TODAY = date(2026, 6, 20)
+
+
+def expense(day, amount, merchant_id=None, category_id=None):
+    return {"type": "EXPENSE", "occurred_at": day, "amount": amount, "merchant_id": merchant_id, "category_id": category_id}
+
+
+def test_add_period_clamps_month_end():
+    assert add_period(date(2026, 1, 31), "MONTHLY") == date(2026, 2, 28)
+    assert add_period(date(2026, 12, 15), "MONTHLY") == date(2027, 1, 15)
+    assert add_period(date(2028, 2, 29), "YEARLY") == date(2029, 2, 28)
+    assert add_period(date(2026, 6, 1), "WEEKLY") == date(2026, 6, 8)
+
+
+def test_monthly_subscription_is_detected():
+    rows = [expense(date(2026, m, 5), 199000, merchant_id=7, category_id=3) for m in range(1, 7)]
+    rules = detect_recurring(rows, TODAY)
+    assert rules == [{
+        "merchant_id": 7, "category_id": 3, "amount": 199000.0, "frequency": "MONTHLY",
+        "next_due_date": date(2026, 7, 5), "is_active": True, "occurrences": 6,
+    }]
+
+
+def test_weekly_series_without_merchant_is_keyed_by_category():
+    start = TODAY - timedelta(days=35)
+    rows = [expense(start + timedelta(days=7 * i), 50000, category_id=9) for i in range(5)]
+    rules = detect_recurring(rows, TODAY)
+    assert len(rules) == 1
+    assert rules[0]["merchant_id"] is None and rules[0]["category_id"] == 9
+    assert rules[0]["frequency"] == "WEEKLY"
+
+
+def test_same_day_payments_count_once():
+    rows = [expense(date(2026, m, 5), 100000, merchant_id=7) for m in range(1, 5)]
+    rows.append(expense(date(2026, 4, 5), 100000, merchant_id=7))
+    rules = detect_recurring(rows, TODAY)
+    assert rules[0]["occurrences"] == 4
+    assert rules[0]["amount"] == 100000.0
+
+
+def test_irregular_amounts_and_gaps_are_ignored():
+    varying = [expense(date(2026, m, 5), a, merchant_id=1) for m, a in zip(range(1, 6), (100, 900, 40, 700, 250))]
+    irregular = [expense(TODAY - timedelta(days=d), 100, merchant_id=2) for d in (3, 10, 50, 52, 120)]
+    assert detect_recurring(varying, TODAY) == []
+    assert detect_recurring(irregular, TODAY) == []
+
+
+def test_income_and_short_series_are_ignored():
+    rows = [dict(expense(date(2026, m, 5), 100, merchant_id=1), type="INCOME") for m in range(1, 7)]
+    rows += [expense(date(2026, m, 5), 100, merchant_id=2) for m in (4, 5)]
+    assert detect_recurring(rows, TODAY) == []
+
+
+def test_overdue_series_is_inactive():
+    rows = [expense(date(2025, m, 5), 100, merchant_id=1) for m in range(1, 7)]
+    rules = detect_recurring(rows, TODAY)
+    assert rules[0]["next_due_date"] == date(2025, 7, 5)
+    assert rules[0]["is_active"] is False
+
+
+def rule(user_id=1, merchant_id=7, category_id=3, **fields):
+    base = {"user_id": user_id, "merchant_id": merchant_id, "category_id": category_id, "amount": 100.0,
+            "frequency": "MONTHLY", "next_due_date": date(2026, 7, 5), "is_active": True}
+    base.update(fields)
+    return base
+
+
+def test_plan_changes_updates_only_what_changed():
+    existing = [rule(id=10), rule(id=11, merchant_id=8, amount=50.0)]
+    detected = [rule(), rule(merchant_id=8, amount=55.0)]
+    updates, inserts = plan_changes(detected, existing)
+    assert updates == [{**rule(merchant_id=8, amount=55.0), "id": 11}]
+    assert inserts == []
+
+
+def test_plan_changes_inserts_active_new_rules_only():
+    detected = [rule(merchant_id=None, category_id=4), rule(merchant_id=9, is_active=False)]
+    updates, inserts = plan_changes(detected, [])
+    assert updates == []
+    assert inserts == [detected[0]]
+
+
+def test_plan_changes_matches_first_existing_rule_and_deactivates():
+    existing = [rule(id=1, is_active=1), rule(id=2, is_active=1)]
+    updates, inserts = plan_changes([rule(is_active=False)], existing)
+    assert [u["id"] for u in updates] == [1]
+    assert updates[0]["is_active"] is False
+    assert inserts == []
+
+
+def test_dashboard_analytics_adds_upcoming_bills():
+    bills = [{"name": "Netflix", "amount": 260000, "next_due_date": date(2026, 7, 2), "frequency": "MONTHLY"}]
+    rows = [{"occurred_at": TODAY, "amount": 100, "type": "EXPENSE", "category_name": "Food", "merchant_name": "Mart"}]
+    analytics = dashboard_analytics(rows, bills)
+    assert analytics["upcoming_bills"] == bills
+    assert "forecast" in analytics
+    assert dashboard_analytics([])["upcoming_bills"] == []
@@ -0,0 +1,84 @@
+import os
+from datetime import date, timedelta
+import numpy as np
+import pytest
+from retrieval import RetrievalIndex, parse_period
+
+TODAY = date.today()
+
+
+def tx(tx_id, merchant, category, days_ago=1, amount=100):
+    return {"id": tx_id, "user_id": 1, "occurred_at": TODAY - timedelta(days=days_ago), "type": "EXPENSE",
+            "amount": amount, "merchant_name": merchant, "category_name": category, "description": None}
+
+
+class StubDB:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def iter_transactions(self, days, user_id=None):
+        return iter(self.rows)
+
+
+@pytest.fixture
+def index(tmp_path):
+    rows = [
+        tx(1, "Highlands Coffee", "Coffee"),
+        tx(2, "Grab", "Transport", days_ago=40),
+        tx(3, "Big C", "Groceries"),
+        tx(4, "Starbucks", "Coffee", days_ago=2),
+    ]
+    return RetrievalIndex(StubDB(rows), index_dir=str(tmp_path), compact_ratio=0.3)
+
+
+def merchants(results):
+    return [r["merchant_name"] for r in results]
+
+
+def test_parse_period():
+    today = date(2026, 3, 15)
+    assert parse_period("what did i spend last month", today) == (date(2026, 2, 1), date(2026, 2, 28))
+    assert parse_period("past 7 days", today) == (date(2026, 3, 9), today)
+    assert parse_period("coffee", today) is None
+
+
+def test_search_ranks_matching_rows_and_applies_the_period(index):
+    assert set(merchants(index.search(1, "coffee"))) == {"Highlands Coffee", "Starbucks"}
+    # Grab is outside the period; with nothing relevant left, the most recent rows in it come back
+    assert "Grab" not in merchants(index.search(1, "grab rides in the last 30 days"))
+    assert merchants(index.search(1, "grab rides"))[0] == "Grab"
+    assert index.stats()["builds"] == 1
+
+
+def test_updates_and_deletes_are_appended(index):
+    index.search(1, "coffee")
+    index.apply(1, 1, tx(1, "Phuc Long", "Tea"))
+    index.apply(1, 4, None)
+    assert merchants(index.search(1, "coffee")) == []
+    assert merchants(index.search(1, "phuc long tea")) == ["Phuc Long"]
+
+
+def test_compaction_swaps_in_new_files_and_keeps_old_readers_working(index):
+    vec_path, meta_path = index._paths(1)
+    before = index._load(1)
+    old_inode = os.stat(vec_path).st_ino
+    old_vectors = np.array(before.vectors)
+
+    index.apply(1, 2, None)
+    index.apply(1, 3, None)
+    after = index._load(1)
+
+    assert index.stats()["compactions"] == 1
+    assert os.stat(vec_path).st_ino != old_inode
+    assert after.dead == 0 and len(after.rows) == 2
+    with open(meta_path) as f:
+        assert len(f.readlines()) == 2
+    assert not os.path.exists(f"{vec_path}.tmp") and not os.path.exists(f"{meta_path}.tmp")
+    # A memmap opened before the swap still reads the old file
+    assert np.array_equal(np.array(before.vectors), old_vectors)
+    assert set(merchants(index.search(1, "coffee"))) == {"Highlands Coffee", "Starbucks"}
+
+
+def test_unbuilt_user_ignores_events(index):
+    index.apply(2, 9, tx(9, "Grab", "Transport"))
+    assert not os.path.exists(index._paths(2)[0])
@@ -0,0 +1,64 @@
+import asyncio
+import pytest
+from single_flight import SingleFlight, payload_fingerprint
+
+
+def test_payload_fingerprint_ignores_key_order():
+    assert payload_fingerprint({"a": 1, "b": [1, 2]}) == payload_fingerprint({"b": [1, 2], "a": 1})
+    assert payload_fingerprint({"a": 1}) != payload_fingerprint({"a": 2})
+
+
+def test_concurrent_identical_calls_share_one_upstream_call():
+    async def run():
+        flight = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.02)
+            return {"answer": 42}
+
+        results = await asyncio.gather(*(flight.do("k", fetch) for _ in range(5)), flight.do("other", fetch))
+        assert results == [{"answer": 42}] * 6
+        assert len(calls) == 2
+        assert flight.stats() == {"in_flight": 0, "upstream_calls": 2, "deduplicated": 4}
+
+        # Nothing is cached once the call completes
+        await flight.do("k", fetch)
+        assert len(calls) == 3
+    asyncio.run(run())
+
+
+def test_failure_reaches_every_waiter():
+    async def run():
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream error")
+
+        results = await asyncio.gather(flight.do("k", fail), flight.do("k", fail), return_exceptions=True)
+        assert [type(r) for r in results] == [ValueError, ValueError]
+        assert flight.stats()["in_flight"] == 0
+    asyncio.run(run())
+
+
+def test_cancelled_caller_does_not_cancel_the_call_for_the_others():
+    async def run():
+        flight = SingleFlight()
+        started = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(0.05)
+            return "done"
+
+        first = asyncio.create_task(flight.do("k", slow))
+        await started.wait()
+        second = asyncio.create_task(flight.do("k", slow))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert await second == "done"
+    asyncio.run(run())